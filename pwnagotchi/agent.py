@@ -2,20 +2,32 @@ import time
 import json
 import os
 import re
+import atexit
 import logging
+import threading
 import _thread
 
 import pwnagotchi
 import pwnagotchi.utils as utils
 import pwnagotchi.plugins as plugins
+import pwnagotchi.timing as timing
 from pwnagotchi.ui.web.server import Server
 from pwnagotchi.automata import Automata
-from pwnagotchi.log import LastSession
-from pwnagotchi.bettercap import Client
+from pwnagotchi.log import LastSession, SessionSummary, summary_path
+from pwnagotchi.bettercap import Client, SessionCache
+from pwnagotchi.mesh.wifi import AccessPointIndex
+from pwnagotchi.handshakes import HandshakeRegistry, HandshakeCatalog, bssid_from_filename
+from pwnagotchi.history import InteractionHistory
+from pwnagotchi.attacks import AttackScheduler
+from pwnagotchi.channels import ChannelScheduler
+from pwnagotchi.journal import Journal
+from pwnagotchi.sessions import SessionIndex
+from pwnagotchi.whitelist import Whitelist
 from pwnagotchi.mesh.utils import AsyncAdvertiser
 from pwnagotchi.ai.train import AsyncTrainer
 
 RECOVERY_DATA_FILE = '/root/.pwnagotchi-recovery'
+RECOVERY_JOURNAL_FILE = '/root/.pwnagotchi-journal'
 
 
 class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
@@ -24,13 +36,20 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
                         config['bettercap']['scheme'],
                         config['bettercap']['port'],
                         config['bettercap']['username'],
-                        config['bettercap']['password'])
+                        config['bettercap']['password'],
+                        config['bettercap']['connect_timeout'],
+                        config['bettercap']['read_timeout'],
+                        config['bettercap']['max_retries'],
+                        config['bettercap']['backoff'],
+                        config['bettercap']['pool_size'])
         Automata.__init__(self, config, view)
+        # every consumer of the bettercap session shares the same recent snapshot
+        self._session_cache = SessionCache(lambda: Client.session(self), config['bettercap']['session_ttl'])
         AsyncAdvertiser.__init__(self, config, view, keypair)
         AsyncTrainer.__init__(self, config)
 
         self._started_at = time.time()
-        self._filter = None if not config['main']['filter'] else re.compile(config['main']['filter'])
+        self._whitelist = Whitelist(config['main']['whitelist'], config['main']['filter'])
         self._current_channel = 0
         self._tot_aps = 0
         self._aps_on_channel = 0
@@ -40,15 +59,51 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         self._web_ui = Server(self, config['ui'])
 
         self._access_points = []
+        self._aps_index = AccessPointIndex([])
         self._last_pwnd = None
-        self._history = {}
+        self._history = InteractionHistory(config['main']['history']['size'],
+                                           config['main']['history']['ttl'],
+                                           config['main']['history']['decay'])
         self._handshakes = {}
+        self._handshakes_lock = threading.Lock()
+        # every access point and station we already have an handshake for, this session or before
+        self._handshake_registry = HandshakeRegistry()
+        self._attacks = AttackScheduler(config['main']['attacks']['workers'],
+                                        config['main']['attacks']['rate'],
+                                        config['main']['attacks']['burst'])
+        self._channel_scheduler = None
+        if config['main']['channel_scheduler']['enabled']:
+            self._channel_scheduler = ChannelScheduler(config['main']['channel_scheduler']['exploration'],
+                                                       config['main']['channel_scheduler']['decay'],
+                                                       config['main']['channel_scheduler']['min_dwell_factor'],
+                                                       config['main']['channel_scheduler']['max_dwell_factor'])
+        self._journal = Journal(RECOVERY_JOURNAL_FILE, self._recovery_snapshot,
+                                config['main']['recovery']['sync_interval'],
+                                config['main']['recovery']['compact_every'])
+        self._rebooting = False
+        self._event_handlers = {
+            'wifi.client.handshake': self._on_handshake
+        }
+        # event tag -> plugin event name
+        self._plugin_events = {}
         self.last_session = LastSession(self._config)
+        # what LastSession will load next time, without parsing the log
+        self._session_summary = SessionSummary(summary_path(config['main']['log']['path']),
+                                               config['main']['log']['summary_interval'])
+        # every session in the rotated logs, indexed in background, the first time it might take a while
+        self._session_index = SessionIndex(config['main']['log']['path'])
+        self._session_index.start(config['main']['log']['index_interval'])
         self.mode = 'auto'
 
         if not os.path.exists(config['bettercap']['handshakes']):
             os.makedirs(config['bettercap']['handshakes'])
 
+        self._handshake_catalog = HandshakeCatalog(config['bettercap']['handshakes'],
+                                                   config['bettercap']['handshakes_poll_interval'])
+        self._handshake_catalog.subscribe(self._on_handshake_file)
+        self._handshake_catalog.start()
+        self._handshake_registry.seed(self._handshake_catalog.files())
+
         logging.info("%s@%s (v%s)", pwnagotchi.name(), self.fingerprint(), pwnagotchi.__version__)
         for _, plugin in plugins.loaded.items():
             logging.debug("plugin '%s' v%s", plugin.__class__.__name__, plugin.__version__)
@@ -62,23 +117,48 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
     def supported_channels(self):
         return self._supported_channels
 
+    def session(self, max_age=None):
+        return self._session_cache.get(max_age)
+
+    def session_cache(self):
+        return self._session_cache
+
+    def handshake_catalog(self):
+        return self._handshake_catalog
+
+    def num_handshakes(self):
+        return len(self._handshakes)
+
+    def session_index(self):
+        return self._session_index
+
+    def reload_whitelist(self, config):
+        self._config['main']['whitelist'] = config['main']['whitelist']
+        self._config['main']['filter'] = config['main']['filter']
+        self._whitelist.reload(config['main']['whitelist'], config['main']['filter'])
+        logging.info("reloaded whitelist (%d entries) and filter '%s'", len(config['main']['whitelist']),
+                     config['main']['filter'])
+
+    def channel_scheduler(self):
+        return self._channel_scheduler
+
     def setup_events(self):
         logging.info("connecting to %s ...", self.url)
 
+        batch = self.batch(verbose_errors=False)
         for tag in self._config['bettercap']['silence']:
-            try:
-                self.run('events.ignore %s' % tag, verbose_errors=False)
-            except Exception as e:
-                pass
+            batch.add('events.ignore %s' % tag)
+        batch.send()
 
     def _reset_wifi_settings(self):
         mon_iface = self._config['main']['iface']
-        self.run('set wifi.interface %s' % mon_iface)
-        self.run('set wifi.ap.ttl %d' % self._config['personality']['ap_ttl'])
-        self.run('set wifi.sta.ttl %d' % self._config['personality']['sta_ttl'])
-        self.run('set wifi.rssi.min %d' % self._config['personality']['min_rssi'])
-        self.run('set wifi.handshakes.file %s' % self._config['bettercap']['handshakes'])
-        self.run('set wifi.handshakes.aggregate false')
+        with self.batch() as batch:
+            batch.add('set wifi.interface %s' % mon_iface)
+            batch.add('set wifi.ap.ttl %d' % self._config['personality']['ap_ttl'])
+            batch.add('set wifi.sta.ttl %d' % self._config['personality']['sta_ttl'])
+            batch.add('set wifi.rssi.min %d' % self._config['personality']['min_rssi'])
+            batch.add('set wifi.handshakes.file %s' % self._config['bettercap']['handshakes'])
+            batch.add('set wifi.handshakes.aggregate false')
 
     def start_monitor_mode(self):
         mon_iface = self._config['main']['iface']
@@ -87,17 +167,15 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         has_mon = False
 
         while has_mon is False:
-            s = self.session()
-            for iface in s['interfaces']:
-                if iface['name'] == mon_iface:
-                    logging.info("found monitor interface: %s", iface['name'])
-                    has_mon = True
-                    break
+            if mon_iface in self._session_cache.interfaces():
+                logging.info("found monitor interface: %s", mon_iface)
+                has_mon = True
 
             if has_mon is False:
                 if mon_start_cmd is not None and mon_start_cmd != '':
                     logging.info("starting monitor interface ...")
                     self.run('!%s' % mon_start_cmd)
+                    self._session_cache.invalidate()
                 else:
                     logging.info("waiting for monitor interface %s ...", mon_iface)
                     time.sleep(1)
@@ -110,8 +188,9 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         wifi_running = self.is_module_running('wifi')
         if wifi_running and restart:
             logging.debug("restarting wifi module ...")
-            self.restart_module('wifi.recon')
-            self.run('wifi.clear')
+            with self.batch() as batch:
+                self.restart_module('wifi.recon', batch)
+                batch.add('wifi.clear')
         elif not wifi_running:
             logging.debug("starting wifi module ...")
             self.start_module('wifi.recon')
@@ -131,8 +210,10 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         self.start_ai()
         self._wait_bettercap()
         self.setup_events()
+        self._session_summary.start()
         self.set_starting()
         self.start_monitor_mode()
+        self._load_recovery_data()
         self.start_event_polling()
         # print initial stats
         self.next_epoch()
@@ -148,45 +229,40 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
             recon_time *= recon_mul
 
         self._view.set('channel', '*')
-
-        if not channels:
-            self._current_channel = 0
-            logging.debug("RECON %ds", recon_time)
-            self.run('wifi.recon.channel clear')
-        else:
-            logging.debug("RECON %ds ON CHANNELS %s", recon_time, ','.join(map(str, channels)))
-            try:
-                self.run('wifi.recon.channel %s' % ','.join(map(str, channels)))
-            except Exception as e:
-                logging.exception("error")
+        if self._channel_scheduler is not None:
+            self._channel_scheduler.on_channel(0)
+
+        with timing.timer(timing.PHASE, 'recon'):
+            if not channels:
+                self._current_channel = 0
+                logging.debug("RECON %ds", recon_time)
+                self.run('wifi.recon.channel clear')
+            else:
+                logging.debug("RECON %ds ON CHANNELS %s", recon_time, ','.join(map(str, channels)))
+                try:
+                    self.run('wifi.recon.channel %s' % ','.join(map(str, channels)))
+                except Exception as e:
+                    logging.exception("error")
 
         self.wait_for(recon_time, sleeping=False)
 
-    def _filter_included(self, ap):
-        return self._filter is None or \
-               self._filter.match(ap['hostname']) is not None or \
-               self._filter.match(ap['mac']) is not None
-
     def set_access_points(self, aps):
         self._access_points = aps
+        self._aps_index = AccessPointIndex(aps)
         plugins.on('wifi_update', self, aps)
         self._epoch.observe(aps, list(self._peers.values()))
         return self._access_points
 
     def get_access_points(self):
-        whitelist = self._config['main']['whitelist']
         aps = []
         try:
-            s = self.session()
-            plugins.on("unfiltered_ap_list", self, s['wifi']['aps'])
-            for ap in s['wifi']['aps']:
+            unfiltered = self._session_cache.aps()
+            plugins.on("unfiltered_ap_list", self, unfiltered)
+            for ap in unfiltered:
                 if ap['encryption'] == '' or ap['encryption'] == 'OPEN':
                     continue
-                elif ap['hostname'] not in whitelist \
-                        and ap['mac'].lower() not in whitelist \
-                        and ap['mac'][:8].lower() not in whitelist:
-                    if self._filter_included(ap):
-                        aps.append(ap)
+                elif self._whitelist.allowed(ap):
+                    aps.append(ap)
         except Exception as e:
             logging.exception("error")
 
@@ -203,34 +279,23 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         return self._current_channel
 
     def get_access_points_by_channel(self):
-        aps = self.get_access_points()
-        channels = self._config['personality']['channels']
-        grouped = {}
-
-        # group by channel
-        for ap in aps:
-            ch = ap['channel']
-            # if we're sticking to a channel, skip anything
-            # which is not on that channel
-            if channels and ch not in channels:
-                continue
-
-            if ch not in grouped:
-                grouped[ch] = [ap]
-            else:
-                grouped[ch].append(ap)
+        with timing.timer(timing.PHASE, 'access_points'):
+            return self._get_access_points_by_channel()
 
-        # sort by more populated channels
-        return sorted(grouped.items(), key=lambda kv: len(kv[1]), reverse=True)
-
-    def _find_ap_sta_in(self, station_mac, ap_mac, session):
-        for ap in session['wifi']['aps']:
-            if ap['mac'] == ap_mac:
-                for sta in ap['clients']:
-                    if sta['mac'] == station_mac:
-                        return (ap, sta)
-                return (ap, {'mac': station_mac, 'vendor': ''})
-        return None
+    def _get_access_points_by_channel(self):
+        self.get_access_points()
+        channels = self._config['personality']['channels']
+        # if we're sticking to a channel, skip anything
+        # which is not on that channel
+        grouped = [(ch, aps) for ch, aps in self._aps_index.by_channel.items() if not channels or ch in channels]
+        if self._channel_scheduler is None:
+            # sort by more populated channels
+            return sorted(grouped, key=lambda kv: len(kv[1]), reverse=True)
+
+        # sort by expected captures
+        grouped = self._channel_scheduler.plan(grouped)
+        plugins.on('channel_schedule', self, self._channel_scheduler.state())
+        return grouped
 
     def _update_uptime(self, s):
         secs = pwnagotchi.uptime()
@@ -238,15 +303,15 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         # self._view.set('epoch', '%04d' % self._epoch.epoch)
 
     def _update_counters(self):
-        self._tot_aps = len(self._access_points)
-        tot_stas = sum(len(ap['clients']) for ap in self._access_points)
+        index = self._aps_index
+        self._tot_aps = index.tot_aps
+        tot_stas = index.tot_stations
         if self._current_channel == 0:
             self._view.set('aps', '%d' % self._tot_aps)
             self._view.set('sta', '%d' % tot_stas)
         else:
-            self._aps_on_channel = len([ap for ap in self._access_points if ap['channel'] == self._current_channel])
-            stas_on_channel = sum(
-                [len(ap['clients']) for ap in self._access_points if ap['channel'] == self._current_channel])
+            self._aps_on_channel = index.aps_on_channel(self._current_channel)
+            stas_on_channel = index.stations_on_channel(self._current_channel)
             self._view.set('aps', '%d (%d)' % (self._aps_on_channel, self._tot_aps))
             self._view.set('sta', '%d (%d)' % (stas_on_channel, tot_stas))
 
@@ -254,7 +319,7 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         if new_shakes > 0:
             self._epoch.track(handshake=True, inc=new_shakes)
 
-        tot = utils.total_unique_handshakes(self._config['bettercap']['handshakes'])
+        tot = self._handshake_catalog.total
         txt = '%d (%d)' % (len(self._handshakes), tot)
 
         if self._last_pwnd is not None:
@@ -269,50 +334,171 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
         self._view.set_closest_peer(self._closest_peer, len(self._peers))
 
     def _reboot(self):
+        # keep the journal, the next session will pick up from here
+        self._rebooting = True
         self.set_rebooting()
         self._save_recovery_data()
         pwnagotchi.reboot()
 
     def _save_recovery_data(self):
-        logging.warning("writing recovery data to %s ...", RECOVERY_DATA_FILE)
-        with open(RECOVERY_DATA_FILE, 'w') as fp:
-            data = {
-                'started_at': self._started_at,
-                'epoch': self._epoch.epoch,
-                'history': self._history,
-                'handshakes': self._handshakes,
-                'last_pwnd': self._last_pwnd
-            }
-            json.dump(data, fp)
+        logging.warning("syncing recovery journal %s ...", RECOVERY_JOURNAL_FILE)
+        self._journal.sync()
+
+    def _recovery_snapshot(self):
+        return {
+            'started_at': self._started_at,
+            'epoch': self._epoch.epoch,
+            'history': self._history.data(),
+            'handshakes': self._handshakes_snapshot(),
+            'last_pwnd': self._last_pwnd
+        }
+
+    def _handshakes_snapshot(self):
+        with self._handshakes_lock:
+            return dict(self._handshakes)
+
+    def _restore(self, data):
+        self._started_at = data['started_at']
+        self._epoch.epoch = data['epoch']
+        with self._handshakes_lock:
+            self._handshakes = data['handshakes']
+        for h in data['handshakes'].values():
+            self._handshake_registry.add(h['data']['ap'], h['data']['station'])
+        self._history.load(data['history'])
+        self._last_pwnd = data['last_pwnd']
 
     def _load_recovery_data(self, delete=True, no_exceptions=True):
         try:
-            with open(RECOVERY_DATA_FILE, 'rt') as fp:
-                data = json.load(fp)
-                logging.info("found recovery data: %s", data)
-                self._started_at = data['started_at']
-                self._epoch.epoch = data['epoch']
-                self._handshakes = data['handshakes']
-                self._history = data['history']
-                self._last_pwnd = data['last_pwnd']
-
-                if delete:
-                    logging.info("deleting %s", RECOVERY_DATA_FILE)
-                    os.unlink(RECOVERY_DATA_FILE)
+            # written by older versions right before rebooting
+            if os.path.exists(RECOVERY_DATA_FILE):
+                with open(RECOVERY_DATA_FILE, 'rt') as fp:
+                    data = json.load(fp)
+                    logging.info("found recovery data: %s", data)
+                    self._restore(data)
+
+                    if delete:
+                        logging.info("deleting %s", RECOVERY_DATA_FILE)
+                        os.unlink(RECOVERY_DATA_FILE)
+
+            records = self._journal.replay(self._config['main']['recovery']['max_age'])
+            if records:
+                logging.info("replaying %d records from %s ...", len(records), RECOVERY_JOURNAL_FILE)
+
+            for record in records:
+                kind = record['t']
+                if kind == Journal.SNAPSHOT:
+                    self._restore(record)
+                elif kind == 'handshake':
+                    h = record['h']
+                    with self._handshakes_lock:
+                        self._handshakes[record['key']] = h
+                    self._handshake_registry.add(h['data']['ap'], h['data']['station'])
+                    self._last_pwnd = record['last_pwnd']
+                elif kind == 'interaction':
+                    self._history.restore(record['mac'], record['n'], record['at'])
+                elif kind == 'epoch':
+                    self._epoch.epoch = record['epoch']
         except:
             if not no_exceptions:
                 raise
+        finally:
+            # start a new journal with whatever has been recovered
+            self._journal.open()
+            atexit.register(self._close_journal)
+
+    def _close_journal(self):
+        # a normal exit starts a new session next time
+        self._journal.close(clean=not self._rebooting)
+
+    def _on_handshake(self, h):
+        filename = h['data']['file']
+        sta_mac = h['data']['station']
+        ap_mac = h['data']['ap']
+        key = "%s -> %s" % (sta_mac, ap_mac)
+
+        with self._handshakes_lock:
+            if key in self._handshakes:
+                return
+            self._handshakes[key] = h
 
-    def _event_poller(self):
-        self._load_recovery_data()
+        self._handshake_registry.add(ap_mac, sta_mac)
+        try:
+            ap_and_station = self._session_cache.index().find(sta_mac, ap_mac)
+        except Exception as e:
+            logging.debug("error while fetching session: %s", e)
+            ap_and_station = None
 
+        if ap_and_station is None:
+            logging.warning("!!! captured new handshake: %s !!!", key)
+            self._last_pwnd = ap_mac
+            plugins.on('handshake', self, filename, ap_mac, sta_mac)
+        else:
+            (ap, sta) = ap_and_station
+            self._last_pwnd = ap['hostname'] if ap['hostname'] != '' and ap[
+                'hostname'] != '<hidden>' else ap_mac
+            logging.warning(
+                "!!! captured new handshake on channel %d, %d dBm: %s (%s) -> %s [%s (%s)] !!!",
+                    ap['channel'],
+                    ap['rssi'],
+                    sta['mac'], sta['vendor'],
+                    ap['hostname'], ap['mac'], ap['vendor'])
+            plugins.on('handshake', self, filename, ap, sta)
+
+        if self._channel_scheduler is not None:
+            self._channel_scheduler.on_handshake(ap['channel'] if ap_and_station is not None else None)
+
+        self._journal.append({'t': 'handshake', 'key': key, 'h': h, 'last_pwnd': self._last_pwnd})
+
+        self._update_handshakes(1)
+
+    def next_epoch(self):
+        Automata.next_epoch(self)
+        self._journal.append({'t': 'epoch', 'epoch': self._epoch.epoch})
+        self._session_summary.on_epoch(self._epoch.data())
+
+    def _on_miss(self, who):
+        Automata._on_miss(self, who)
+        if self._channel_scheduler is not None:
+            self._channel_scheduler.on_miss()
+
+    def _on_new_peer(self, peer):
+        AsyncAdvertiser._on_new_peer(self, peer)
+        self._session_summary.on_peer(peer)
+
+    def _on_ai_epoch(self, training):
+        AsyncTrainer._on_ai_epoch(self, training)
+        if training:
+            self._session_summary.on_training_epoch()
+
+    def _on_handshake_file(self, change, filename):
+        if change != HandshakeCatalog.DELETED:
+            bssid = bssid_from_filename(filename)
+            if bssid is not None:
+                self._handshake_registry.add(bssid)
+        plugins.on('handshake_file', self, change, filename)
+
+    def _on_event(self, event):
+        tag = event['tag']
+        if tag in self._event_handlers:
+            self._event_handlers[tag](event)
+
+        name = self._plugin_events.get(tag)
+        if name is None:
+            name = self._plugin_events[tag] = 'bcap_%s' % re.sub(r'[^a-z0-9_]+', '_', tag.lower())
+        # most events, like the frequent wifi ones, have no plugin waiting for them
+        if plugins.implemented(name):
+            plugins.on(name, self, event)
+
+    def _event_poller(self):
         self.run('events.clear')
 
+        _thread.start_new_thread(self.stream_events, (self._on_event,
+                                                      self._config['bettercap']['events_stream'],
+                                                      self._config['bettercap']['events_poll_interval']))
+
         while True:
             time.sleep(1)
 
-            new_shakes = 0
-
             logging.debug("polling events ...")
 
             try:
@@ -323,114 +509,146 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
                 self._update_peers()
                 self._update_counters()
 
-                for h in [e for e in self.events() if e['tag'] == 'wifi.client.handshake']:
-                    filename = h['data']['file']
-                    sta_mac = h['data']['station']
-                    ap_mac = h['data']['ap']
-                    key = "%s -> %s" % (sta_mac, ap_mac)
-
-                    if key not in self._handshakes:
-                        self._handshakes[key] = h
-                        new_shakes += 1
-                        ap_and_station = self._find_ap_sta_in(sta_mac, ap_mac, s)
-                        if ap_and_station is None:
-                            logging.warning("!!! captured new handshake: %s !!!", key)
-                            self._last_pwnd = ap_mac
-                            plugins.on('handshake', self, filename, ap_mac, sta_mac)
-                        else:
-                            (ap, sta) = ap_and_station
-                            self._last_pwnd = ap['hostname'] if ap['hostname'] != '' and ap[
-                                'hostname'] != '<hidden>' else ap_mac
-                            logging.warning(
-                                "!!! captured new handshake on channel %d, %d dBm: %s (%s) -> %s [%s (%s)] !!!",
-                                    ap['channel'],
-                                    ap['rssi'],
-                                    sta['mac'], sta['vendor'],
-                                    ap['hostname'], ap['mac'], ap['vendor'])
-                            plugins.on('handshake', self, filename, ap, sta)
-
             except Exception as e:
                 logging.error("error: %s", e)
 
             finally:
-                self._update_handshakes(new_shakes)
+                self._update_handshakes()
 
     def start_event_polling(self):
         _thread.start_new_thread(self._event_poller, ())
 
     def is_module_running(self, module):
-        s = self.session()
-        for m in s['modules']:
-            if m['name'] == module:
-                return m['running']
-        return False
+        m = self._session_cache.modules().get(module)
+        return m['running'] if m is not None else False
 
     def start_module(self, module):
         self.run('%s on' % module)
+        self._session_cache.invalidate()
 
-    def restart_module(self, module):
-        self.run('%s off; %s on' % (module, module))
+    def restart_module(self, module, batch=None):
+        if batch is None:
+            with self.batch() as batch:
+                self.restart_module(module, batch)
+        else:
+            batch.add('%s off' % module)
+            batch.add('%s on' % module)
+        self._session_cache.invalidate()
 
     def _has_handshake(self, bssid):
-        for key in self._handshakes:
-            if bssid.lower() in key:
-                return True
-        return False
+        return self._handshake_registry.has(bssid)
 
     def _should_interact(self, who):
         if self._has_handshake(who):
             return False
 
-        elif who not in self._history:
-            self._history[who] = 1
+        interactions = self._history.track(who)
+        self._journal.append({'t': 'interaction', 'mac': who, 'n': interactions, 'at': time.time()})
+        if interactions == 1:
             return True
 
-        else:
-            self._history[who] += 1
+        return interactions < self._config['personality']['max_interactions']
 
-        return self._history[who] < self._config['personality']['max_interactions']
-
-    def associate(self, ap, throttle=0):
+    def _can_associate(self, ap):
         if self.is_stale():
             logging.debug("recon is stale, skipping assoc(%s)", ap['mac'])
-            return
+            return False
+        return self._config['personality']['associate'] and self._should_interact(ap['mac'])
 
-        if self._config['personality']['associate'] and self._should_interact(ap['mac']):
-            self._view.on_assoc(ap)
+    def _can_deauth(self, sta):
+        if self.is_stale():
+            logging.debug("recon is stale, skipping deauth(%s)", sta['mac'])
+            return False
+        return self._config['personality']['deauth'] and self._should_interact(sta['mac'])
 
-            try:
+    def _send_attack(self, command):
+        # on the attack workers, recon can go stale while the previous results are handled
+        if self.is_stale():
+            return False
+        self._attacks.throttle()
+        self.run(command)
+        return True
+
+    def _attack(self, targets, throttle=0):
+        """
+        Associates with the (ap, None) targets and deauths the (ap, station) ones. Only the bettercap commands
+        run on the attack workers: the ones for different access points in parallel, the ones for the same
+        access point in order. The checks and the ui, plugins and state updates happen on the calling thread,
+        target by target, in order.
+        """
+        groups = {}
+        for ap, sta in targets:
+            if sta is None:
+                if self._can_associate(ap):
+                    command = ('assoc', ap['mac'], 'wifi.assoc %s' % ap['mac'])
+                else:
+                    continue
+            elif self._can_deauth(sta):
+                command = ('deauth', sta['mac'], 'wifi.deauth %s' % sta['mac'])
+            else:
+                continue
+            groups.setdefault(ap['mac'], []).append(((ap, sta), command))
+
+        if not groups:
+            return []
+
+        groups = list(groups.values())
+        results = self._attacks.run(self._send_attack, [[command for _, command in group] for group in groups])
+        timings = []
+        for (ap, sta), result in zip([target for group in groups for target, _ in group], results):
+            if not result['sent']:
+                logging.debug("recon is stale, skipping %s(%s)", result['kind'], result['target'])
+                continue
+
+            if sta is None:
+                self._view.on_assoc(ap)
                 logging.info("sending association frame to %s (%s %s) on channel %d [%d clients], %d dBm...",
                     ap['hostname'], ap['mac'], ap['vendor'], ap['channel'], len(ap['clients']), ap['rssi'])
-                self.run('wifi.assoc %s' % ap['mac'])
+            else:
+                self._view.on_deauth(sta)
+                logging.info("deauthing %s (%s) from %s (%s %s) on channel %d, %d dBm ...",
+                    sta['mac'], sta['vendor'], ap['hostname'], ap['mac'], ap['vendor'], ap['channel'], ap['rssi'])
+
+            if result['error'] is not None:
+                self._on_error(result['target'], result['error'])
+            elif sta is None:
                 self._epoch.track(assoc=True)
-            except Exception as e:
-                self._on_error(ap['mac'], e)
+            else:
+                self._epoch.track(deauth=True)
 
-            plugins.on('association', self, ap)
+            if sta is None:
+                plugins.on('association', self, ap)
+            else:
+                plugins.on('deauthentication', self, ap, sta)
             if throttle > 0:
                 time.sleep(throttle)
             self._view.on_normal()
+            timings.append(result)
 
-    def deauth(self, ap, sta, throttle=0):
-        if self.is_stale():
-            logging.debug("recon is stale, skipping deauth(%s)", sta['mac'])
-            return
+        return timings
 
-        if self._config['personality']['deauth'] and self._should_interact(sta['mac']):
-            self._view.on_deauth(sta)
+    def associate(self, ap, throttle=0):
+        self._attack([(ap, None)], throttle)
 
-            try:
-                logging.info("deauthing %s (%s) from %s (%s %s) on channel %d, %d dBm ...",
-                    sta['mac'], sta['vendor'], ap['hostname'], ap['mac'], ap['vendor'], ap['channel'], ap['rssi'])
-                self.run('wifi.deauth %s' % sta['mac'])
-                self._epoch.track(deauth=True)
-            except Exception as e:
-                self._on_error(sta['mac'], e)
+    def deauth(self, ap, sta, throttle=0):
+        self._attack([(ap, sta)], throttle)
 
-            plugins.on('deauthentication', self, ap, sta)
-            if throttle > 0:
-                time.sleep(throttle)
-            self._view.on_normal()
+    def attack(self, aps):
+        targets = []
+        for ap in aps:
+            # send an association frame in order to get for a PMKID
+            targets.append((ap, None))
+            # deauth all client stations in order to get a full handshake
+            targets += [(ap, sta) for sta in ap['clients']]
+
+        started = time.monotonic()
+        with timing.timer(timing.PHASE, 'attack'):
+            timings = self._attack(targets)
+        if timings:
+            slowest = max(timings, key=lambda t: t['secs'])
+            logging.debug("%d targets processed in %.2fs, slowest was %s %s (%.2fs)", len(timings),
+                          time.monotonic() - started, slowest['kind'], slowest['target'], slowest['secs'])
+        return timings
 
     def set_channel(self, channel, verbose=True):
         if self.is_stale():
@@ -448,6 +666,10 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
             wait = self._config['personality']['min_recon_time']
 
         if channel != self._current_channel:
+            if self._channel_scheduler is not None and self._current_channel != 0:
+                # stay longer on channels that are worth it
+                wait = self._channel_scheduler.dwell(self._current_channel, wait)
+
             if self._current_channel != 0 and wait > 0:
                 if verbose:
                     logging.info("waiting for %ds on channel %d ...", wait, self._current_channel)
@@ -457,9 +679,13 @@ class Agent(Client, Automata, AsyncAdvertiser, AsyncTrainer):
             if verbose and self._epoch.any_activity:
                 logging.info("CHANNEL %d", channel)
             try:
-                self.run('wifi.recon.channel %d' % channel)
+                with timing.timer(timing.PHASE, 'hop'):
+                    self.run('wifi.recon.channel %d' % channel)
                 self._current_channel = channel
                 self._epoch.track(hop=True)
+                if self._channel_scheduler is not None:
+                    self._channel_scheduler.on_channel(channel, (sta['mac'] for ap in self._aps_index.by_channel.get(
+                        channel, ()) for sta in ap['clients']))
                 self._view.set('channel', '%d' % channel)
 
                 plugins.on('channel_hop', self, channel)
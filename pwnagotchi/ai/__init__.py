@@ -36,7 +36,12 @@ def load(config, agent, epoch, from_disk=True):
         import pwnagotchi.ai.gym as wrappers
         logging.debug("[ai] gym wrapper imported in %.2fs" % (time.time() - start))
 
-        env = wrappers.Environment(agent, epoch)
+        replay = None
+        if config['replay']['enabled']:
+            from pwnagotchi.ai.replay import ReplayWriter
+            replay = ReplayWriter(config['replay']['path'], agent.supported_channels(), config['replay']['max_files'])
+
+        env = wrappers.Environment(agent, epoch, replay)
         env = DummyVecEnv([lambda: env])
 
         logging.info("[ai] creating model ...")
@@ -45,12 +50,22 @@ def load(config, agent, epoch, from_disk=True):
         a2c = A2C(MlpLstmPolicy, env, **config['params'])
         logging.debug("[ai] A2C created in %.2fs" % (time.time() - start))
 
-        if from_disk and os.path.exists(config['path']):
-            logging.info("[ai] loading %s ..." % config['path'])
-            start = time.time()
-            a2c.load(config['path'], env)
-            logging.debug("[ai] A2C loaded in %.2fs" % (time.time() - start))
-        else:
+        loaded = False
+        if from_disk:
+            import pwnagotchi.ai.checkpoint as checkpoint
+            # most recent first, corrupted ones are skipped
+            for path in checkpoint.candidates(config['path'], config['checkpoint']['keep']):
+                logging.info("[ai] loading %s ..." % path)
+                start = time.time()
+                try:
+                    a2c.load_parameters(path)
+                    loaded = True
+                    logging.debug("[ai] A2C loaded in %.2fs" % (time.time() - start))
+                    break
+                except Exception as e:
+                    logging.warning("[ai] can't load %s: %s" % (path, e))
+
+        if not loaded:
             logging.info("[ai] model created:")
             for key, value in config['params'].items():
                 logging.info("      %s: %s" % (key, value))
@@ -0,0 +1,180 @@
+import io
+import os
+import json
+import time
+import zlib
+import atexit
+import logging
+import threading
+
+
+def meta_path(path):
+    return "%s.meta" % path
+
+
+def rolled_path(path, n):
+    return path if n == 0 else "%s.%d" % (path, n)
+
+
+def validate(path):
+    """
+    Quickly checks a checkpoint against the size and checksum written next to it, so that a
+    truncated or corrupted brain is skipped before tensorflow even tries to load it.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+
+    try:
+        with open(meta_path(path), 'rt') as fp:
+            meta = json.load(fp)
+    except FileNotFoundError:
+        # saved by an older version, nothing to check it against
+        return True
+    except Exception as e:
+        logging.warning("[ai] can't read %s: %s", meta_path(path), e)
+        return False
+
+    if os.path.getsize(path) != meta['size']:
+        logging.warning("[ai] %s is %d bytes instead of %d", path, os.path.getsize(path), meta['size'])
+        return False
+
+    crc = 0
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(65536), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    if crc != meta['crc32']:
+        logging.warning("[ai] %s checksum mismatch", path)
+        return False
+
+    return True
+
+
+def _rotate(path, keep):
+    for n in range(keep - 1, 0, -1):
+        src = rolled_path(path, n - 1)
+        if os.path.exists(src):
+            os.replace(src, rolled_path(path, n))
+            if os.path.exists(meta_path(src)):
+                os.replace(meta_path(src), meta_path(rolled_path(path, n)))
+
+
+def write(path, data, keep=1):
+    """
+    Atomically writes a serialized model to path together with its .meta file, after
+    moving the previous keep - 1 checkpoints one position back.
+
+    The .meta file is in place before the model, so a model without one can only come from
+    an older version, never from a write that was interrupted.
+    """
+    logging.info("[ai] saving model to %s (%d bytes) ..." % (path, len(data)))
+    started = time.time()
+
+    temp = "%s.tmp" % path
+    with open(temp, 'wb') as fp:
+        fp.write(data)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    temp_meta = "%s.tmp" % meta_path(path)
+    with open(temp_meta, 'wt') as fp:
+        json.dump({'size': len(data), 'crc32': zlib.crc32(data), 'saved_at': time.time()}, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    _rotate(path, keep)
+    os.replace(temp_meta, meta_path(path))
+    os.replace(temp, path)
+
+    logging.debug("[ai] model saved in %.2fs", time.time() - started)
+
+
+def serialize(model):
+    buf = io.BytesIO()
+    model.save(buf)
+    return buf.getvalue()
+
+
+def candidates(path, keep):
+    """
+    Returns the valid checkpoints, from the most recent one to the oldest one.
+    """
+    return [rolled_path(path, n) for n in range(keep) if validate(rolled_path(path, n))]
+
+
+class CheckpointManager(object):
+    """
+    Counts the training steps of the model and, every interval seconds or every steps training
+    steps, whichever comes first, and at exit, serializes it and writes it to disk in the
+    background.
+
+    The last keep checkpoints are rolled as path, path.1, ... path.<keep - 1>, each one
+    with its own size and checksum in a .meta file.
+    """
+
+    def __init__(self, path, interval=300, steps=50, keep=3):
+        self.path = path
+        self.interval = interval
+        self.steps = steps
+        self.keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pending = None
+        self._model = None
+        # steps not serialized yet
+        self._steps = 0
+        self._serialized_at = time.time()
+
+        threading.Thread(target=self._writer, daemon=True).start()
+        atexit.register(self.flush)
+
+    def snapshot(self, model):
+        """
+        Counts a training step of model, and serializes it when a write is due, from the thread
+        training it.
+        """
+        with self._lock:
+            self._model = model
+            self._steps += 1
+            due = self._steps >= self.steps or time.time() - self._serialized_at >= self.interval
+            if due:
+                self._steps = 0
+                self._serialized_at = time.time()
+
+        if due:
+            data = serialize(model)
+            with self._lock:
+                self._pending = data
+            self._wake.set()
+
+    def _write(self):
+        with self._write_lock:
+            with self._lock:
+                data, self._pending = self._pending, None
+            if data is not None:
+                write(self.path, data, self.keep)
+
+    def flush(self):
+        """
+        Writes the model, serializing it first if it has steps that weren't serialized yet.
+        """
+        with self._lock:
+            model = self._model if self._steps > 0 else None
+            self._steps = 0
+            self._serialized_at = time.time()
+
+        if model is not None:
+            data = serialize(model)
+            with self._lock:
+                self._pending = data
+        self._write()
+
+    def _writer(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self._write()
+            except Exception as e:
+                logging.exception("[ai] error while saving the model")
@@ -2,8 +2,12 @@ import time
 import threading
 import logging
 
+import numpy as np
+
 import pwnagotchi
 import pwnagotchi.utils as utils
+import pwnagotchi.timing as timing
+import pwnagotchi.metrics as metrics
 import pwnagotchi.mesh.wifi as wifi
 
 from pwnagotchi.ai.reward import RewardFunction
@@ -51,24 +55,36 @@ class Epoch(object):
         self.epoch_duration = 0
         # https://www.metageek.com/training/resources/why-channels-1-6-11.html
         self.non_overlapping_channels = {1: 0, 6: 0, 11: 0}
-        # observation vectors
+        # observation vectors, preallocated: one row per histogram, written by observe() and copied
+        # into the snapshot for the AI thread when the epoch data is consumed
+        self._histograms = np.zeros((3, wifi.NumChannels), dtype=np.float32)
+        self._histograms_snapshot = np.zeros((3, wifi.NumChannels), dtype=np.float32)
+        self._histograms_lock = threading.Lock()
         self._observation = {
-            'aps_histogram': [0.0] * wifi.NumChannels,
-            'sta_histogram': [0.0] * wifi.NumChannels,
-            'peers_histogram': [0.0] * wifi.NumChannels
+            'aps_histogram': self._histograms_snapshot[0],
+            'sta_histogram': self._histograms_snapshot[1],
+            'peers_histogram': self._histograms_snapshot[2]
         }
         self._observation_ready = threading.Event()
         self._epoch_data = {}
         self._epoch_data_ready = threading.Event()
         self._reward = RewardFunction()
+        # track() is called concurrently by the event poller and the attack workers
+        self._track_lock = threading.Lock()
 
     def wait_for_epoch_data(self, with_observation=True, timeout=None):
+        # the histograms returned are views of a buffer the next call overwrites, copy them to keep them
         # if with_observation:
         #    self._observation_ready.wait(timeout)
         #    self._observation_ready.clear()
         self._epoch_data_ready.wait(timeout)
         self._epoch_data_ready.clear()
-        return self._epoch_data if with_observation is False else {**self._observation, **self._epoch_data}
+        if with_observation is False:
+            return self._epoch_data
+
+        with self._histograms_lock:
+            np.copyto(self._histograms_snapshot, self._histograms)
+        return {**self._observation, **self._epoch_data}
 
     def data(self):
         return self._epoch_data
@@ -88,40 +104,43 @@ class Epoch(object):
         self.tot_bond_factor = sum((peer.encounters for peer in peers)) / bond_unit_scale
         self.avg_bond_factor = self.tot_bond_factor / num_peers
 
+        ap_channels = np.fromiter((ap['channel'] for ap in aps), dtype=np.intp, count=len(aps))
+        ap_clients = np.fromiter((len(ap['clients']) for ap in aps), dtype=np.float32, count=len(aps))
+        peer_channels = np.fromiter((peer.last_channel for peer in peers), dtype=np.intp, count=len(peers))
+
         num_aps = len(aps) + 1e-10
-        num_sta = sum(len(ap['clients']) for ap in aps) + 1e-10
-        aps_per_chan = [0.0] * wifi.NumChannels
-        sta_per_chan = [0.0] * wifi.NumChannels
-        peers_per_chan = [0.0] * wifi.NumChannels
-
-        for ap in aps:
-            ch_idx = ap['channel'] - 1
-            try:
-                aps_per_chan[ch_idx] += 1.0
-                sta_per_chan[ch_idx] += len(ap['clients'])
-            except IndexError as e:
-                logging.error("got data on channel %d, we can store %d channels" % (ap['channel'], wifi.NumChannels))
-
-        for peer in peers:
-            try:
-                peers_per_chan[peer.last_channel - 1] += 1.0
-            except IndexError as e:
-                logging.error(
-                    "got peer data on channel %d, we can store %d channels" % (peer.last_channel, wifi.NumChannels))
-
-        # normalize
-        aps_per_chan = [e / num_aps for e in aps_per_chan]
-        sta_per_chan = [e / num_sta for e in sta_per_chan]
-        peers_per_chan = [e / num_peers for e in peers_per_chan]
+        num_sta = ap_clients.sum() + 1e-10
+
+        ap_idx = self._channel_indexes(ap_channels, "got data on channel %d, we can store %d channels")
+        peer_idx = self._channel_indexes(peer_channels, "got peer data on channel %d, we can store %d channels")
+
+        with self._histograms_lock:
+            aps_per_chan, sta_per_chan, peers_per_chan = self._histograms
+            aps_per_chan[:] = np.bincount(ap_channels[ap_idx] - 1, minlength=wifi.NumChannels)
+            sta_per_chan[:] = np.bincount(ap_channels[ap_idx] - 1, weights=ap_clients[ap_idx],
+                                          minlength=wifi.NumChannels)
+            peers_per_chan[:] = np.bincount(peer_channels[peer_idx] - 1, minlength=wifi.NumChannels)
+
+            # normalize
+            aps_per_chan /= num_aps
+            sta_per_chan /= num_sta
+            peers_per_chan /= num_peers
 
-        self._observation = {
-            'aps_histogram': aps_per_chan,
-            'sta_histogram': sta_per_chan,
-            'peers_histogram': peers_per_chan
-        }
         self._observation_ready.set()
 
+    @staticmethod
+    def _channel_indexes(channels, error):
+        valid = (channels >= 1) & (channels <= wifi.NumChannels)
+        if not valid.all():
+            for channel in channels[~valid]:
+                logging.error(error % (channel, wifi.NumChannels))
+        return valid
+
     def track(self, deauth=False, assoc=False, handshake=False, hop=False, sleep=False, miss=False, inc=1):
+        with self._track_lock:
+            self._track(deauth, assoc, handshake, hop, sleep, miss, inc)
+
+    def _track(self, deauth, assoc, handshake, hop, sleep, miss, inc):
         if deauth:
             self.num_deauths += inc
             self.did_deauth = True
@@ -167,6 +186,7 @@ class Epoch(object):
 
         # cache the state of this epoch for other threads to read
         self._epoch_data = {
+            'epoch': self.epoch,
             'duration_secs': self.epoch_duration,
             'slept_for_secs': self.num_slept,
             'blind_for_epochs': self.blind_for,
@@ -186,6 +206,16 @@ class Epoch(object):
         }
 
         self._epoch_data['reward'] = self._reward(self.epoch + 1, self._epoch_data)
+        # where the time of this epoch went: agent loop phases, bettercap requests and plugin hooks
+        self._epoch_data['timings'] = timing.rollover()
+
+        metrics.inc('pwnagotchi_epochs_total', help='Completed epochs.')
+        metrics.inc('pwnagotchi_deauths_total', self.num_deauths, help='Deauthentication frames sent.')
+        metrics.inc('pwnagotchi_associations_total', self.num_assocs, help='Association frames sent.')
+        metrics.inc('pwnagotchi_handshakes_total', self.num_shakes, help='Handshakes captured.')
+        metrics.inc('pwnagotchi_hops_total', self.num_hops, help='Channel hops.')
+        metrics.inc('pwnagotchi_missed_interactions_total', self.num_missed, help='Missed interactions.')
+        metrics.inc('pwnagotchi_slept_seconds_total', self.num_slept, help='Seconds spent waiting.')
         self._epoch_data_ready.set()
 
         logging.info("[epoch %d] duration=%s slept_for=%s blind=%d inactive=%d active=%d peers=%d tot_bond=%.2f "
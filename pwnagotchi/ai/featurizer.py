@@ -37,30 +37,42 @@ def describe(extended=False):
                             1)
 
 
-def featurize(state, step):
+def featurize(state, step, out=None):
+    """
+    Writes the observation vector for the given state into out, which is allocated only
+    if not given or if its size doesn't match, and returns it.
+    """
+    histogram_size = len(state['aps_histogram'])
+    size = (histogram_size * 3) + 8
+    if out is None or out.shape != (size,):
+        out = np.empty(size, dtype=np.float32)
+
     tot_epochs = step + 1e-10
     tot_interactions = (state['num_deauths'] + state['num_associations']) + 1e-10
-    return np.concatenate((
-        # aps per channel
-        state['aps_histogram'],
-        # clients per channel
-        state['sta_histogram'],
-        # peers per channel
-        state['peers_histogram'],
-        # duration
-        [np.clip(state['duration_secs'] / MAX_EPOCH_DURATION, 0.0, 1.0)],
-        # inactive
-        [state['inactive_for_epochs'] / tot_epochs],
-        # active
-        [state['active_for_epochs'] / tot_epochs],
-        # missed
-        [state['missed_interactions'] / tot_interactions],
-        # hops
-        [state['num_hops'] / wifi.NumChannels],
-        # deauths
-        [state['num_deauths'] / tot_interactions],
-        # assocs
-        [state['num_associations'] / tot_interactions],
-        # handshakes
-        [state['num_handshakes'] / tot_interactions],
-    ))
+
+    # aps per channel
+    out[0:histogram_size] = state['aps_histogram']
+    # clients per channel
+    out[histogram_size:histogram_size * 2] = state['sta_histogram']
+    # peers per channel
+    out[histogram_size * 2:histogram_size * 3] = state['peers_histogram']
+
+    i = histogram_size * 3
+    # duration
+    out[i] = min(max(state['duration_secs'] / MAX_EPOCH_DURATION, 0.0), 1.0)
+    # inactive
+    out[i + 1] = state['inactive_for_epochs'] / tot_epochs
+    # active
+    out[i + 2] = state['active_for_epochs'] / tot_epochs
+    # missed
+    out[i + 3] = state['missed_interactions'] / tot_interactions
+    # hops
+    out[i + 4] = state['num_hops'] / wifi.NumChannels
+    # deauths
+    out[i + 5] = state['num_deauths'] / tot_interactions
+    # assocs
+    out[i + 6] = state['num_associations'] / tot_interactions
+    # handshakes
+    out[i + 7] = state['num_handshakes'] / tot_interactions
+
+    return out
@@ -27,10 +27,12 @@ class Environment(gym.Env):
         Parameter('sad_num_epochs', min_value=5, max_value=30),
     ]
 
-    def __init__(self, agent, epoch):
+    def __init__(self, agent, epoch, replay=None):
         super(Environment, self).__init__()
         self._agent = agent
         self._epoch = epoch
+        # optional ReplayWriter recording every step for offline training
+        self._replay = replay
         self._epoch_num = 0
         self._last_render = None
 
@@ -39,7 +41,8 @@ class Environment(gym.Env):
         self._extended_spectrum = any(ch > 140 for ch in self._supported_channels)
         self._histogram_size, self._observation_shape = featurizer.describe(self._extended_spectrum)
 
-        Environment.params += [
+        # replace the channels of any previous instance, vectorized environments create a few
+        Environment.params = [p for p in Environment.params if not p.name.startswith('_channel_')] + [
             Parameter('_channel_%d' % ch, min_value=0, max_value=1, meta=ch + 1) for ch in
             range(self._histogram_size) if ch + 1 in self._supported_channels
         ]
@@ -52,6 +55,8 @@ class Environment(gym.Env):
             'state': None,
             'state_v': None
         }
+        # reused across steps, the vectorized env copies the observations it keeps
+        self._state_v = None
 
         self.action_space = spaces.MultiDiscrete([p.space_size() for p in Environment.params if p.trainable])
         self.observation_space = spaces.Box(low=0, high=1, shape=self._observation_shape, dtype=np.float32)
@@ -88,7 +93,9 @@ class Environment(gym.Env):
 
     def _next_epoch(self):
         logging.debug("[ai] waiting for epoch to finish ...")
-        return self._epoch.wait_for_epoch_data()
+        state = self._epoch.wait_for_epoch_data()
+        # kept as last['state'], while the epoch reuses the histograms for the next one
+        return {name: np.copy(value) if isinstance(value, np.ndarray) else value for name, value in state.items()}
 
     def _apply_policy(self, policy):
         new_params = Environment.policy_to_params(policy)
@@ -107,7 +114,14 @@ class Environment(gym.Env):
 
         self.last['reward'] = state['reward']
         self.last['state'] = state
-        self.last['state_v'] = featurizer.featurize(state, self._epoch_num)
+        self._state_v = featurizer.featurize(state, self._epoch_num, self._state_v)
+        self.last['state_v'] = self._state_v
+
+        if self._replay is not None:
+            try:
+                self._replay.append(state, policy, state.get('epoch', self._epoch_num), self._agent.is_training())
+            except Exception as e:
+                logging.exception("[ai] error while recording epoch")
 
         self._agent.on_ai_step()
 
@@ -118,7 +132,8 @@ class Environment(gym.Env):
         self._epoch_num = 0
         state = self._next_epoch()
         self.last['state'] = state
-        self.last['state_v'] = featurizer.featurize(state, 1)
+        self._state_v = featurizer.featurize(state, 1, self._state_v)
+        self.last['state_v'] = self._state_v
         return self.last['state_v']
 
     def _render_histogram(self, hist):
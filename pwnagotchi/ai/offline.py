@@ -0,0 +1,298 @@
+import os
+import sys
+import glob
+import time
+import functools
+import logging
+import argparse
+
+import numpy as np
+import toml
+
+import pwnagotchi
+import pwnagotchi.utils as utils
+import pwnagotchi.ai.checkpoint as checkpoint
+import pwnagotchi.ai.featurizer as featurizer
+from pwnagotchi.ai.replay import ReplayLog
+from pwnagotchi.ai.reward import RewardFunction
+
+
+def episodes(logs, epochs_per_episode):
+    """
+    Splits the replay logs in (filename, start, end) episodes of epochs_per_episode records,
+    plus one to reset the environment with.
+    """
+    found = []
+    for log in logs:
+        for start in range(0, len(log) - 1, epochs_per_episode):
+            end = min(start + epochs_per_episode + 1, len(log))
+            if end - start > 1:
+                found.append((log.filename, start, end))
+    return found
+
+
+class Lane(object):
+    """
+    Gym-like environment walking through a few recorded episodes, one after the other, in a loop.
+
+    The recorded epochs follow the action the unit took, not the one it's stepped with: every
+    step returns the observation that followed, the reward the unit got for it and, in the info,
+    the recorded action that led there.
+    """
+    metadata = {'render.modes': []}
+
+    def __init__(self, supported_channels, episodes):
+        self._supported_channels = supported_channels
+        self._episodes = episodes
+        self._logs = {}
+        self._reward = RewardFunction()
+        self._episode = -1
+        self._cursor = 0
+        self._end = 0
+        self._epoch_num = 0
+        self._obs = None
+
+        # same spaces as the environment the unit trains in
+        env = make_env(self)
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.reward_range = env.reward_range
+
+    def supported_channels(self):
+        return self._supported_channels
+
+    def _log(self):
+        filename = self._episodes[self._episode][0]
+        if filename not in self._logs:
+            self._logs[filename] = ReplayLog(filename)
+        return self._logs[filename]
+
+    def _observe(self):
+        log = self._log()
+        state = log.state(self._cursor)
+        # same reward the unit would compute now, not the one it did when recording
+        reward = self._reward(int(log.records[self._cursor]['epoch']) + 1, state)
+        # featurized like the gym environment does on reset and step
+        self._obs = featurizer.featurize(state, max(1, self._epoch_num), self._obs)
+        self._cursor += 1
+        return reward
+
+    def _observation(self):
+        # SubprocVecEnv stacks the observations as they are, it does not reshape them like DummyVecEnv
+        return np.reshape(self._obs, self.observation_space.shape).copy()
+
+    def reset(self):
+        self._episode = (self._episode + 1) % len(self._episodes)
+        _, self._cursor, self._end = self._episodes[self._episode]
+        self._epoch_num = 0
+        self._observe()
+        return self._observation()
+
+    def step(self, _):
+        # the action recorded with an epoch is the one the unit applied before living it
+        action = self._log().action(self._cursor)
+        self._epoch_num += 1
+        reward = self._observe()
+        return self._observation(), reward, self._cursor >= self._end, {'action': action}
+
+    def close(self):
+        self._logs = {}
+
+
+def discount(rewards, dones, last_value, gamma):
+    """
+    Discounted returns of a lane's rollout, bootstrapped from the value of the observation that
+    follows it unless its last episode is over.
+    """
+    returns = np.zeros(len(rewards), dtype=np.float32)
+    ret = 0.0 if dones[-1] else last_value
+    for i in range(len(rewards) - 1, -1, -1):
+        ret = rewards[i] + gamma * ret * (1.0 - dones[i])
+        returns[i] = ret
+    return returns
+
+
+def make_env(lane):
+    # imported here since it needs gym
+    import pwnagotchi.ai.gym as wrappers
+
+    return wrappers.Environment(lane, lane)
+
+
+def load_logs(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames += sorted(glob.glob(os.path.join(path, '*.rpl')))
+        else:
+            filenames.append(path)
+
+    logs = []
+    for filename in filenames:
+        try:
+            logs.append(ReplayLog(filename))
+        except Exception as e:
+            logging.warning("skipping %s: %s", filename, e)
+
+    if not logs:
+        return [], []
+
+    # the channels define the action space, the brain must match the unit's
+    supported_channels = logs[-1].supported_channels
+    matching = []
+    for log in logs:
+        if log.supported_channels != supported_channels:
+            logging.warning("skipping %s: recorded with different supported channels", log.filename)
+        else:
+            matching.append(log)
+
+    return supported_channels, matching
+
+
+def train(config, paths, output, brain=None, workers=None, passes=1):
+    """
+    Trains the brain on the actions the units actually took.
+
+    The recorded next epochs don't depend on what the model would do, so instead of letting it
+    pick actions the usual A2C update is fed with the recorded ones: every update raises the
+    probability of an action as much as its return was better than the value predicted for the
+    observation it was taken from, and fits the value to the return. It's advantage weighted
+    behavior cloning of the policy the units ran while recording: without the probabilities they
+    picked their actions with there are no importance weights to correct for it.
+
+    The episodes are spread over workers processes, each one reading, featurizing and computing
+    the rewards of its share while the model is updated. There's no public A2C api to update the
+    model with actions it didn't pick, so this relies on A2C._train_step, the step A2C.learn runs.
+    """
+    epochs_per_episode = config['ai']['epochs_per_episode']
+
+    supported_channels, logs = load_logs(paths)
+    found = episodes(logs, epochs_per_episode)
+    if not found:
+        logging.error("no episodes found in %s", ', '.join(paths))
+        return False
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(found)))
+    total_epochs = sum(end - start - 1 for _, start, end in found)
+    logging.info("replaying %d epochs in %d episodes from %d logs with %d workers ...", total_epochs, len(found),
+                 len(logs), workers)
+
+    from stable_baselines import A2C
+    from stable_baselines.common.policies import MlpLstmPolicy
+    from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+    try:
+        from stable_baselines.common.schedules import Scheduler
+    except ImportError:
+        from stable_baselines.a2c.utils import Scheduler
+
+    # every worker process replays its own share of the episodes, side by side in the same batch
+    lanes = [functools.partial(Lane, supported_channels, found[i::workers]) for i in range(workers)]
+    env = SubprocVecEnv(lanes) if workers > 1 else DummyVecEnv(lanes)
+    try:
+        model = A2C(MlpLstmPolicy, env, **config['ai']['params'])
+
+        if brain:
+            for path in checkpoint.candidates(brain, config['ai']['checkpoint']['keep']):
+                logging.info("starting from %s ...", path)
+                try:
+                    model.load_parameters(path)
+                    break
+                except Exception as e:
+                    logging.warning("can't load %s: %s", path, e)
+
+        n_steps = model.n_steps
+        gamma = model.gamma
+        updates = max(1, (total_epochs * passes) // model.n_batch)
+        model.learning_rate_schedule = Scheduler(initial_value=model.learning_rate,
+                                                 n_values=updates * model.n_batch, schedule=model.lr_schedule)
+
+        obs = env.reset()
+        states = model.initial_state
+        dones = np.zeros(workers, dtype=bool)
+
+        started = time.time()
+        for update in range(1, updates + 1):
+            mb_obs, mb_actions, mb_rewards, mb_values, mb_masks, mb_dones = [], [], [], [], [], []
+            mb_states = states
+            for _ in range(n_steps):
+                actions, values, states, _ = model.step(obs, states, dones)
+                mb_obs.append(np.copy(obs))
+                mb_values.append(values)
+                mb_masks.append(dones)
+
+                # the lanes ignore the actions picked by the model and return the recorded ones
+                obs, rewards, dones, infos = env.step(actions)
+                mb_actions.append([info['action'] for info in infos])
+                mb_rewards.append(rewards)
+                mb_dones.append(dones)
+
+            # [n_steps, n_workers, ...] to [n_workers * n_steps, ...], as the model expects
+            last_values = model.value(obs, states, dones)
+            mb_rewards = np.asarray(mb_rewards, dtype=np.float32).swapaxes(0, 1)
+            mb_dones = np.asarray(mb_dones, dtype=np.float32).swapaxes(0, 1)
+            returns = np.concatenate([discount(mb_rewards[i], mb_dones[i], last_values[i], gamma)
+                                      for i in range(workers)])
+
+            policy_loss, value_loss, entropy = model._train_step(
+                np.asarray(mb_obs, dtype=np.float32).swapaxes(0, 1).reshape((-1,) + obs.shape[1:]),
+                mb_states,
+                returns,
+                np.asarray(mb_masks, dtype=bool).swapaxes(0, 1).reshape(-1),
+                np.asarray(mb_actions).swapaxes(0, 1).reshape((-1,) + env.action_space.shape),
+                np.asarray(mb_values, dtype=np.float32).swapaxes(0, 1).reshape(-1),
+                update)
+            model.num_timesteps += model.n_batch
+
+            if update % 100 == 0 or update == updates:
+                logging.info("update %d/%d policy_loss=%f value_loss=%f entropy=%f", update, updates, policy_loss,
+                             value_loss, entropy)
+
+        logging.info("trained in %.2fs", time.time() - started)
+
+        # same format and .meta file the unit writes and checks when loading
+        checkpoint.write(output, checkpoint.serialize(model))
+    finally:
+        env.close()
+
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train a brain offline on the actions recorded in the replay logs of units. This is advantage "
+                    "weighted behavior cloning: it makes the actions that did better than expected more likely, "
+                    "it won't find actions the units never took.")
+
+    parser.add_argument('logs', nargs='+', help="Replay log files or folders containing them.")
+    parser.add_argument('-C', '--config', action='store', dest='config', default=None,
+                        help='TOML configuration file, merged with the defaults.')
+    parser.add_argument('-o', '--output', action='store', dest='output', default='brain.nn',
+                        help='Where to save the trained brain.')
+    parser.add_argument('-b', '--brain', action='store', dest='brain', default=None,
+                        help='Existing brain to start from.')
+    parser.add_argument('-w', '--workers', action='store', dest='workers', type=int, default=None,
+                        help='Number of worker processes replaying the episodes side by side in every batch, '
+                             'defaults to the number of cpus.')
+    parser.add_argument('-p', '--passes', action='store', dest='passes', type=int, default=1,
+                        help='How many times to go through the recorded epochs.')
+    parser.add_argument('--debug', dest="debug", action="store_true", default=False,
+                        help="Enable debug logs.")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(levelname)s] %(message)s")
+
+    with open(os.path.join(os.path.dirname(pwnagotchi.__file__), 'defaults.toml')) as fp:
+        config = toml.load(fp)
+
+    if args.config:
+        with open(args.config) as fp:
+            config = utils.merge_config(toml.load(fp), config)
+
+    if not train(config, args.logs, args.output, args.brain, args.workers, args.passes):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import os
+import glob
+import time
+import logging
+import threading
+
+import numpy as np
+
+import pwnagotchi.mesh.wifi as wifi
+
+MAGIC = b'PWNRPLAY'
+VERSION = 1
+HEADER_SIZE = 1024
+# trainable parameters plus one per channel, with room to spare
+MAX_ACTION_SIZE = 256
+MAX_CHANNELS = 256
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('record_size', '<u4'),
+    ('num_channels', '<u4'),
+    ('max_action_size', '<u4'),
+    ('created_at', '<f8'),
+    ('num_supported_channels', '<u4'),
+    ('supported_channels', '<u2', (MAX_CHANNELS,)),
+])
+
+# the epoch fields the featurizer and the reward function work on
+COUNTERS = ('blind_for_epochs', 'inactive_for_epochs', 'active_for_epochs', 'missed_interactions', 'num_hops',
+            'num_peers', 'num_deauths', 'num_associations', 'num_handshakes')
+HISTOGRAMS = ('aps_histogram', 'sta_histogram', 'peers_histogram')
+
+
+def record_dtype(num_channels=wifi.NumChannels, max_action_size=MAX_ACTION_SIZE):
+    return np.dtype(
+        [('time', '<f8'), ('epoch', '<u4'), ('training', 'u1')] +
+        [(name, '<f4', (num_channels,)) for name in HISTOGRAMS] +
+        [('duration_secs', '<f4'), ('slept_for_secs', '<f4')] +
+        [(name, '<u4') for name in COUNTERS] +
+        [('reward', '<f4'), ('action_size', '<u2'), ('action', '<i2', (max_action_size,))])
+
+
+class ReplayWriter(object):
+    """
+    Appends one fixed-width record per epoch, with its observation, the policy that was
+    chosen for it and the reward, to a file that can be memory mapped by ReplayLog.
+    A new file is created for each session in path, and only the last max_files are kept.
+    """
+
+    def __init__(self, path, supported_channels, max_files=20):
+        self.path = path
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._dtype = record_dtype()
+        self._record = np.zeros(1, dtype=self._dtype)
+        self._fp = None
+        self._supported_channels = sorted(ch for ch in supported_channels if ch <= 0xffff)[:MAX_CHANNELS]
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+
+        existing = sorted(glob.glob(os.path.join(self.path, 'epochs_*.rpl')))
+        for filename in existing[:max(0, len(existing) - self.max_files + 1)]:
+            logging.debug("[ai] removing old replay log %s", filename)
+            os.remove(filename)
+
+        filename = os.path.join(self.path, 'epochs_%d.rpl' % int(time.time()))
+        header = np.zeros(1, dtype=HEADER)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['record_size'] = self._dtype.itemsize
+        header['num_channels'] = wifi.NumChannels
+        header['max_action_size'] = MAX_ACTION_SIZE
+        header['created_at'] = time.time()
+        header['num_supported_channels'] = len(self._supported_channels)
+        header['supported_channels'][0, :len(self._supported_channels)] = self._supported_channels
+
+        self._fp = open(filename, 'ab')
+        self._fp.write(header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        logging.info("[ai] recording epochs to %s", filename)
+
+    def append(self, state, action, epoch, training):
+        with self._lock:
+            if self._fp is None:
+                self._open()
+
+            rec = self._record[0]
+            rec['time'] = time.time()
+            rec['epoch'] = epoch
+            rec['training'] = training
+            for name in HISTOGRAMS:
+                rec[name] = state[name]
+            rec['duration_secs'] = state['duration_secs']
+            rec['slept_for_secs'] = state['slept_for_secs']
+            for name in COUNTERS:
+                rec[name] = state[name]
+            rec['reward'] = state['reward']
+
+            action = np.asarray(action).ravel()[:MAX_ACTION_SIZE]
+            rec['action_size'] = len(action)
+            rec['action'][:len(action)] = action
+            rec['action'][len(action):] = 0
+
+            self._fp.write(self._record.tobytes())
+            self._fp.flush()
+
+
+class ReplayLog(object):
+    """
+    Read only, memory mapped view of a replay file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        header = np.fromfile(filename, dtype=HEADER, count=1)
+        if len(header) != 1 or header['magic'][0] != MAGIC:
+            raise ValueError("%s is not a replay log" % filename)
+        header = header[0]
+        if header['version'] != VERSION:
+            raise ValueError("%s has unsupported version %d" % (filename, header['version']))
+
+        self.dtype = record_dtype(int(header['num_channels']), int(header['max_action_size']))
+        if self.dtype.itemsize != header['record_size']:
+            raise ValueError("%s has unexpected records of %d bytes" % (filename, header['record_size']))
+
+        self.created_at = float(header['created_at'])
+        self.supported_channels = [int(ch) for ch in
+                                   header['supported_channels'][:int(header['num_supported_channels'])]]
+
+        # ignore a truncated last record
+        num_records = (os.path.getsize(filename) - HEADER_SIZE) // self.dtype.itemsize
+        if num_records > 0:
+            self.records = np.memmap(filename, dtype=self.dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(num_records,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def state(self, i):
+        """
+        Returns the i-th record as the epoch data the agent would pass to the ai.
+        """
+        rec = self.records[i]
+        state = {name: np.array(rec[name]) for name in HISTOGRAMS}
+        state['duration_secs'] = float(rec['duration_secs'])
+        state['slept_for_secs'] = float(rec['slept_for_secs'])
+        for name in COUNTERS:
+            state[name] = int(rec[name])
+        state['reward'] = float(rec['reward'])
+        return state
+
+    def action(self, i):
+        rec = self.records[i]
+        return np.array(rec['action'][:rec['action_size']])
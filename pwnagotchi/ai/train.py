@@ -1,19 +1,24 @@
 import _thread
+import atexit
 import threading
 import time
-import random
 import os
 import json
 import logging
 
 import pwnagotchi.plugins as plugins
 import pwnagotchi.ai as ai
+import pwnagotchi.ai.worker as worker
+from pwnagotchi.ai.checkpoint import CheckpointManager
 
 
 class Stats(object):
-    def __init__(self, path, events_receiver):
+    def __init__(self, path, events_receiver, save_interval=0):
         self._lock = threading.Lock()
         self._receiver = events_receiver
+        self._save_interval = save_interval
+        self._saved_at = time.time()
+        self._dirty = False
 
         self.path = path
         self.born_at = time.time()
@@ -44,7 +49,11 @@ class Stats(object):
             if training:
                 self.epochs_trained += 1
 
-        self.save()
+            self._dirty = True
+            due = time.time() - self._saved_at >= self._save_interval
+
+        if due:
+            self.save()
 
         if best_r:
             self._receiver.on_ai_best_reward(reward)
@@ -64,6 +73,9 @@ class Stats(object):
 
     def save(self):
         with self._lock:
+            if not self._dirty:
+                return
+
             logging.info("[ai] saving %s" % self.path)
 
             data = json.dumps({
@@ -81,6 +93,8 @@ class Stats(object):
                 fp.write(data)
 
             os.replace(temp, self.path)
+            self._saved_at = time.time()
+            self._dirty = False
 
 
 class AsyncTrainer(object):
@@ -90,7 +104,11 @@ class AsyncTrainer(object):
         self._is_training = False
         self._training_epochs = 0
         self._nn_path = self._config['ai']['path']
-        self._stats = Stats("%s.json" % os.path.splitext(self._nn_path)[0], self)
+        self._stats = Stats("%s.json" % os.path.splitext(self._nn_path)[0], self,
+                            config['ai']['checkpoint']['interval'])
+        atexit.register(self._stats.save)
+        self._checkpoints = None
+        self._ai_supervisor = None
 
     def set_training(self, training, for_epochs=0):
         self._is_training = training
@@ -108,21 +126,51 @@ class AsyncTrainer(object):
         return self._training_epochs
 
     def start_ai(self):
-        _thread.start_new_thread(self._ai_worker, ())
-
-    def _save_ai(self):
-        logging.info("[ai] saving model to %s ..." % self._nn_path)
-        temp = "%s.tmp" % self._nn_path
-        self._model.save(temp)
-        os.replace(temp, self._nn_path)
+        if not self._config['ai']['worker']['process']:
+            _thread.start_new_thread(self._ai_worker, ())
+        elif not self._config['ai']['enabled']:
+            logging.info("ai disabled")
+        else:
+            self._ai_supervisor = worker.Supervisor(self._config, self.supported_channels(), self._on_ai_request)
+            self._ai_supervisor.start()
+
+    def set_ai_busy(self, busy):
+        # let the ai process use the cpu only when we're not busy capturing
+        if self._ai_supervisor is not None:
+            self._ai_supervisor.set_busy(busy)
+
+    def _on_ai_request(self, kind, payload):
+        if kind == 'log':
+            logging.getLogger().handle(logging.makeLogRecord(payload))
+        elif kind == 'epoch':
+            return self._epoch.wait_for_epoch_data(with_observation=payload)
+        elif kind == 'ready':
+            self.on_ai_ready()
+        elif kind == 'policy':
+            self.on_ai_policy(payload)
+        elif kind == 'training':
+            self.set_training(*payload)
+        elif kind == 'training_step':
+            plugins.on('ai_training_step', self, payload, {})
+        elif kind == 'step':
+            self._on_ai_epoch(payload)
+        elif kind == 'exited':
+            # the worker crashed in the middle of an episode
+            if self._is_training:
+                self.set_training(False)
+        else:
+            logging.warning("[ai] unknown request from the worker: %s", kind)
 
     def on_ai_step(self):
         self._model.env.render()
 
         if self._is_training:
-            self._save_ai()
+            self._checkpoints.snapshot(self._model)
 
-        self._stats.on_epoch(self._epoch.data(), self._is_training)
+        self._on_ai_epoch(self._is_training)
+
+    def _on_ai_epoch(self, training):
+        self._stats.on_epoch(self._epoch.data(), training)
 
     def on_ai_training_step(self, _locals, _globals):
         self._model.env.render()
@@ -140,9 +188,10 @@ class AsyncTrainer(object):
             else:
                 logging.error("[ai] param %s not in personality configuration!" % name)
 
-        self.run('set wifi.ap.ttl %d' % self._config['personality']['ap_ttl'])
-        self.run('set wifi.sta.ttl %d' % self._config['personality']['sta_ttl'])
-        self.run('set wifi.rssi.min %d' % self._config['personality']['min_rssi'])
+        with self.batch() as batch:
+            batch.add('set wifi.ap.ttl %d' % self._config['personality']['ap_ttl'])
+            batch.add('set wifi.sta.ttl %d' % self._config['personality']['sta_ttl'])
+            batch.add('set wifi.rssi.min %d' % self._config['personality']['min_rssi'])
 
     def on_ai_ready(self):
         self._view.on_ai_ready()
@@ -159,31 +208,10 @@ class AsyncTrainer(object):
         plugins.on('ai_worst_reward', self, r)
 
     def _ai_worker(self):
+        cfg = self._config['ai']['checkpoint']
+        self._checkpoints = CheckpointManager(self._nn_path, cfg['interval'], cfg['steps'], cfg['keep'])
         self._model = ai.load(self._config, self, self._epoch)
 
         if self._model:
             self.on_ai_ready()
-
-            epochs_per_episode = self._config['ai']['epochs_per_episode']
-
-            obs = None
-            while True:
-                self._model.env.render()
-                # enter in training mode?
-                if random.random() > self._config['ai']['laziness']:
-                    logging.info("[ai] learning for %d epochs ..." % epochs_per_episode)
-                    try:
-                        self.set_training(True, epochs_per_episode)
-                        self._model.learn(total_timesteps=epochs_per_episode, callback=self.on_ai_training_step)
-                    except Exception as e:
-                        logging.exception("[ai] error while training")
-                    finally:
-                        self.set_training(False)
-                        obs = self._model.env.reset()
-                # init the first time
-                elif obs is None:
-                    obs = self._model.env.reset()
-
-                # run the inference
-                action, _ = self._model.predict(obs)
-                obs, _, _, _ = self._model.env.step(action)
+            worker.run(self._model, self, self._config)
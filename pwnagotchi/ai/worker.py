@@ -0,0 +1,260 @@
+import os
+import time
+import random
+import signal
+import logging
+import threading
+import multiprocessing
+
+import pwnagotchi.ai as ai
+from pwnagotchi.ai.checkpoint import CheckpointManager
+
+# sent by the worker when the ai can't be loaded and there's no point in restarting it
+DISABLED = 'disabled'
+
+
+def run(model, trainer, config):
+    """
+    The ai main loop: learn for an episode every now and then, otherwise just pick
+    a new policy at every epoch.
+    """
+    epochs_per_episode = config['ai']['epochs_per_episode']
+
+    obs = None
+    while True:
+        model.env.render()
+        # enter in training mode?
+        if random.random() > config['ai']['laziness']:
+            logging.info("[ai] learning for %d epochs ..." % epochs_per_episode)
+            try:
+                trainer.set_training(True, epochs_per_episode)
+                model.learn(total_timesteps=epochs_per_episode, callback=trainer.on_ai_training_step)
+            except Exception as e:
+                logging.exception("[ai] error while training")
+            finally:
+                trainer.set_training(False)
+                obs = model.env.reset()
+        # init the first time
+        elif obs is None:
+            obs = model.env.reset()
+
+        # run the inference
+        action, _ = model.predict(obs)
+        obs, _, _, _ = model.env.step(action)
+
+
+def _set_nice(pid, nice):
+    # niceness is per thread on linux, tensorflow has plenty of them
+    try:
+        tids = [int(tid) for tid in os.listdir('/proc/%d/task' % pid)]
+    except OSError:
+        tids = [pid]
+
+    for tid in tids:
+        try:
+            os.setpriority(os.PRIO_PROCESS, tid, nice)
+        except OSError as e:
+            logging.debug("[ai] can't set priority of %d to %d: %s", tid, nice, e)
+
+
+class PipeHandler(logging.Handler):
+    """
+    Forwards the worker log records to the main process, so that they end up in the same log.
+    """
+
+    def __init__(self, remote):
+        super().__init__()
+        self._remote = remote
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            self._remote.send('log', {
+                'name': record.name,
+                'levelno': record.levelno,
+                'levelname': record.levelname,
+                'msg': msg,
+                'created': record.created,
+                'msecs': record.msecs,
+                'process': record.process
+            })
+        except Exception:
+            self.handleError(record)
+
+
+class Remote(object):
+    """
+    Stands in for the agent and its epoch inside the worker process, forwarding to the
+    main process whatever the gym environment and the model need from them.
+    """
+
+    def __init__(self, config, supported_channels, conn):
+        self._config = config
+        self._supported_channels = supported_channels
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._model = None
+        self._is_training = False
+        self._training_epochs = 0
+        self._checkpoints = CheckpointManager(config['ai']['path'], config['ai']['checkpoint']['interval'],
+                                              config['ai']['checkpoint']['steps'],
+                                              config['ai']['checkpoint']['keep'])
+
+    def send(self, kind, payload=None):
+        with self._lock:
+            self._conn.send((kind, payload))
+
+    # agent
+
+    def supported_channels(self):
+        return self._supported_channels
+
+    def is_training(self):
+        return self._is_training
+
+    def training_epochs(self):
+        return self._training_epochs
+
+    def set_training(self, training, for_epochs=0):
+        self._is_training = training
+        self._training_epochs = for_epochs
+        self.send('training', (training, for_epochs))
+
+    def on_ai_policy(self, new_params):
+        self.send('policy', new_params)
+
+    def on_ai_step(self):
+        self._model.env.render()
+
+        if self._is_training:
+            self._checkpoints.snapshot(self._model)
+
+        self.send('step', self._is_training)
+
+    def on_ai_training_step(self, _locals, _globals):
+        self._model.env.render()
+        # the model internals can't leave the process, only plain values do
+        self.send('training_step', {k: v for k, v in _locals.items() if isinstance(v, (bool, int, float, str))})
+
+    # epoch
+
+    def wait_for_epoch_data(self, with_observation=True, timeout=None):
+        self.send('epoch', with_observation)
+        # only this thread receives
+        return self._conn.recv()
+
+    def stop(self, *unused):
+        # multiprocessing children skip atexit handlers
+        self._checkpoints.flush()
+        os._exit(0)
+
+    def start(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        self._model = ai.load(self._config, self, self)
+        if not self._model:
+            self.send(DISABLED)
+            return
+
+        self.send('ready')
+        run(self._model, self, self._config)
+
+
+def main(config, supported_channels, conn, log_level):
+    # lower our priority before tensorflow starts its threads, so that they inherit it
+    os.nice(config['ai']['worker']['nice'])
+
+    remote = Remote(config, supported_channels, conn)
+
+    root = logging.getLogger()
+    root.handlers = []
+    root.setLevel(log_level)
+    root.addHandler(PipeHandler(remote))
+
+    remote.start()
+
+
+class Supervisor(object):
+    """
+    Runs the ai in a child process, handing its requests to handler(kind, payload) and
+    restarting it with exponential backoff whenever it crashes.
+    """
+
+    def __init__(self, config, supported_channels, handler):
+        self._config = config
+        self._supported_channels = supported_channels
+        self._handler = handler
+        self._process = None
+        self._busy = False
+        self._ctx = multiprocessing.get_context(config['ai']['worker']['start_method'])
+        self.restarts = 0
+
+    def start(self):
+        threading.Thread(target=self._supervise, daemon=True).start()
+
+    def set_busy(self, busy):
+        if busy == self._busy:
+            return
+        self._busy = busy
+        process = self._process
+        if process is not None and process.is_alive():
+            cfg = self._config['ai']['worker']
+            _set_nice(process.pid, cfg['busy_nice'] if busy else cfg['nice'])
+
+    def _serve(self, conn):
+        while True:
+            kind, payload = conn.recv()
+            if kind == DISABLED:
+                return False
+
+            reply = None
+            try:
+                reply = self._handler(kind, payload)
+            except Exception as e:
+                logging.exception("[ai] error while handling %s", kind)
+
+            if kind == 'epoch':
+                conn.send(reply)
+
+    def _supervise(self):
+        cfg = self._config['ai']['worker']
+        delay = cfg['restart_delay']
+
+        while True:
+            parent_conn, child_conn = self._ctx.Pipe()
+            self._process = self._ctx.Process(target=main, name='pwnagotchi-ai', daemon=True,
+                                              args=(self._config, self._supported_channels, child_conn,
+                                                    logging.getLogger().getEffectiveLevel()))
+            started = time.time()
+            self._process.start()
+            child_conn.close()
+            logging.info("[ai] worker started with pid %d", self._process.pid)
+
+            try:
+                if self._serve(parent_conn) is False:
+                    logging.debug("[ai] the worker couldn't load the ai, not restarting it")
+                    self._process.join()
+                    return
+            except (EOFError, OSError) as e:
+                logging.debug("[ai] worker connection lost: %s", e)
+            except Exception as e:
+                logging.exception("[ai] error while serving the worker")
+
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+
+            # if it ran for a while it was not crash looping
+            if time.time() - started > cfg['max_restart_delay']:
+                delay = cfg['restart_delay']
+
+            try:
+                self._handler('exited', self._process.exitcode)
+            except Exception as e:
+                logging.exception("[ai] error while handling the worker exit")
+
+            self.restarts += 1
+            logging.error("[ai] worker exited with code %s, restarting in %.1fs (%d restarts so far) ...",
+                          self._process.exitcode, delay, self.restarts)
+            time.sleep(delay)
+            delay = min(delay * 2, cfg['max_restart_delay'])
@@ -0,0 +1,84 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import pwnagotchi.timing as timing
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst=1):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AttackScheduler(object):
+    def __init__(self, workers=3, rate=0, burst=1):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='attack')
+        self._bucket = TokenBucket(rate, burst)
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def throttle(self):
+        self._bucket.acquire()
+
+    def _track(self, kind, elapsed):
+        with self._lock:
+            if kind not in self._stats:
+                self._stats[kind] = {'count': 0, 'total_secs': 0.0, 'max_secs': 0.0}
+            stats = self._stats[kind]
+            stats['count'] += 1
+            stats['total_secs'] += elapsed
+            stats['max_secs'] = max(stats['max_secs'], elapsed)
+
+    def _send_all(self, send, commands, futures):
+        for (kind, target, command), future in zip(commands, futures):
+            sent, error = False, None
+            started = time.monotonic()
+            try:
+                sent = send(command)
+            except Exception as e:
+                sent, error = True, e
+            elapsed = time.monotonic() - started
+            if sent:
+                self._track(kind, elapsed)
+                timing.observe(timing.PHASE, kind, elapsed)
+            future.set_result({'kind': kind, 'target': target, 'secs': elapsed, 'sent': sent, 'error': error})
+
+    def run(self, send, groups):
+        """
+        Calls send(command) for every group of (kind, target, command) commands, the groups in parallel on the
+        worker pool and the commands of each group one after the other. Yields the result of every command, in
+        the order they were given, as soon as it's available.
+
+        send returns False for commands it skipped, and its exceptions are returned as the error of the command.
+        """
+        futures = []
+        for commands in groups:
+            group = [Future() for _ in commands]
+            self._pool.submit(self._send_all, send, commands, group)
+            futures += group
+
+        for future in futures:
+            yield future.result()
+
+    def stats(self):
+        with self._lock:
+            return {kind: dict(stats) for kind, stats in self._stats.items()}
@@ -1,6 +1,7 @@
 import logging
 
 import pwnagotchi.plugins as plugins
+import pwnagotchi.timing as timing
 from pwnagotchi.ai.epoch import Epoch
 
 
@@ -94,7 +95,8 @@ class Automata(object):
 
     def wait_for(self, t, sleeping=True):
         plugins.on('sleep' if sleeping else 'wait', self, t)
-        self._view.wait(t, sleeping)
+        with timing.timer(timing.PHASE, 'wait'):
+            self._view.wait(t, sleeping)
         self._epoch.track(sleep=True, inc=t)
 
     def is_stale(self):
@@ -103,6 +105,12 @@ class Automata(object):
     def any_activity(self):
         return self._epoch.any_activity
 
+    def epoch_number(self):
+        return self._epoch.epoch
+
+    def epoch_data(self):
+        return self._epoch.data()
+
     def next_epoch(self):
         logging.debug("agent.next_epoch()")
 
@@ -1,7 +1,24 @@
+import asyncio
+import collections
+import json
 import logging
+import random
+import threading
+import time
+
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+import pwnagotchi.timing as timing
+from pwnagotchi.mesh.wifi import AccessPointIndex
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
 
 def decode(r, verbose_errors=True):
     try:
@@ -17,24 +34,393 @@ def decode(r, verbose_errors=True):
         return r.text
 
 
+def not_sent(e):
+    """
+    True if the request failed while connecting, before anything was sent to bettercap.
+    """
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = e.args[0] if e.args else None
+    # requests wraps the urllib3 error in a MaxRetryError
+    reason = getattr(reason, 'reason', reason)
+    # NewConnectionError is a ConnectTimeoutError too
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+def event_id(event):
+    return event['time'], event['tag']
+
+
+class Latency(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.last = 0.0
+
+    def track(self, elapsed, error=False):
+        self.count += 1
+        self.total += elapsed
+        self.last = elapsed
+        if self.min is None or elapsed < self.min:
+            self.min = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if error:
+            self.errors += 1
+
+    @property
+    def avg(self):
+        return self.total / self.count if self.count else 0.0
+
+    def data(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_secs': self.avg,
+            'min_secs': self.min or 0.0,
+            'max_secs': self.max,
+            'last_secs': self.last
+        }
+
+
+class Command(object):
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.response = None
+        self.error = None
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class Batch(object):
+    """
+    Queues bettercap commands and sends them in a single request chained with ';'.
+
+    Bettercap stops at the first failing command of a chain without telling which one it
+    was, so when the chain fails the commands are sent again one by one in order to map the
+    error to the right command. If the commands are not safe to repeat (idempotent=False),
+    the error is reported for every command of the batch instead.
+    """
+
+    def __init__(self, client, verbose_errors=True, idempotent=True):
+        self._client = client
+        self._verbose_errors = verbose_errors
+        self._idempotent = idempotent
+        self._queue = []
+
+    def add(self, command):
+        cmd = Command(command)
+        self._queue.append(cmd)
+        return cmd
+
+    def send(self):
+        queue, self._queue = self._queue, []
+        if len(queue) == 0:
+            return queue
+
+        if len(queue) == 1:
+            cmd = queue[0]
+            try:
+                cmd.response = self._client.run(cmd.cmd, verbose_errors=self._verbose_errors)
+            except Exception as e:
+                cmd.error = e
+            return queue
+
+        try:
+            response = self._client.run('; '.join(cmd.cmd for cmd in queue), verbose_errors=False)
+            for cmd in queue:
+                cmd.response = response
+        except requests.exceptions.RequestException as e:
+            for cmd in queue:
+                cmd.error = e
+        except Exception as e:
+            if not self._idempotent:
+                if self._verbose_errors:
+                    logging.info(e)
+                for cmd in queue:
+                    cmd.error = e
+            else:
+                for cmd in queue:
+                    try:
+                        cmd.response = self._client.run(cmd.cmd, verbose_errors=self._verbose_errors)
+                    except Exception as e:
+                        cmd.error = e
+
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            # behave like a sequence of run() calls
+            for cmd in self.send():
+                cmd.result()
+
+
 class Client(object):
-    def __init__(self, hostname='localhost', scheme='http', port=8081, username='user', password='pass'):
+    def __init__(self, hostname='localhost', scheme='http', port=8081, username='user', password='pass',
+                 connect_timeout=5.0, read_timeout=30.0, max_retries=3, backoff=0.1, pool_size=4):
         self.hostname = hostname
         self.scheme = scheme
         self.port = port
         self.username = username
         self.password = password
         self.url = "%s://%s:%d/api" % (scheme, hostname, port)
+        self.websocket = "%s://%s:%s@%s:%d/api" % ('wss' if scheme == 'https' else 'ws', username, password,
+                                                    hostname, port)
         self.auth = HTTPBasicAuth(username, password)
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # one keep-alive session shared by the event poller, the main loop and the plugins,
+        # so that we don't pay for a new connection for every single api call
+        self._http = requests.Session()
+        self._http.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self._http.mount("%s://" % scheme, adapter)
+
+        self._latency_lock = threading.Lock()
+        self._latency = {}
+        # identity of the last event handed to a consumer and of the most recent ones
+        self._events_cursor = None
+        self._events_seen = collections.deque(maxlen=1024)
+        self._events_seen_ids = set()
+
+    def _track(self, endpoint, elapsed, error=False):
+        timing.observe(timing.BETTERCAP, endpoint, elapsed)
+        with self._latency_lock:
+            if endpoint not in self._latency:
+                self._latency[endpoint] = Latency()
+            self._latency[endpoint].track(elapsed, error)
+
+    def latency(self):
+        with self._latency_lock:
+            return {endpoint: lat.data() for endpoint, lat in self._latency.items()}
+
+    def _request(self, method, path, **kwargs):
+        endpoint = "%s %s" % (method, path)
+        url = "%s%s" % (self.url, path)
+        attempt = 0
+
+        while True:
+            started = time.monotonic()
+            try:
+                r = self._http.request(method, url, timeout=self.timeout, **kwargs)
+                self._track(endpoint, time.monotonic() - started)
+                return r
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._track(endpoint, time.monotonic() - started, error=True)
+                # once the request has been sent, bettercap might have executed the command already
+                retriable = method == 'GET' or not_sent(e)
+                if not retriable or attempt >= self.max_retries:
+                    raise
+
+                # exponential backoff with full jitter
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                attempt += 1
+                logging.debug("%s failed (%s), retrying in %.2fs (%d/%d) ...", endpoint, e, delay, attempt,
+                              self.max_retries)
+                time.sleep(delay)
 
     def session(self):
-        r = requests.get("%s/session" % self.url, auth=self.auth)
+        r = self._request('GET', '/session')
         return decode(r)
 
     def events(self):
-        r = requests.get("%s/events" % self.url, auth=self.auth)
+        r = self._request('GET', '/events')
         return decode(r)
 
     def run(self, command, verbose_errors=True):
-        r = requests.post("%s/session" % self.url, auth=self.auth, json={'cmd': command})
+        r = self._request('POST', '/session', json={'cmd': command})
         return decode(r, verbose_errors=verbose_errors)
+
+    def batch(self, verbose_errors=True, idempotent=True):
+        return Batch(self, verbose_errors=verbose_errors, idempotent=idempotent)
+
+    def poll_events(self):
+        events = self.events()
+        start = 0
+        # bettercap returns its whole events buffer, look for the last event we've already
+        # seen starting from the end so that only new events are returned
+        if self._events_cursor is not None:
+            for i in range(len(events) - 1, -1, -1):
+                if event_id(events[i]) == self._events_cursor:
+                    start = i + 1
+                    break
+        # if the buffer has been cleared or rotated past the cursor, _dispatch
+        # will skip whatever has been handled already
+        return events[start:]
+
+    def _dispatch(self, consumer, events):
+        for event in events:
+            eid = event_id(event)
+            self._events_cursor = eid
+            if eid in self._events_seen_ids:
+                continue
+            if len(self._events_seen) == self._events_seen.maxlen:
+                self._events_seen_ids.discard(self._events_seen[0])
+            self._events_seen.append(eid)
+            self._events_seen_ids.add(eid)
+            try:
+                consumer(event)
+            except Exception as e:
+                logging.error("error while handling event %s: %s", event.get('tag'), e)
+                logging.debug(e, exc_info=True)
+
+    async def _stream(self, consumer, on_connected):
+        async with websockets.connect("%s/events" % self.websocket, ping_interval=60, ping_timeout=90) as ws:
+            on_connected()
+            # catch up with anything that happened while we were not connected
+            self._dispatch(consumer, self.poll_events())
+            async for msg in ws:
+                self._dispatch(consumer, [json.loads(msg)])
+
+    def stream_events(self, consumer, use_websocket=True, poll_interval=1.0, max_backoff=30.0):
+        """
+        Blocks forever, passing every new bettercap event to consumer as soon as it's received.
+
+        Events are streamed from the websocket api when available, the connection is
+        reestablished with exponential backoff whenever it drops and, meanwhile or if
+        websockets can't be used at all, the events buffer is polled every poll_interval seconds.
+        """
+        if use_websocket and websockets is None:
+            logging.warning("websockets module not available, polling events every %.1fs", poll_interval)
+            use_websocket = False
+
+        attempt = 0
+        while True:
+            if use_websocket:
+                def on_connected():
+                    nonlocal attempt
+                    logging.debug("connected to %s/events", self.url)
+                    attempt = 0
+
+                try:
+                    asyncio.run(self._stream(consumer, on_connected))
+                except Exception as e:
+                    logging.debug("events stream error: %s", e)
+
+                delay = min(max_backoff, poll_interval * (2 ** attempt))
+                attempt += 1
+                logging.debug("reconnecting to the events stream in %.1fs ...", delay)
+            else:
+                delay = poll_interval
+
+            # until the stream is back, keep consuming events by polling
+            deadline = time.monotonic() + delay
+            while True:
+                try:
+                    self._dispatch(consumer, self.poll_events())
+                except Exception as e:
+                    logging.debug("error while polling events: %s", e)
+
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                time.sleep(min(poll_interval, left))
+
+
+class SessionCache(object):
+    def __init__(self, fetch, ttl=1.0):
+        self._fetch = fetch
+        self._cond = threading.Condition()
+        self._session = None
+        self._views = {}
+        self._fetched_at = 0
+        self._in_flight = False
+        self._generation = 0
+        self._error = None
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+
+    def get(self, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        with self._cond:
+            while True:
+                if self._session is not None and time.monotonic() - self._fetched_at <= max_age:
+                    self.hits += 1
+                    return self._session
+
+                if not self._in_flight:
+                    break
+
+                # somebody else is already fetching it, share the result
+                self.waits += 1
+                generation = self._generation
+                while self._in_flight:
+                    self._cond.wait()
+                if self._generation != generation and self._error is not None:
+                    raise self._error
+
+            self._in_flight = True
+            self.misses += 1
+
+        session = None
+        error = None
+        try:
+            session = self._fetch()
+            return session
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._cond:
+                if error is None:
+                    self._session = session
+                    self._views = {}
+                    self._fetched_at = time.monotonic()
+                self._error = error
+                self._in_flight = False
+                self._generation += 1
+                self._cond.notify_all()
+
+    def invalidate(self):
+        with self._cond:
+            self._fetched_at = 0
+
+    def _view(self, name, build):
+        session = self.get()
+        with self._cond:
+            # views are built once per snapshot
+            if self._session is session and name in self._views:
+                return self._views[name]
+        view = build(session)
+        with self._cond:
+            if self._session is session:
+                self._views[name] = view
+        return view
+
+    def aps(self):
+        return self._view('aps', lambda s: s['wifi']['aps'])
+
+    def modules(self):
+        return self._view('modules', lambda s: {m['name']: m for m in s['modules']})
+
+    def interfaces(self):
+        return self._view('interfaces', lambda s: {i['name']: i for i in s['interfaces']})
+
+    def index(self):
+        return self._view('index', lambda s: AccessPointIndex(s['wifi']['aps']))
+
+    def gps(self):
+        return self._view('gps', lambda s: s['gps'])
+
+    def stats(self):
+        with self._cond:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'ttl': self.ttl,
+                'age': time.monotonic() - self._fetched_at if self._session is not None else None
+            }
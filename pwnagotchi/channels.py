@@ -0,0 +1,152 @@
+import time
+import random
+import threading
+
+
+class ChannelStats(object):
+    def __init__(self, channel):
+        self.channel = channel
+        self.visits = 0
+        # total seconds spent on this channel
+        self.dwell = 0.0
+        self.handshakes = 0
+        self.misses = 0
+        # exponentially weighted averages, per visit
+        self.avg_handshakes_per_sec = 0.0
+        self.avg_new_stations = 0.0
+        self.avg_misses = 0.0
+        # stations seen during the last visit
+        self.stations = set()
+
+    def data(self):
+        return {
+            'visits': self.visits,
+            'dwell_secs': self.dwell,
+            'handshakes': self.handshakes,
+            'misses': self.misses,
+            'avg_handshakes_per_sec': self.avg_handshakes_per_sec,
+            'avg_new_stations': self.avg_new_stations,
+            'avg_misses': self.avg_misses
+        }
+
+
+class ChannelScheduler(object):
+    def __init__(self, exploration=0.1, decay=0.8, min_dwell_factor=0.5, max_dwell_factor=2.0):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._plan = []
+        self._scores = {}
+        self._current = None
+        self._entered_at = 0
+        self._visit_handshakes = 0
+        self._visit_misses = 0
+        self._visit_new_stations = 0
+        self.exploration = exploration
+        self.decay = decay
+        self.min_dwell_factor = min_dwell_factor
+        self.max_dwell_factor = max_dwell_factor
+
+    def _stats_for(self, channel):
+        if channel not in self._stats:
+            self._stats[channel] = ChannelStats(channel)
+        return self._stats[channel]
+
+    def _ewma(self, avg, value, first):
+        return value if first else (self.decay * avg) + ((1.0 - self.decay) * value)
+
+    def _score(self, channel, aps):
+        stats = self._stats.get(channel)
+        num_stations = sum(len(ap['clients']) for ap in aps)
+        # what we can interact with right now ...
+        targets = len(aps) + num_stations
+        if stats is None or stats.visits == 0:
+            return float(targets)
+        # ... weighted by how this channel performed so far, smoothed so that
+        # a channel with no captures yet is not excluded forever
+        yield_factor = 1.0 + (stats.avg_handshakes_per_sec * 60.0) + (stats.avg_new_stations / (1.0 + targets))
+        return targets * yield_factor / (1.0 + stats.avg_misses)
+
+    def plan(self, grouped):
+        """
+        Given a list of (channel, access points) returns the order in which channels should be visited:
+        by expected yield, with a random channel picked instead of the best one in exploration share of cases.
+        """
+        with self._lock:
+            scores = {ch: self._score(ch, aps) for ch, aps in grouped}
+            remaining = sorted(grouped, key=lambda kv: scores[kv[0]], reverse=True)
+            plan = []
+            while remaining:
+                idx = random.randrange(len(remaining)) if random.random() < self.exploration else 0
+                plan.append(remaining.pop(idx))
+
+            self._scores = scores
+            self._plan = [ch for ch, _ in plan]
+            return plan
+
+    def dwell(self, channel, wait):
+        with self._lock:
+            if wait <= 0 or not self._scores or channel not in self._scores:
+                return wait
+            mean = sum(self._scores.values()) / len(self._scores)
+            if mean <= 0:
+                return wait
+            factor = min(self.max_dwell_factor, max(self.min_dwell_factor, self._scores[channel] / mean))
+            # whole seconds, like the rest of the timings
+            return max(1, int(round(wait * factor)))
+
+    def _close_visit(self, now):
+        if self._current is None:
+            return
+
+        stats = self._stats_for(self._current)
+        dwell = max(now - self._entered_at, 1e-3)
+        first = stats.visits == 0
+
+        stats.visits += 1
+        stats.dwell += dwell
+        stats.handshakes += self._visit_handshakes
+        stats.misses += self._visit_misses
+        stats.avg_handshakes_per_sec = self._ewma(stats.avg_handshakes_per_sec, self._visit_handshakes / dwell, first)
+        stats.avg_new_stations = self._ewma(stats.avg_new_stations, self._visit_new_stations, first)
+        stats.avg_misses = self._ewma(stats.avg_misses, self._visit_misses, first)
+
+        self._current = None
+
+    def on_channel(self, channel, stations=()):
+        now = time.time()
+        with self._lock:
+            self._close_visit(now)
+            if not channel:
+                # recon on every channel
+                return
+
+            stats = self._stats_for(channel)
+            stations = set(stations)
+            self._visit_new_stations = len(stations - stats.stations)
+            stats.stations = stations
+            self._visit_handshakes = 0
+            self._visit_misses = 0
+            self._current = channel
+            self._entered_at = now
+
+    def on_handshake(self, channel=None):
+        with self._lock:
+            if channel is None or channel == self._current:
+                if self._current is not None:
+                    self._visit_handshakes += 1
+            else:
+                self._stats_for(channel).handshakes += 1
+
+    def on_miss(self):
+        with self._lock:
+            if self._current is not None:
+                self._visit_misses += 1
+
+    def state(self):
+        with self._lock:
+            return {
+                'current': self._current,
+                'plan': list(self._plan),
+                'scores': dict(self._scores),
+                'channels': {ch: stats.data() for ch, stats in sorted(self._stats.items())}
+            }
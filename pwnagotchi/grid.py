@@ -62,7 +62,7 @@ def closest_peer():
     return all[0] if len(all) else None
 
 
-def update_data(last_session):
+def update_data(last_session, history=None):
     brain = {}
     try:
         with open('/root/brain.json') as fp:
@@ -83,6 +83,7 @@ def update_data(last_session):
             'handshakes': last_session.handshakes,
             'peers': last_session.peers,
         },
+        'history': history or {},
         'uname': subprocess.getoutput("uname -a"),
         'brain': brain,
         'version': pwnagotchi.__version__
@@ -0,0 +1,227 @@
+import os
+import re
+import time
+import struct
+import logging
+import threading
+import _thread
+import ctypes
+import ctypes.util
+
+# bettercap saves handshakes as <essid>_<bssid without colons>.pcap
+PCAP_BSSID_PARSER = re.compile(r'_([0-9a-fA-F]{12})\.pcap$')
+
+
+def bssid_from_filename(filename):
+    m = PCAP_BSSID_PARSER.search(os.path.basename(filename))
+    if m is None:
+        return None
+    raw = m.group(1).lower()
+    return ':'.join(raw[i:i + 2] for i in range(0, 12, 2))
+
+
+class HandshakeRegistry(object):
+    def __init__(self):
+        self._aps = set()
+        self._stations = set()
+
+    def __len__(self):
+        return len(self._aps)
+
+    def add(self, ap_mac, sta_mac=None):
+        self._aps.add(ap_mac.lower())
+        if sta_mac:
+            self._stations.add(sta_mac.lower())
+
+    def has(self, mac):
+        mac = mac.lower()
+        return mac in self._aps or mac in self._stations
+
+    def seed(self, filenames):
+        num = 0
+        for filename in filenames:
+            bssid = bssid_from_filename(filename)
+            if bssid is not None:
+                self.add(bssid)
+                num += 1
+        logging.debug("loaded %d handshakes", num)
+        return num
+
+
+# see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_EVENT_HEADER = struct.Struct('iIII')
+IN_WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | \
+                IN_DELETE_SELF | IN_MOVE_SELF
+
+
+class Inotify(object):
+    def __init__(self, path, mask=IN_WATCH_MASK):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, "inotify_add_watch failed for %s" % path)
+
+    def read(self):
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, size = IN_EVENT_HEADER.unpack_from(data, offset)
+            offset += IN_EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + size].rstrip(b'\0'))
+            offset += size
+            yield mask, name
+
+    def close(self):
+        os.close(self._fd)
+
+
+class HandshakeCatalog(object):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+    def __init__(self, path, poll_interval=10.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._files = {}
+        self._listeners = []
+
+    @property
+    def total(self):
+        return len(self._files)
+
+    def files(self):
+        with self._lock:
+            return [os.path.join(self.path, name) for name in self._files]
+
+    def info(self, filename):
+        return self._files.get(os.path.basename(filename))
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def start(self):
+        self._files = self._scan()
+        logging.debug("found %d handshakes in %s", len(self._files), self.path)
+        _thread.start_new_thread(self._worker, ())
+
+    @staticmethod
+    def _is_handshake(name):
+        return name.endswith('.pcap')
+
+    def _stat(self, name):
+        try:
+            st = os.stat(os.path.join(self.path, name))
+        except OSError:
+            return None
+
+        return {
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'bssid': bssid_from_filename(name)
+        }
+
+    def _scan(self):
+        files = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if self._is_handshake(entry.name):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files[entry.name] = {
+                        'size': st.st_size,
+                        'mtime': st.st_mtime,
+                        'bssid': bssid_from_filename(entry.name)
+                    }
+        return files
+
+    def _notify(self, change, name):
+        filename = os.path.join(self.path, name)
+        for callback in self._listeners:
+            try:
+                callback(change, filename)
+            except Exception as e:
+                logging.error("error while notifying handshake change for %s: %s", filename, e)
+                logging.debug(e, exc_info=True)
+
+    def _on_change(self, name, deleted=False):
+        info = None if deleted else self._stat(name)
+        with self._lock:
+            known = name in self._files
+            if info is None:
+                if not known:
+                    return
+                del self._files[name]
+                change = HandshakeCatalog.DELETED
+            else:
+                self._files[name] = info
+                change = HandshakeCatalog.UPDATED if known else HandshakeCatalog.CREATED
+
+        self._notify(change, name)
+
+    def _sync(self):
+        files = self._scan()
+        with self._lock:
+            current = self._files
+            self._files = files
+
+        for name in current.keys() - files.keys():
+            self._notify(HandshakeCatalog.DELETED, name)
+        for name, info in files.items():
+            if name not in current:
+                self._notify(HandshakeCatalog.CREATED, name)
+            elif info['mtime'] != current[name]['mtime'] or info['size'] != current[name]['size']:
+                self._notify(HandshakeCatalog.UPDATED, name)
+
+    def _watch(self):
+        try:
+            inotify = Inotify(self.path)
+        except Exception as e:
+            logging.warning("can't watch %s (%s), polling it every %.1fs", self.path, e, self.poll_interval)
+            return
+
+        logging.debug("watching %s for new handshakes", self.path)
+        try:
+            # something might have changed before the watch was in place
+            self._sync()
+            while True:
+                for mask, name in inotify.read():
+                    if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        logging.warning("%s is not being watched anymore", self.path)
+                        return
+                    elif mask & IN_Q_OVERFLOW:
+                        self._sync()
+                    elif self._is_handshake(name):
+                        self._on_change(name, deleted=bool(mask & (IN_DELETE | IN_MOVED_FROM)))
+        except OSError as e:
+            logging.warning("error while watching %s: %s", self.path, e)
+        finally:
+            inotify.close()
+
+    def _worker(self):
+        self._watch()
+        # inotify not available or the watch has been lost, fall back to polling
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self._sync()
+            except Exception as e:
+                logging.debug("error while scanning %s: %s", self.path, e)
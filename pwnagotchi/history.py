@@ -0,0 +1,92 @@
+import time
+import threading
+from collections import OrderedDict
+
+from pwnagotchi.mesh.wifi import mac_to_int
+
+
+def _key(mac):
+    try:
+        # 48 bits integers are way smaller than the 17 characters strings
+        return mac_to_int(mac)
+    except ValueError:
+        return mac
+
+
+class InteractionHistory(object):
+    """
+    Bounded number of interactions per MAC address.
+
+    Entries are kept in least recently used order: when more than max_size addresses are
+    tracked the least recently used one is evicted, entries that are not touched for ttl
+    seconds are dropped and, if decay is greater than zero, every decay seconds without
+    interactions the counter of an entry goes down by one, so the address can be retried.
+    """
+
+    def __init__(self, max_size=10000, ttl=0, decay=0):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.decay = decay
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        if self.ttl > 0:
+            while self._entries:
+                key, (_, updated_at) = next(iter(self._entries.items()))
+                if now - updated_at < self.ttl:
+                    break
+                del self._entries[key]
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _decayed(self, count, updated_at, now):
+        if self.decay > 0:
+            count = max(0, count - int((now - updated_at) / self.decay))
+        return count
+
+    def track(self, mac):
+        now = time.time()
+        key = _key(mac)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            count = self._decayed(entry[0], entry[1], now) + 1 if entry is not None else 1
+            self._entries[key] = (count, now)
+            self._expire(now)
+        return count
+
+    def get(self, mac):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(_key(mac))
+            if entry is None or (self.ttl > 0 and now - entry[1] >= self.ttl):
+                return 0
+            return self._decayed(entry[0], entry[1], now)
+
+    def restore(self, mac, count, updated_at):
+        key = mac if isinstance(mac, int) else _key(mac)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (count, updated_at)
+            self._expire(time.time())
+
+    def data(self):
+        with self._lock:
+            return [[key, count, updated_at] for key, (count, updated_at) in self._entries.items()]
+
+    def load(self, data):
+        now = time.time()
+        with self._lock:
+            self._entries.clear()
+            if isinstance(data, dict):
+                # old recovery files: mac -> interactions
+                for mac, count in data.items():
+                    self._entries[_key(mac)] = (count, now)
+            else:
+                for key, count, updated_at in sorted(data, key=lambda e: e[2]):
+                    self._entries[key] = (count, updated_at)
+            self._expire(now)
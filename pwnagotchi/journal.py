@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import logging
+import threading
+import _thread
+
+
+class Journal(object):
+    """
+    Append-only log of json records.
+
+    Records are written as soon as they're appended but only fsync'ed every sync_interval
+    seconds, while every compact_every records the whole journal is replaced by a single
+    snapshot record built by the snapshot callback. Both happen on a background thread, so
+    appending never waits for the disk. A journal closed cleanly ends with a closed record and
+    is not replayed.
+    """
+
+    SNAPSHOT = 'snapshot'
+    CLOSED = 'closed'
+
+    def __init__(self, path, snapshot, sync_interval=5.0, compact_every=5000):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self._snapshot = snapshot
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._fp = None
+        self._closed = False
+        self._records = 0
+        self._dirty = False
+        # records appended while compacting, they go after the snapshot
+        self._pending = None
+
+    def replay(self, max_age=0):
+        records = []
+        if not os.path.exists(self.path):
+            return records
+
+        if max_age > 0 and time.time() - os.path.getmtime(self.path) > max_age:
+            logging.info("%s is older than %ds, starting a new session", self.path, max_age)
+            return records
+
+        with open(self.path, 'rt') as fp:
+            for line in fp:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # most likely the last record was truncated by a power loss
+                    logging.warning("skipping corrupted record in %s: %s", self.path, line[:64])
+                    continue
+
+                # a snapshot replaces everything that was written before it
+                if record.get('t') == Journal.SNAPSHOT:
+                    records = []
+                records.append(record)
+
+        if records and records[-1].get('t') == Journal.CLOSED:
+            logging.info("%s has been closed cleanly, starting a new session", self.path)
+            return []
+
+        return records
+
+    def open(self):
+        self.compact()
+        _thread.start_new_thread(self._syncer, ())
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._fp is None:
+                return
+            self._fp.write(line)
+            if self._pending is not None:
+                self._pending.append(line)
+            self._records += 1
+            self._dirty = True
+            compact = self._records >= self.compact_every
+
+        if compact:
+            self._wake.set()
+
+    def _sync(self):
+        # called with the lock held
+        if self._fp is not None and self._dirty:
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._dirty = False
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _syncer(self):
+        while True:
+            # woken up early when it's time to compact
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            try:
+                if self._records >= self.compact_every:
+                    self.compact()
+                else:
+                    self.sync()
+            except Exception as e:
+                logging.error("error while syncing %s: %s", self.path, e)
+
+    def compact(self):
+        temp = "%s.tmp" % self.path
+
+        with self._lock:
+            if self._closed:
+                return
+            record = self._snapshot()
+            # the journal keeps growing until the snapshot replaces it
+            self._pending = []
+
+        try:
+            record['t'] = Journal.SNAPSHOT
+            with open(temp, 'wt') as fp:
+                fp.write(json.dumps(record, separators=(',', ':')) + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if self._closed:
+                # the closed record is in the old journal
+                os.remove(temp)
+                return
+
+            if self._fp is not None:
+                self._fp.close()
+            os.replace(temp, self.path)
+
+            self._fp = open(self.path, 'at')
+            self._fp.writelines(pending)
+            self._records = len(pending)
+            self._dirty = len(pending) > 0
+
+        logging.debug("compacted %s", self.path)
+
+    def close(self, clean=False):
+        with self._lock:
+            self._closed = True
+            if self._fp is not None:
+                if clean:
+                    self._fp.write(json.dumps({'t': Journal.CLOSED}) + '\n')
+                    self._dirty = True
+                self._sync()
+                self._fp.close()
+                self._fp = None
@@ -1,30 +1,380 @@
+import io
 import hashlib
 import time
 import re
 import os
+import json
+import atexit
 import logging
 import shutil
 import gzip
+import queue
+import threading
+from collections import deque
 from datetime import datetime
 
 from pwnagotchi.voice import Voice
 from pwnagotchi.mesh.peer import Peer
-from file_read_backwards import FileReadBackwards
 
 LAST_SESSION_FILE = '/root/.pwnagotchi-last-session'
 
 
-class LastSession(object):
-    EPOCH_TOKEN = '[epoch '
-    EPOCH_PARSER = re.compile(r'^.+\[epoch (\d+)\] (.+)')
-    EPOCH_DATA_PARSER = re.compile(r'([a-z_]+)=([^\s]+)')
-    TRAINING_TOKEN = ' training epoch '
+def summary_path(log_path):
+    return "%s.session" % os.path.splitext(log_path)[0]
+
+
+class SessionSummary(object):
+    """
+    Counters of the running session, updated as it goes and written next to the log every
+    save_interval seconds and at exit, so that LastSession can load them without parsing the log.
+    """
+
+    def __init__(self, path, save_interval=30):
+        self._lock = threading.Lock()
+        self._save_interval = save_interval
+        self._saved_at = 0
+        self._started = False
+        self.path = path
+        self.data = {}
+
+    def start(self):
+        now = time.time()
+        with self._lock:
+            self.data = {
+                'session_id': hashlib.md5(('%f-%d' % (now, os.getpid())).encode()).hexdigest(),
+                'started_at': now,
+                'updated_at': now,
+                'epochs': 0,
+                'train_epochs': 0,
+                'deauthed': 0,
+                'associated': 0,
+                'handshakes': 0,
+                'peers': 0,
+                'last_peer': None,
+                'min_reward': None,
+                'max_reward': None,
+                'tot_reward': 0.0
+            }
+            self._started = True
+        # so that SessionParser gives this session the same id when reading it from the log
+        logging.info("%s%s", SessionParser.SESSION_TOKEN, self.data['session_id'])
+        atexit.register(self.save)
+        self.save()
+
+    def _update(self, fn):
+        with self._lock:
+            if not self._started:
+                return
+            fn(self.data)
+            self.data['updated_at'] = time.time()
+            due = self.data['updated_at'] - self._saved_at >= self._save_interval
+        if due:
+            self.save()
+
+    def on_epoch(self, epoch_data):
+        def update(data):
+            reward = epoch_data['reward']
+            data['epochs'] += 1
+            data['deauthed'] += epoch_data['num_deauths']
+            data['associated'] += epoch_data['num_associations']
+            data['handshakes'] += epoch_data['num_handshakes']
+            data['tot_reward'] += reward
+            data['min_reward'] = reward if data['min_reward'] is None else min(data['min_reward'], reward)
+            data['max_reward'] = reward if data['max_reward'] is None else max(data['max_reward'], reward)
+
+        self._update(update)
+
+    def on_training_epoch(self):
+        def update(data):
+            data['train_epochs'] += 1
+
+        self._update(update)
+
+    def on_peer(self, peer):
+        def update(data):
+            data['peers'] += 1
+            data['last_peer'] = {
+                'session_id': peer.session_id,
+                'channel': peer.last_channel,
+                'rssi': peer.rssi,
+                'advertisement': peer.adv
+            }
+
+        self._update(update)
+
+    def save(self):
+        with self._lock:
+            if not self._started:
+                return
+            data = json.dumps(self.data)
+            self._saved_at = time.time()
+
+        temp = "%s.tmp" % self.path
+        try:
+            with open(temp, 'wt') as fp:
+                fp.write(data)
+            os.replace(temp, self.path)
+        except Exception as e:
+            logging.error("can't save session summary to %s: %s", self.path, e)
+
+
+def open_log(path, offset=0):
+    """
+    Opens a log, or a gzip compressed rotated one, as text starting from the given byte offset.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+
+    fp = open(path, 'rb')
+    fp.seek(offset)
+    return io.TextIOWrapper(fp, encoding='utf-8', errors='replace')
+
+
+def last_session_offset(path, token=b'connecting to http', chunk_size=65536):
+    """
+    Returns the byte offset of the line where the last session of a plain log starts, reading
+    it backwards a chunk at a time, or 0 if it's not there.
+    """
+    with open(path, 'rb') as fp:
+        end = fp.seek(0, os.SEEK_END)
+        found = -1
+        tail = b''
+        while end > 0 and found < 0:
+            start = max(0, end - chunk_size)
+            fp.seek(start)
+            # keep enough of the previous chunk for a token across the boundary
+            buf = fp.read(end - start) + tail
+            idx = buf.rfind(token)
+            if idx >= 0:
+                found = start + idx
+            tail = buf[:len(token)]
+            end = start
+
+        if found < 0:
+            return 0
+
+        # back to the beginning of that line
+        end = found
+        while end > 0:
+            start = max(0, end - chunk_size)
+            fp.seek(start)
+            idx = fp.read(end - start).rfind(b'\n')
+            if idx >= 0:
+                return start + idx + 1
+            end = start
+        return 0
+
+
+class SessionParser(object):
+    """
+    Single pass, streaming parser of the session statistics in a log.
+
+    Lines must be fed in order: every time a session starts the counters are reset, after
+    handing the previous session to on_session, so that at the end the parser holds the last one.
+    Timestamps are decoded once per minute, each line is dispatched on the first characters
+    of its message and duplicated lines are detected by their hash.
+    """
     START_TOKEN = 'connecting to http'
+    SESSION_TOKEN = 'session id '
     DEAUTH_TOKEN = 'deauthing '
     ASSOC_TOKEN = 'sending association frame to '
     HANDSHAKE_TOKEN = '!!! captured new handshake '
+    TRAINING_TOKEN = ' training epoch '
+    EPOCH_TOKEN = '[epoch '
+    REWARD_TOKEN = ' reward='
     PEER_TOKEN = 'detected unit '
+    PEER_PARSER = re.compile(
+        r'detected unit (.+)@(.+) \(v.+\) on channel \d+ \(([\d\-]+) dBm\) \[sid:(.+) pwnd_tot:(\d+) uptime:(\d+)\]')
+
+    # enough for a couple of months of logs
+    MAX_CACHED_MINUTES = 100000
+
+    def __init__(self, on_session=None):
+        self._on_session = on_session
+        self._minutes = {}
+        self._handlers = {
+            SessionParser.START_TOKEN[:4]: self._on_start,
+            SessionParser.SESSION_TOKEN[:4]: self._on_session_id,
+            SessionParser.DEAUTH_TOKEN[:4]: self._on_deauth,
+            SessionParser.ASSOC_TOKEN[:4]: self._on_assoc,
+            SessionParser.HANDSHAKE_TOKEN[:4]: self._on_handshake,
+            '[ai]': self._on_ai,
+            SessionParser.EPOCH_TOKEN[:4]: self._on_epoch,
+            SessionParser.PEER_TOKEN[:4]: self._on_peer,
+        }
+        self.reset()
+
+    def reset(self, first_line=None):
+        self.first_line = first_line
+        self.session_id = None
+        self.lines = 0
+        self.started_at = None
+        self.stopped_at = None
+        self.deauthed = 0
+        self.associated = 0
+        self.handshakes = 0
+        self.epochs = 0
+        self.train_epochs = 0
+        self.peers = 0
+        self.last_peer = None
+        self.min_reward = None
+        self.max_reward = None
+        self.tot_reward = 0.0
+        self._seen = set()
+        self._peers = {}
+
+    def _timestamp(self, line):
+        # [2019-10-01 12:34:56,789] [INFO] ...
+        minute = line[1:17]
+        base = self._minutes.get(minute)
+        if base is None:
+            if len(self._minutes) >= SessionParser.MAX_CACHED_MINUTES:
+                self._minutes = {}
+            base = time.mktime(datetime.strptime(minute, '%Y-%m-%d %H:%M').timetuple())
+            self._minutes[minute] = base
+        return base + int(line[18:20])
+
+    def _first_time(self, msg):
+        h = hash(msg)
+        if h in self._seen:
+            return False
+        self._seen.add(h)
+        return True
+
+    def _on_start(self, line, msg):
+        if msg.startswith(SessionParser.START_TOKEN):
+            self.close()
+            self.reset(line)
+
+    def _on_session_id(self, line, msg):
+        if msg.startswith(SessionParser.SESSION_TOKEN) and self.session_id is None:
+            self.session_id = msg[len(SessionParser.SESSION_TOKEN):]
+
+    def _on_deauth(self, line, msg):
+        if msg.startswith(SessionParser.DEAUTH_TOKEN) and self._first_time(msg):
+            self.deauthed += 1
+
+    def _on_assoc(self, line, msg):
+        if msg.startswith(SessionParser.ASSOC_TOKEN) and self._first_time(msg):
+            self.associated += 1
+
+    def _on_handshake(self, line, msg):
+        if msg.startswith(SessionParser.HANDSHAKE_TOKEN) and self._first_time(msg):
+            self.handshakes += 1
+
+    def _on_ai(self, line, msg):
+        if SessionParser.TRAINING_TOKEN in msg:
+            self.train_epochs += 1
+
+    def _on_epoch(self, line, msg):
+        if not msg.startswith(SessionParser.EPOCH_TOKEN):
+            return
+
+        self.epochs += 1
+        idx = msg.find(SessionParser.REWARD_TOKEN)
+        if idx >= 0:
+            idx += len(SessionParser.REWARD_TOKEN)
+            end = msg.find(' ', idx)
+            reward = float(msg[idx:] if end < 0 else msg[idx:end])
+            self.tot_reward += reward
+            if self.min_reward is None or reward < self.min_reward:
+                self.min_reward = reward
+            if self.max_reward is None or reward > self.max_reward:
+                self.max_reward = reward
+
+    def _on_peer(self, line, msg):
+        m = SessionParser.PEER_PARSER.match(msg)
+        if not m:
+            return
+
+        name, pubkey, rssi, sid, pwnd_tot, uptime = m.groups()
+        if pubkey not in self._peers:
+            self.last_peer = Peer({
+                'session_id': sid,
+                'channel': 1,
+                'rssi': int(rssi),
+                'identity': pubkey,
+                'advertisement': {
+                    'name': name,
+                    'pwnd_tot': int(pwnd_tot)
+                }})
+            self.peers += 1
+            self._peers[pubkey] = self.last_peer
+        else:
+            self._peers[pubkey].adv['pwnd_tot'] = pwnd_tot
+
+    def feed(self, line):
+        if not line or line[0] != '[':
+            return
+
+        try:
+            timestamp = self._timestamp(line)
+        except ValueError:
+            # not a log line, or a truncated one
+            return
+
+        # the message follows the timestamp and the level
+        idx = line.find('] ', line.find('] ') + 2)
+        msg = line[idx + 2:].rstrip() if idx >= 0 else ''
+
+        handler = self._handlers.get(msg[:4])
+        if handler is not None:
+            try:
+                handler(line, msg)
+            except Exception as e:
+                logging.error("error parsing line '%s': %s" % (line.rstrip(), e))
+
+        if self.first_line is None:
+            self.first_line = line
+        if self.started_at is None:
+            self.started_at = timestamp
+        self.stopped_at = timestamp
+        self.lines += 1
+
+    def close(self):
+        """
+        Hands the current session, if any, to on_session.
+        """
+        if self.lines > 0 and self._on_session is not None:
+            self._on_session(self.stats())
+
+    def stats(self):
+        session_id = self.session_id
+        if session_id is None:
+            # logged before sessions had an id
+            first_line = (self.first_line or 'Initial Session').strip()
+            session_id = hashlib.md5(first_line.encode()).hexdigest()
+        return {
+            'session_id': session_id,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+            'duration': (self.stopped_at - self.started_at) if self.started_at is not None else 0,
+            'lines': self.lines,
+            'deauthed': self.deauthed,
+            'associated': self.associated,
+            'handshakes': self.handshakes,
+            'epochs': self.epochs,
+            'train_epochs': self.train_epochs,
+            'peers': self.peers,
+            'last_peer': self.last_peer,
+            'min_reward': self.min_reward,
+            'max_reward': self.max_reward,
+            'avg_reward': self.tot_reward / (self.epochs if self.epochs else 1)
+        }
+
+    def parse(self, path, offset=0, progress=None, progress_every=100):
+        """
+        Streams a log, or a rotated .gz one, through the parser and closes the last session.
+        """
+        with open_log(path, offset) as fp:
+            for line in fp:
+                self.feed(line)
+                if progress is not None and self.lines % progress_every == 0:
+                    progress(self.lines)
+        self.close()
+
 
+class LastSession(object):
     def __init__(self, config):
         self.config = config
         self.voice = Voice(lang=config['main']['lang'])
@@ -44,8 +394,7 @@ class LastSession(object):
         self.min_reward = 1000
         self.max_reward = -1000
         self.avg_reward = 0
-        self._peer_parser = re.compile(
-            'detected unit (.+)@(.+) \(v.+\) on channel \d+ \(([\d\-]+) dBm\) \[sid:(.+) pwnd_tot:(\d+) uptime:(\d+)\]')
+        self.summary_path = summary_path(self.path)
         self.parsed = False
 
     def _get_last_saved_session_id(self):
@@ -62,100 +411,23 @@ class LastSession(object):
             fp.write(self.last_session_id)
             self.last_saved_session_id = self.last_session_id
 
-    def _parse_datetime(self, dt):
-        dt = dt.split('.')[0]
-        dt = dt.split(',')[0]
-        dt = datetime.strptime(dt.split('.')[0], '%Y-%m-%d %H:%M:%S')
-        return time.mktime(dt.timetuple())
-
-    def _parse_stats(self):
-        self.duration = ''
-        self.duration_human = ''
-        self.deauthed = 0
-        self.associated = 0
-        self.handshakes = 0
-        self.epochs = 0
-        self.train_epochs = 0
-        self.peers = 0
-        self.last_peer = None
-        self.min_reward = 1000
-        self.max_reward = -1000
-        self.avg_reward = 0
-
-        started_at = None
-        stopped_at = None
-        cache = {}
-
-        for line in self.last_session:
-            parts = line.split(']')
-            if len(parts) < 2:
-                continue
-
-            try:
-                line_timestamp = parts[0].strip('[')
-                line = ']'.join(parts[1:])
-                stopped_at = self._parse_datetime(line_timestamp)
-                if started_at is None:
-                    started_at = stopped_at
-
-                if LastSession.DEAUTH_TOKEN in line and line not in cache:
-                    self.deauthed += 1
-                    cache[line] = 1
-
-                elif LastSession.ASSOC_TOKEN in line and line not in cache:
-                    self.associated += 1
-                    cache[line] = 1
-
-                elif LastSession.HANDSHAKE_TOKEN in line and line not in cache:
-                    self.handshakes += 1
-                    cache[line] = 1
-
-                elif LastSession.TRAINING_TOKEN in line:
-                    self.train_epochs += 1
-
-                elif LastSession.EPOCH_TOKEN in line:
-                    self.epochs += 1
-                    m = LastSession.EPOCH_PARSER.findall(line)
-                    if m:
-                        epoch_num, epoch_data = m[0]
-                        m = LastSession.EPOCH_DATA_PARSER.findall(epoch_data)
-                        for key, value in m:
-                            if key == 'reward':
-                                reward = float(value)
-                                self.avg_reward += reward
-                                if reward < self.min_reward:
-                                    self.min_reward = reward
-
-                                elif reward > self.max_reward:
-                                    self.max_reward = reward
-
-                elif LastSession.PEER_TOKEN in line:
-                    m = self._peer_parser.findall(line)
-                    if m:
-                        name, pubkey, rssi, sid, pwnd_tot, uptime = m[0]
-                        if pubkey not in cache:
-                            self.last_peer = Peer({
-                                'session_id': sid,
-                                'channel': 1,
-                                'rssi': int(rssi),
-                                'identity': pubkey,
-                                'advertisement': {
-                                    'name': name,
-                                    'pwnd_tot': int(pwnd_tot)
-                                }})
-                            self.peers += 1
-                            cache[pubkey] = self.last_peer
-                        else:
-                            cache[pubkey].adv['pwnd_tot'] = pwnd_tot
-            except Exception as e:
-                logging.error("error parsing line '%s': %s" % (line, e))
-
-        if started_at is not None:
-            self.duration = stopped_at - started_at
-            mins, secs = divmod(self.duration, 60)
-            hours, mins = divmod(mins, 60)
-        else:
-            hours = mins = secs = 0
+    def _set_stats(self, stats):
+        self.last_session_id = stats['session_id']
+        self.deauthed = stats['deauthed']
+        self.associated = stats['associated']
+        self.handshakes = stats['handshakes']
+        self.epochs = stats['epochs']
+        self.train_epochs = stats['train_epochs']
+        self.peers = stats['peers']
+        self.last_peer = stats['last_peer']
+        self.min_reward = stats['min_reward'] if stats['min_reward'] is not None else 1000
+        self.max_reward = stats['max_reward'] if stats['max_reward'] is not None else -1000
+        self.avg_reward = stats['avg_reward']
+        self._set_duration(stats['duration'])
+
+    def _set_duration(self, duration):
+        mins, secs = divmod(duration, 60)
+        hours, mins = divmod(mins, 60)
 
         self.duration = '%02d:%02d:%02d' % (hours, mins, secs)
         self.duration_human = []
@@ -167,46 +439,54 @@ class LastSession(object):
             self.duration_human.append('%d %s' % (secs, self.voice.hhmmss(secs, 's')))
 
         self.duration_human = ', '.join(self.duration_human)
-        self.avg_reward /= (self.epochs if self.epochs else 1)
+
+    def _load_summary(self):
+        try:
+            with open(self.summary_path, 'rt') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.warning("can't load session summary %s: %s", self.summary_path, e)
+            return False
+
+        self._set_stats({
+            'session_id': data['session_id'],
+            'deauthed': data['deauthed'],
+            'associated': data['associated'],
+            'handshakes': data['handshakes'],
+            'epochs': data['epochs'],
+            'train_epochs': data['train_epochs'],
+            'peers': data['peers'],
+            'last_peer': Peer(data['last_peer']) if data['last_peer'] else None,
+            'min_reward': data['min_reward'],
+            'max_reward': data['max_reward'],
+            'avg_reward': data['tot_reward'] / (data['epochs'] if data['epochs'] else 1),
+            'duration': data['updated_at'] - data['started_at']
+        })
+        return True
 
     def parse(self, ui, skip=False):
         if skip:
             logging.debug("skipping parsing of the last session logs ...")
+        elif self._load_summary():
+            logging.debug("loaded last session from %s", self.summary_path)
+            self.last_saved_session_id = self._get_last_saved_session_id()
         else:
             logging.debug("reading last session logs ...")
 
             ui.on_reading_logs()
 
-            lines = []
-
+            parser = SessionParser()
             if os.path.exists(self.path):
-                with FileReadBackwards(self.path, encoding="utf-8") as fp:
-                    for line in fp:
-                        line = line.strip()
-                        if line != "" and line[0] != '[':
-                            continue
-                        lines.append(line)
-                        if LastSession.START_TOKEN in line:
-                            break
-
-                        lines_so_far = len(lines)
-                        if lines_so_far % 100 == 0:
-                            ui.on_reading_logs(lines_so_far)
-
-                lines.reverse()
-
-            if len(lines) == 0:
-                lines.append("Initial Session");
+                parser.parse(self.path, last_session_offset(self.path), progress=ui.on_reading_logs)
 
             ui.on_reading_logs()
 
-            self.last_session = lines
-            self.last_session_id = hashlib.md5(lines[0].encode()).hexdigest()
-            self.last_saved_session_id = self._get_last_saved_session_id()
-
-            logging.debug("parsing last session logs (%d lines) ..." % len(lines))
+            logging.debug("parsed last session logs (%d lines) ..." % parser.lines)
 
-            self._parse_stats()
+            self._set_stats(parser.stats())
+            self.last_saved_session_id = self._get_last_saved_session_id()
         self.parsed = True
 
     def is_new(self):
@@ -222,18 +502,29 @@ def setup_logging(args, config):
 
     root.setLevel(logging.DEBUG if args.debug else logging.INFO)
 
+    handlers = []
     if filename:
-        # since python default log rotation might break session data in different files,
-        # we need to do log rotation ourselves
-        log_rotation(filename, cfg)
+        rotation = cfg['rotation']
+        if not rotation['enabled']:
+            file_handler = BufferedFileHandler(filename)
+        elif not rotation['size']:
+            raise Exception("log rotation is enabled but log.rotation.size was not specified")
+        else:
+            archiver = LogArchiver(filename, rotation['keep'], parse_max_size(rotation['max_total_size']))
+            file_handler = RotatingLogHandler(filename, parse_max_size(rotation['size']), archiver)
 
-        file_handler = logging.FileHandler(filename)
         file_handler.setFormatter(formatter)
-        root.addHandler(file_handler)
+        handlers.append(file_handler)
 
-    console_handler = logging.StreamHandler()
+    console_handler = BufferedStreamHandler()
     console_handler.setFormatter(formatter)
-    root.addHandler(console_handler)
+    handlers.append(console_handler)
+
+    # every thread just queues its records, a single one writes them
+    global _writer
+    _writer = LogWriter(handlers, cfg['writer']['flush_interval'], cfg['writer']['ring_size'])
+    _writer.start()
+    root.addHandler(_writer.handler())
 
     # https://stackoverflow.com/questions/24344045/how-can-i-completely-remove-any-logging-from-requests-module-in-python?noredirect=1&lq=1
     logging.getLogger("urllib3").propagate = False
@@ -242,23 +533,6 @@ def setup_logging(args, config):
     requests_log.propagate = False
 
 
-def log_rotation(filename, cfg):
-    rotation = cfg['rotation']
-    if not rotation['enabled']:
-        return
-    elif not os.path.isfile(filename):
-        return
-
-    stats = os.stat(filename)
-    # specify a maximum size to rotate ( format is 10/10B, 10K, 10M 10G )
-    if rotation['size']:
-        max_size = parse_max_size(rotation['size'])
-        if stats.st_size >= max_size:
-            do_rotate(filename, stats, cfg)
-    else:
-        raise Exception("log rotation is enabled but log.rotation.size was not specified")
-
-
 def parse_max_size(s):
     parts = re.findall(r'(^\d+)([bBkKmMgG]?)', s)
     if len(parts) != 1 or len(parts[0]) != 2:
@@ -278,24 +552,306 @@ def parse_max_size(s):
         return num
 
 
-def do_rotate(filename, stats, cfg):
-    base_path = os.path.dirname(filename)
-    name = os.path.splitext(os.path.basename(filename))[0]
-    archive_filename = os.path.join(base_path, "%s.gz" % name)
-    counter = 2
+class LogArchiver(object):
+    """
+    Compresses the rotated logs to name-<n>.gz in a low priority background thread, then
+    deletes the oldest archives until there are at most keep of them and they take at most
+    max_total_bytes (the most recent one is always kept).
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, filename, keep=10, max_total_bytes=0, nice=19):
+        self.filename = filename
+        self.folder = os.path.dirname(filename) or '.'
+        self.name = os.path.splitext(os.path.basename(filename))[0]
+        self.keep = keep
+        self.max_total_bytes = max_total_bytes
+        self.nice = nice
+        # name.gz is the first archive, then name-2.gz, name-3.gz, ... name-<n>.log while compressing
+        self._parser = re.compile(r'^%s(?:-(\d+))?\.(gz|log)$' % re.escape(self.name))
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._last = 1
+        threading.Thread(target=self._worker, name='log-archiver', daemon=True).start()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.folder):
+            m = self._parser.match(name)
+            if m is not None:
+                num, ext = m.groups()
+                if num is None and ext == 'log':
+                    # the live log
+                    continue
+                found.append((int(num) if num else 1, ext, os.path.join(self.folder, name)))
+        return found
+
+    def _archive_path(self, num):
+        return os.path.join(self.folder, "%s.gz" % self.name if num == 1 else "%s-%d.gz" % (self.name, num))
+
+    def next_path(self):
+        """
+        Returns where the live log should be moved to before being compressed.
+        """
+        with self._lock:
+            self._last = max([self._last] + [num for num, _, _ in self._scan()]) + 1
+            return os.path.join(self.folder, "%s-%d.log" % (self.name, self._last))
+
+    def submit(self, path):
+        num = int(self._parser.match(os.path.basename(path)).group(1))
+        self._queue.put((path, self._archive_path(num)))
+
+    def recover(self):
+        """
+        Queues the logs that were rotated but not compressed yet, because of a reboot or by
+        older versions, which left them around.
+        """
+        for num, ext, path in sorted(self._scan()):
+            if ext == 'log':
+                self._queue.put((path, self._archive_path(num)))
+
+    def _compress(self, src, dst):
+        started = time.time()
+        temp = "%s.tmp" % dst
+        with open(src, 'rb') as fp_in:
+            with gzip.open(temp, 'wb') as fp_out:
+                shutil.copyfileobj(fp_in, fp_out, LogArchiver.CHUNK_SIZE)
+        os.replace(temp, dst)
+        os.remove(src)
+        logging.info("compressed %s to %s in %.2fs", src, dst, time.time() - started)
+
+    def _enforce_retention(self):
+        archives = []
+        for _, ext, path in self._scan():
+            if ext == 'gz':
+                try:
+                    st = os.stat(path)
+                    archives.append((st.st_mtime, st.st_size, path))
+                except OSError:
+                    pass
+
+        archives.sort()
+        total = sum(size for _, size, _ in archives)
+        while len(archives) > 1 and (len(archives) > self.keep or
+                                     (self.max_total_bytes and total > self.max_total_bytes)):
+            _, size, path = archives.pop(0)
+            logging.info("removing old log archive %s", path)
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning("can't remove %s: %s", path, e)
+            total -= size
+
+    def _worker(self):
+        # on linux this only affects the calling thread
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+        except (AttributeError, OSError) as e:
+            logging.debug("can't lower the log archiver priority: %s", e)
+
+        while True:
+            src, dst = self._queue.get()
+            try:
+                self._compress(src, dst)
+                self._enforce_retention()
+            except Exception as e:
+                logging.error("error while archiving %s: %s", src, e)
+
+
+class BufferedMixin(object):
+    """
+    Makes a stream handler flush only when sync is called, so that the log writer can write
+    the records in batches.
+    """
+    autoflush = True
+
+    def flush(self):
+        if self.autoflush:
+            super().flush()
+
+    def sync(self):
+        super().flush()
 
-    while os.path.exists(archive_filename):
-        archive_filename = os.path.join(base_path, "%s-%d.gz" % (name, counter))
-        counter += 1
 
-    log_filename = archive_filename.replace('gz', 'log')
+class BufferedStreamHandler(BufferedMixin, logging.StreamHandler):
+    pass
 
-    print("%s is %d bytes big, rotating to %s ..." % (filename, stats.st_size, log_filename))
 
-    shutil.move(filename, log_filename)
+class BufferedFileHandler(BufferedMixin, logging.FileHandler):
+    pass
 
-    print("compressing to %s ..." % archive_filename)
 
-    with open(log_filename, 'rb') as src:
-        with gzip.open(archive_filename, 'wb') as dst:
-            dst.writelines(src)
+class QueueHandler(logging.Handler):
+    """
+    Puts the records in the writer queue, with their message and exception already rendered
+    since their arguments might change by the time they're written.
+    """
+
+    def __init__(self, queue):
+        super().__init__()
+        self._queue = queue
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self._queue.put(record)
+        except Exception:
+            self.handleError(record)
+
+
+class LogWriter(object):
+    """
+    Single thread writing the records queued by every other one to the handlers, in batches.
+
+    Handlers are flushed every flush_interval seconds, or right away for WARNING and above,
+    and the last ring_size records are kept in memory for the web ui.
+    """
+    MAX_BATCH = 512
+
+    def __init__(self, handlers, flush_interval=1.0, ring_size=500):
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.ring = deque(maxlen=ring_size)
+        self._queue = queue.SimpleQueue()
+        self._stop = object()
+        self._thread = None
+        self._synced_at = time.time()
+        self._dirty = False
+
+        for h in self.handlers:
+            if isinstance(h, BufferedMixin):
+                h.autoflush = False
+
+    def handler(self):
+        return QueueHandler(self._queue)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, name='log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        self._queue.put(self._stop)
+        self._thread.join(timeout)
+
+    def recent(self, num=100, level=logging.NOTSET):
+        records = [r for r in list(self.ring) if r[1] >= level]
+        return records[-num:] if num else records
+
+    def _sync(self):
+        for h in self.handlers:
+            try:
+                if isinstance(h, BufferedMixin):
+                    h.sync()
+                else:
+                    h.flush()
+            except Exception:
+                # nowhere to log this
+                pass
+        self._synced_at = time.time()
+        self._dirty = False
+
+    def _write(self, record):
+        self.ring.append((record.created, record.levelno, record.levelname, record.msg))
+        for h in self.handlers:
+            if record.levelno >= h.level:
+                h.handle(record)
+
+    def _worker(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._dirty:
+                    self._sync()
+                continue
+
+            batch = [record]
+            try:
+                while len(batch) < LogWriter.MAX_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            urgent = False
+            for record in batch:
+                if record is self._stop:
+                    self._sync()
+                    return
+                self._write(record)
+                urgent = urgent or record.levelno >= logging.WARNING
+
+            self._dirty = True
+            if urgent or time.time() - self._synced_at >= self.flush_interval:
+                self._sync()
+
+
+_writer = None
+
+
+def recent(num=100, level=logging.NOTSET):
+    """
+    Returns the last num (time, level number, level name, message) log records.
+    """
+    return _writer.recent(num, level) if _writer is not None else []
+
+
+class RotatingLogHandler(BufferedMixin, logging.FileHandler):
+    """
+    File handler that moves the log aside as soon as it grows beyond max_bytes, including at
+    startup, and lets the archiver compress it in background.
+
+    The line with the id of the running session is repeated at the top of every new log, so
+    that the parts of a session logged in different files can be told apart from other sessions.
+    """
+
+    def __init__(self, filename, max_bytes, archiver):
+        self._session_line = None
+        super().__init__(filename)
+        self.max_bytes = max_bytes
+        self._archiver = archiver
+        self._archiver.recover()
+        if self._size >= self.max_bytes:
+            self.rotate()
+
+    def _open(self):
+        stream = super()._open()
+        # the size is counted as records are written, asking the stream would flush it
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+
+    def rotate(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        rotated = self._archiver.next_path()
+        os.replace(self.baseFilename, rotated)
+        self.stream = self._open()
+        self._archiver.submit(rotated)
+
+        if self._session_line is not None:
+            self.stream.write(self._session_line)
+            self._size += len(self._session_line.encode(self.stream.encoding, errors='replace'))
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self.flush()
+            self._size += len(msg) if msg.isascii() else len(msg.encode(self.stream.encoding, errors='replace'))
+            # set by format
+            if record.message.startswith(SessionParser.SESSION_TOKEN):
+                self._session_line = msg
+            if self._size >= self.max_bytes:
+                self.rotate()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
@@ -3,7 +3,6 @@ import logging
 import time
 
 import pwnagotchi
-import pwnagotchi.utils as utils
 import pwnagotchi.ui.faces as faces
 import pwnagotchi.plugins as plugins
 import pwnagotchi.grid as grid
@@ -34,7 +33,7 @@ class AsyncAdvertiser(object):
 
     def _update_advertisement(self, s):
         self._advertisement['pwnd_run'] = len(self._handshakes)
-        self._advertisement['pwnd_tot'] = utils.total_unique_handshakes(self._config['bettercap']['handshakes'])
+        self._advertisement['pwnd_tot'] = self._handshake_catalog.total
         self._advertisement['uptime'] = pwnagotchi.uptime()
         self._advertisement['epoch'] = self._epoch.epoch
         grid.set_advertisement_data(self._advertisement)
@@ -53,6 +52,9 @@ class AsyncAdvertiser(object):
         self._advertisement['face'] = new
         grid.set_advertisement_data(self._advertisement)
 
+    def num_peers(self):
+        return len(self._peers)
+
     def cumulative_encounters(self):
         return sum(peer.encounters for _, peer in self._peers.items())
 
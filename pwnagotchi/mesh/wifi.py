@@ -11,3 +11,66 @@ def freq_to_channel(freq):
         return int(((freq - 5035) / 5) + 7)
     else:
         return 0
+
+
+class AccessPointIndex(object):
+    def __init__(self, aps):
+        self.aps = aps
+        self.by_bssid = {}
+        self.by_station = {}
+        self.by_channel = {}
+        self.stations_by_channel = {}
+        self.tot_stations = 0
+
+        # build every lookup table in a single pass
+        for ap in aps:
+            ch = ap['channel']
+            num_clients = len(ap['clients'])
+
+            self.by_bssid[ap['mac'].lower()] = ap
+            if ch not in self.by_channel:
+                self.by_channel[ch] = [ap]
+                self.stations_by_channel[ch] = num_clients
+            else:
+                self.by_channel[ch].append(ap)
+                self.stations_by_channel[ch] += num_clients
+            self.tot_stations += num_clients
+
+            for sta in ap['clients']:
+                self.by_station[sta['mac'].lower()] = (ap, sta)
+
+    @property
+    def tot_aps(self):
+        return len(self.aps)
+
+    def aps_on_channel(self, channel):
+        return len(self.by_channel.get(channel, ()))
+
+    def stations_on_channel(self, channel):
+        return self.stations_by_channel.get(channel, 0)
+
+    def find(self, station_mac, ap_mac):
+        ap = self.by_bssid.get(ap_mac.lower())
+        if ap is None:
+            return None
+
+        station_mac = station_mac.lower()
+        found = self.by_station.get(station_mac)
+        if found is not None and found[0] is ap:
+            return found
+
+        # the same station might be listed as client of more than one access point
+        for sta in ap['clients']:
+            if sta['mac'].lower() == station_mac:
+                return ap, sta
+
+        return ap, {'mac': station_mac, 'vendor': ''}
+
+
+def mac_to_int(mac):
+    return int(mac.replace(':', '').replace('-', ''), 16)
+
+
+def int_to_mac(value):
+    raw = '%012x' % value
+    return ':'.join(raw[i:i + 2] for i in range(0, 12, 2))
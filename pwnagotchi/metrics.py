@@ -0,0 +1,117 @@
+import logging
+import threading
+
+import pwnagotchi
+import pwnagotchi.timing as timing
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# metric name and label for each timing kind
+TIMINGS = {
+    timing.PHASE: ('pwnagotchi_phase_seconds', 'phase', 'Time spent in each phase of the main loop.'),
+    timing.BETTERCAP: ('pwnagotchi_bettercap_request_seconds', 'endpoint', 'Latency of bettercap api requests.'),
+    timing.PLUGIN: ('pwnagotchi_plugin_hook_seconds', 'hook', 'Time spent in plugin callbacks.'),
+    timing.UI: ('pwnagotchi_ui_seconds', 'step', 'Time spent rendering the ui and refreshing the display.'),
+}
+
+
+class Counters(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._help = {}
+
+    def inc(self, name, value=1, help=''):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+            if name not in self._help:
+                self._help[name] = help
+
+    def data(self):
+        with self._lock:
+            return {name: (value, self._help[name]) for name, value in self._values.items()}
+
+
+_counters = Counters()
+
+
+def inc(name, value=1, help=''):
+    _counters.inc(name, value, help)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric(lines, name, kind, help, value):
+    lines.append('# HELP %s %s' % (name, help))
+    lines.append('# TYPE %s %s' % (name, kind))
+    lines.append('%s %s' % (name, value))
+
+
+def _histograms(lines, name, label, help, histograms):
+    lines.append('# HELP %s %s' % (name, help))
+    lines.append('# TYPE %s histogram' % name)
+    for key, h in sorted(histograms.items()):
+        key = _escape(key)
+        cumulative = 0
+        for le, n in zip(timing.BUCKETS, h.counts):
+            cumulative += n
+            lines.append('%s_bucket{%s="%s",le="%g"} %d' % (name, label, key, le, cumulative))
+        lines.append('%s_bucket{%s="%s",le="+Inf"} %d' % (name, label, key, h.count))
+        lines.append('%s_sum{%s="%s"} %f' % (name, label, key, h.total))
+        lines.append('%s_count{%s="%s"} %d' % (name, label, key, h.count))
+
+
+def _system(lines):
+    for name, help, getter in (('pwnagotchi_cpu_load', 'CPU load, from 0 to 1.', pwnagotchi.cpu_load),
+                               ('pwnagotchi_mem_usage', 'Memory usage, from 0 to 1.', pwnagotchi.mem_usage),
+                               ('pwnagotchi_temperature_celsius', 'CPU temperature.', pwnagotchi.temperature)):
+        try:
+            _metric(lines, name, 'gauge', help, getter())
+        except Exception as e:
+            logging.debug("can't read %s: %s", name, e)
+
+
+def exposition(agent):
+    """
+    Returns every metric in the prometheus text exposition format.
+    """
+    lines = []
+
+    for name, (value, help) in sorted(_counters.data().items()):
+        _metric(lines, name, 'counter', help, value)
+
+    _metric(lines, 'pwnagotchi_uptime_seconds', 'gauge', 'Seconds since boot.', pwnagotchi.uptime())
+    _metric(lines, 'pwnagotchi_epoch', 'gauge', 'Current epoch.', agent.epoch_number())
+    _metric(lines, 'pwnagotchi_handshakes', 'gauge', 'Handshakes captured during this session.',
+            agent.num_handshakes())
+    _metric(lines, 'pwnagotchi_handshakes_files', 'gauge', 'Handshake files in the handshakes folder.',
+            agent.handshake_catalog().total)
+    _metric(lines, 'pwnagotchi_peers', 'gauge', 'Peers in range.', agent.num_peers())
+    _metric(lines, 'pwnagotchi_access_points', 'gauge', 'Access points in range.', agent.get_total_aps())
+
+    for key, value in sorted(agent.epoch_data().items()):
+        # the epoch number has its own gauge
+        if key != 'epoch' and isinstance(value, (int, float)) and not isinstance(value, bool):
+            _metric(lines, 'pwnagotchi_last_epoch_%s' % key, 'gauge', 'Last epoch %s.' % key, value)
+
+    errors = {endpoint: lat['errors'] for endpoint, lat in agent.latency().items()}
+    if errors:
+        name = 'pwnagotchi_bettercap_request_errors_total'
+        lines.append('# HELP %s Failed bettercap api requests.' % name)
+        lines.append('# TYPE %s counter' % name)
+        for endpoint, n in sorted(errors.items()):
+            lines.append('%s{endpoint="%s"} %d' % (name, _escape(endpoint), n))
+
+    grouped = {}
+    for (kind, key), h in timing.totals().items():
+        grouped.setdefault(kind, {})[key] = h
+    for kind, histograms in sorted(grouped.items()):
+        if kind in TIMINGS:
+            name, label, help = TIMINGS[kind]
+            _histograms(lines, name, label, help, histograms)
+
+    _system(lines)
+
+    return '\n'.join(lines) + '\n'
@@ -4,12 +4,15 @@ import _thread
 import threading
 import importlib, importlib.util
 import logging
+import pwnagotchi.timing as timing
 from pwnagotchi.ui import view
 
 default_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "default")
 loaded = {}
 database = {}
 locks = {}
+# on_* callbacks implemented by the loaded plugins
+callbacks = set()
 
 
 class Plugin:
@@ -28,6 +31,7 @@ class Plugin:
                 cb = getattr(plugin_instance, attr_name, None)
                 if cb is not None and callable(cb):
                     locks["%s::%s" % (plugin_name, attr_name)] = threading.Lock()
+                    callbacks.add(attr_name)
 
 
 def toggle_plugin(name, enable=True):
@@ -41,6 +45,7 @@ def toggle_plugin(name, enable=True):
         if getattr(loaded[name], 'on_unload', None):
             loaded[name].on_unload(view.ROOT)
         del loaded[name]
+        _update_callbacks()
         return True
 
     if enable and name in database and name not in loaded:
@@ -53,6 +58,19 @@ def toggle_plugin(name, enable=True):
     return False
 
 
+def _update_callbacks():
+    global callbacks
+    callbacks = set(attr_name for plugin in loaded.values() for attr_name in plugin.__dir__()
+                    if attr_name.startswith('on_') and callable(getattr(plugin, attr_name, None)))
+
+
+def implemented(event_name):
+    """
+    Returns True if any loaded plugin has a callback for event_name.
+    """
+    return 'on_%s' % event_name in callbacks
+
+
 def on(event_name, *args, **kwargs):
     for plugin_name, plugin in loaded.items():
         one(plugin_name, event_name, *args, **kwargs)
@@ -65,7 +83,8 @@ def locked_cb(lock_name, cb, *args, **kwargs):
         locks[lock_name] = threading.Lock()
 
     with locks[lock_name]:
-        cb(*args, *kwargs)
+        with timing.timer(timing.PLUGIN, lock_name):
+            cb(*args, *kwargs)
 
 
 def one(plugin_name, event_name, *args, **kwargs):
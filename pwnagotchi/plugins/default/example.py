@@ -139,12 +139,30 @@ class Example(plugins.Plugin):
     def on_channel_hop(self, agent, channel):
         pass
 
+    # called when the order in which channels are going to be visited is decided, schedule contains
+    # the plan, the score of each channel and the per channel statistics
+    def on_channel_schedule(self, agent, schedule):
+        pass
+
     # called when a new handshake is captured, access_point and client_station are json objects
     # if the agent could match the BSSIDs to the current list, otherwise they are just the strings of the BSSIDs
     def on_handshake(self, agent, filename, access_point, client_station):
         pass
 
-    # called when an epoch is over (where an epoch is a single loop of the main algorithm)
+    # called as soon as bettercap emits an event, the callback name is derived from the event tag
+    # with every non alphanumeric character replaced by an underscore, for instance 'wifi.ap.new'
+    # becomes on_bcap_wifi_ap_new, event is the json object sent by bettercap
+    def on_bcap_wifi_ap_new(self, agent, event):
+        pass
+
+    # called when a pcap file is created, updated or deleted inside the handshakes folder,
+    # change is one of 'created', 'updated' or 'deleted'
+    def on_handshake_file(self, agent, change, filename):
+        pass
+
+    # called when an epoch is over (where an epoch is a single loop of the main algorithm),
+    # epoch_data['timings'] contains how much time has been spent in each phase of the loop,
+    # in each bettercap api endpoint and in each plugin callback during the epoch
     def on_epoch(self, agent, epoch, epoch_data):
         pass
 
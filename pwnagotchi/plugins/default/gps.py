@@ -31,17 +31,17 @@ class GPS(plugins.Plugin):
             except Exception:
                 pass
 
-            agent.run(f"set gps.device {self.options['device']}")
-            agent.run(f"set gps.baudrate {self.options['speed']}")
-            agent.run("gps on")
+            with agent.batch() as batch:
+                batch.add(f"set gps.device {self.options['device']}")
+                batch.add(f"set gps.baudrate {self.options['speed']}")
+                batch.add("gps on")
             self.running = True
         else:
             logging.warning("no GPS detected")
 
     def on_handshake(self, agent, filename, access_point, client_station):
         if self.running:
-            info = agent.session()
-            self.coordinates = info["gps"]
+            self.coordinates = agent.session_cache().gps()
             gps_filename = filename.replace(".pcap", ".gps.json")
 
             logging.info(f"saving GPS to {gps_filename} ({self.coordinates})")
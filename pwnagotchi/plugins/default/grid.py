@@ -1,7 +1,6 @@
 import os
 import logging
 import time
-import glob
 import re
 
 import pwnagotchi.grid as grid
@@ -85,7 +84,7 @@ class Grid(plugins.Plugin):
     def check_handshakes(self, agent):
         logging.debug("checking pcaps")
 
-        pcap_files = glob.glob(os.path.join(agent.config()['bettercap']['handshakes'], "*.pcap"))
+        pcap_files = agent.handshake_catalog().files()
         num_networks = len(pcap_files)
         reported = self.report.data_field_or('reported', default=[])
         num_reported = len(reported)
@@ -123,7 +122,7 @@ class Grid(plugins.Plugin):
         logging.debug("internet available")
 
         try:
-            grid.update_data(agent.last_session)
+            grid.update_data(agent.last_session, agent.session_index().aggregate())
         except Exception as e:
             logging.error("error connecting to the pwngrid-peer service: %s" % e)
             logging.debug(e, exc_info=True)
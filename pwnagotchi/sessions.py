@@ -0,0 +1,373 @@
+import os
+import re
+import time
+import logging
+import threading
+
+import numpy as np
+
+from pwnagotchi.log import SessionParser
+
+VERSION = 1
+
+# one array per column, one row per session
+COLUMNS = (
+    ('session_id', 'U32'),
+    ('source', '<i4'),
+    ('started_at', '<f8'),
+    ('stopped_at', '<f8'),
+    ('duration', '<f4'),
+    ('epochs', '<u4'),
+    ('train_epochs', '<u4'),
+    ('deauthed', '<u4'),
+    ('associated', '<u4'),
+    ('handshakes', '<u4'),
+    ('peers', '<u4'),
+    ('min_reward', '<f4'),
+    ('max_reward', '<f4'),
+    ('avg_reward', '<f4'),
+)
+
+# the live log is not an archive
+LIVE_SOURCE = -1
+
+
+def index_path(log_path):
+    return "%s.sessions.npz" % os.path.splitext(log_path)[0]
+
+
+def _empty():
+    return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+
+
+def _columns(rows):
+    cols = {}
+    for name, dtype in COLUMNS:
+        cols[name] = np.array([row[name] for row in rows], dtype=dtype) if rows else np.zeros(0, dtype=dtype)
+    return cols
+
+
+def _merge(cols):
+    """
+    Merges the rows of the sessions logged across a rotation, one for each file they span.
+    """
+    order = np.argsort(cols['started_at'], kind='stable')
+    cols = {name: col[order] for name, col in cols.items()}
+    ids, first, inverse = np.unique(cols['session_id'], return_index=True, return_inverse=True)
+    if len(ids) == len(cols['session_id']):
+        return cols
+
+    num = len(ids)
+    merged = {
+        'session_id': ids,
+        # where the session started
+        'source': cols['source'][first],
+        'started_at': np.full(num, np.inf),
+        'stopped_at': np.full(num, -np.inf),
+        'min_reward': np.full(num, np.nan, dtype=np.float32),
+        'max_reward': np.full(num, np.nan, dtype=np.float32),
+    }
+    np.minimum.at(merged['started_at'], inverse, cols['started_at'])
+    np.maximum.at(merged['stopped_at'], inverse, cols['stopped_at'])
+    # fmin and fmax ignore the nans of the parts without epochs
+    np.fmin.at(merged['min_reward'], inverse, cols['min_reward'])
+    np.fmax.at(merged['max_reward'], inverse, cols['max_reward'])
+    merged['duration'] = (merged['stopped_at'] - merged['started_at']).astype(np.float32)
+
+    for name in ('epochs', 'train_epochs', 'deauthed', 'associated', 'handshakes', 'peers'):
+        merged[name] = np.zeros(num, dtype=cols[name].dtype)
+        np.add.at(merged[name], inverse, cols[name])
+
+    tot_reward = np.zeros(num)
+    np.add.at(tot_reward, inverse, cols['avg_reward'] * cols['epochs'])
+    merged['avg_reward'] = np.divide(tot_reward, merged['epochs'], out=np.zeros(num),
+                                     where=merged['epochs'] > 0).astype(np.float32)
+
+    # back in the order they started
+    order = np.argsort(first, kind='stable')
+    return {name: merged[name][order].astype(dtype) for name, dtype in COLUMNS}
+
+
+def _row(stats, source):
+    return {
+        'session_id': stats['session_id'],
+        'source': source,
+        'started_at': stats['started_at'],
+        'stopped_at': stats['stopped_at'],
+        'duration': stats['duration'],
+        'epochs': stats['epochs'],
+        'train_epochs': stats['train_epochs'],
+        'deauthed': stats['deauthed'],
+        'associated': stats['associated'],
+        'handshakes': stats['handshakes'],
+        'peers': stats['peers'],
+        'min_reward': stats['min_reward'] if stats['min_reward'] is not None else np.nan,
+        'max_reward': stats['max_reward'] if stats['max_reward'] is not None else np.nan,
+        'avg_reward': stats['avg_reward']
+    }
+
+
+class SessionIndex(object):
+    """
+    Per session statistics of every rotated log archive and of the live log.
+
+    Each archive is streamed once through SessionParser and its sessions are appended to a
+    columnar store next to the log, so that only new archives are parsed on refresh. A rotated
+    log is indexed as soon as it's moved aside, before it's compressed. The live log is followed
+    incrementally and its sessions are only kept in memory, since they end up in an archive when
+    the log is rotated. Sessions of archives deleted afterwards are kept. The parts of a session
+    logged across a rotation are stored as they are parsed, one row per file, and merged on
+    refresh.
+
+    Queries are answered from the sessions merged by the last refresh, which runs in background
+    once started.
+    """
+
+    def __init__(self, log_path, path=None):
+        self.log_path = log_path
+        self.path = path or index_path(log_path)
+        self._lock = threading.RLock()
+        self._columns = _empty()
+        # archive filename -> (index, size, mtime)
+        self._sources = {}
+        # archives indexed from the rotated log, before it was compressed
+        self._uncompressed = set()
+        self._live_parser = None
+        self._live_sessions = []
+        self._live_offset = 0
+        self._live_inode = None
+
+        self._name = os.path.splitext(os.path.basename(log_path))[0]
+        # same names LogArchiver uses, name-<n>.log while compressing
+        self._archive_parser = re.compile(r'^%s(?:-(\d+))?\.(gz|log)$' % re.escape(self._name))
+        self._load()
+        self._merged = self._merge_live()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as data:
+                if int(data['version']) != VERSION:
+                    logging.info("session index %s has an old format, rebuilding it", self.path)
+                    return
+                columns = {name: data[name] for name, _ in COLUMNS}
+                sources = {str(name): (i, int(size), float(mtime)) for i, (name, size, mtime) in
+                           enumerate(zip(data['sources'], data['source_sizes'], data['source_mtimes']))}
+        except Exception as e:
+            logging.warning("can't load session index %s, rebuilding it: %s", self.path, e)
+            return
+
+        self._columns = columns
+        self._sources = sources
+
+    def _save(self):
+        names = sorted(self._sources.keys(), key=lambda name: self._sources[name][0])
+        temp = "%s.tmp" % self.path
+        with open(temp, 'wb') as fp:
+            np.savez(fp,
+                     version=np.array(VERSION),
+                     sources=np.array(names, dtype=str),
+                     source_sizes=np.array([self._sources[name][1] for name in names], dtype=np.int64),
+                     source_mtimes=np.array([self._sources[name][2] for name in names], dtype=np.float64),
+                     **self._columns)
+        os.replace(temp, self.path)
+
+    def _archives(self):
+        """
+        Returns the archives as (archive filename, filename to parse) tuples, the second one being
+        the rotated log if it's not compressed yet.
+        """
+        folder = os.path.dirname(self.log_path) or '.'
+        try:
+            names = os.listdir(folder)
+        except OSError:
+            return []
+
+        found = {}
+        for name in names:
+            m = self._archive_parser.match(name)
+            if m is None:
+                continue
+            num, ext = m.groups()
+            if ext == 'gz':
+                found[os.path.join(folder, name)] = os.path.join(folder, name)
+            elif num is not None:
+                archive = os.path.join(folder, "%s-%s.gz" % (self._name, num))
+                # while both exist the archive is complete
+                found.setdefault(archive, os.path.join(folder, name))
+        return list(found.items())
+
+    def _refresh_archives(self):
+        new_rows = []
+        changed = False
+        for archive, filename in self._archives():
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+
+            known = self._sources.get(archive)
+            if known is not None and known[1] == st.st_size and known[2] == st.st_mtime:
+                continue
+
+            if known is not None and archive in self._uncompressed and filename == archive:
+                # same sessions, compressed
+                self._sources[archive] = (known[0], st.st_size, st.st_mtime)
+                self._uncompressed.discard(archive)
+                changed = True
+                continue
+
+            if known is not None:
+                # rewritten, forget what it had
+                keep = self._columns['source'] != known[0]
+                self._columns = {name: col[keep] for name, col in self._columns.items()}
+                source = known[0]
+            else:
+                source = max((s[0] for s in self._sources.values()), default=-1) + 1
+
+            logging.info("indexing sessions in %s ...", filename)
+            started = time.time()
+            rows = []
+            try:
+                SessionParser(on_session=lambda stats: rows.append(_row(stats, source))).parse(filename)
+            except Exception as e:
+                logging.error("error while indexing %s: %s", filename, e)
+                continue
+
+            logging.debug("indexed %d sessions from %s in %.2fs", len(rows), filename, time.time() - started)
+            self._sources[archive] = (source, st.st_size, st.st_mtime)
+            if filename != archive:
+                self._uncompressed.add(archive)
+            else:
+                self._uncompressed.discard(archive)
+            new_rows += rows
+            changed = True
+
+        if new_rows:
+            new = _columns(new_rows)
+            self._columns = {name: np.concatenate((col, new[name])) for name, col in self._columns.items()}
+
+        if changed:
+            try:
+                self._save()
+            except Exception as e:
+                logging.error("can't save session index %s: %s", self.path, e)
+
+        return len(new_rows)
+
+    def _refresh_live(self):
+        """
+        Parses the new lines of the live log, returns True if it was rotated since the last time.
+        """
+        try:
+            st = os.stat(self.log_path)
+        except OSError:
+            return False
+
+        rotated = self._live_parser is not None and st.st_ino != self._live_inode
+        if self._live_parser is None or rotated or st.st_size < self._live_offset:
+            self._live_sessions = []
+            self._live_parser = SessionParser(on_session=self._live_sessions.append)
+            self._live_offset = 0
+            self._live_inode = st.st_ino
+
+        if st.st_size == self._live_offset:
+            return rotated
+
+        with open(self.log_path, 'rb') as fp:
+            fp.seek(self._live_offset)
+            data = fp.read(st.st_size - self._live_offset)
+
+        # leave a partially written line for the next time
+        end = data.rfind(b'\n') + 1
+        self._live_offset += end
+        for line in data[:end].decode('utf-8', errors='replace').split('\n'):
+            self._live_parser.feed(line)
+        return rotated
+
+    def _merge_live(self):
+        live = list(self._live_sessions)
+        if self._live_parser is not None and self._live_parser.lines > 0:
+            live.append(self._live_parser.stats())
+        live = _columns([_row(stats, LIVE_SOURCE) for stats in live])
+        return _merge({name: np.concatenate((col, live[name])) for name, col in self._columns.items()})
+
+    def refresh(self):
+        """
+        Indexes the new archives and the new lines of the live log, returns how many new archived
+        sessions were found.
+        """
+        with self._lock:
+            found = self._refresh_archives()
+            if self._refresh_live():
+                # what was parsed of the live log is gone, the rotated log is an archive now
+                found += self._refresh_archives()
+            self._merged = self._merge_live()
+            return found
+
+    def _refresher(self, interval):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.exception("error while refreshing the session index")
+            time.sleep(interval)
+
+    def start(self, interval):
+        """
+        Refreshes the index in background every interval seconds, the first time right away.
+        """
+        threading.Thread(target=self._refresher, args=(interval,), name='session-index', daemon=True).start()
+
+    def columns(self):
+        """
+        Returns every session, archived and live, as a dict of arrays sorted by start time, as of
+        the last refresh.
+        """
+        return self._merged
+
+    def last(self, n=10):
+        """
+        Returns the last n sessions, most recent first.
+        """
+        cols = self.columns()
+        sessions = []
+        for i in range(len(cols['session_id']) - 1, max(-1, len(cols['session_id']) - 1 - n), -1):
+            session = {}
+            for name, _ in COLUMNS:
+                value = cols[name][i].item()
+                # nan is not valid json
+                session[name] = None if isinstance(value, float) and value != value else value
+            sessions.append(session)
+        return sessions
+
+    def aggregate(self, since=None):
+        """
+        Returns the totals of every session started after since, or of all of them.
+        """
+        cols = self.columns()
+        if since is not None:
+            mask = cols['started_at'] >= since
+            cols = {name: col[mask] for name, col in cols.items()}
+
+        epochs = cols['epochs'].astype(np.float64)
+        tot_epochs = epochs.sum()
+        num = len(cols['session_id'])
+
+        return {
+            'sessions': num,
+            'first_started_at': float(cols['started_at'][0]) if num else None,
+            'last_stopped_at': float(cols['stopped_at'][-1]) if num else None,
+            'duration': float(cols['duration'].astype(np.float64).sum()),
+            'epochs': int(tot_epochs),
+            'train_epochs': int(cols['train_epochs'].sum()),
+            'deauthed': int(cols['deauthed'].sum()),
+            'associated': int(cols['associated'].sum()),
+            'handshakes': int(cols['handshakes'].sum()),
+            'peers': int(cols['peers'].sum()),
+            'avg_reward': float((cols['avg_reward'] * epochs).sum() / tot_epochs) if tot_epochs else 0.0,
+            'min_reward': float(np.nanmin(cols['min_reward'])) if np.any(~np.isnan(cols['min_reward'])) else None,
+            'max_reward': float(np.nanmax(cols['max_reward'])) if np.any(~np.isnan(cols['max_reward'])) else None,
+        }
@@ -0,0 +1,164 @@
+import argparse
+import base64
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pwnagotchi.sim.world import World
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive, like the real rest api
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        logging.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _send(self, code, body, content_type='application/json'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message):
+        self._send(code, message.encode(), content_type='text/plain')
+
+    def _authorized(self):
+        expected = 'Basic %s' % base64.b64encode(
+            ('%s:%s' % (self.server.username, self.server.password)).encode()).decode()
+        if self.headers.get('Authorization') == expected:
+            return True
+        self.send_response(401)
+        self.send_header('WWW-Authenticate', 'Basic realm="auth"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+
+        path = self.path.split('?')[0]
+        if path == '/api/session':
+            self._send(200, self.server.world.session_json())
+        elif path == '/api/events':
+            self._send(200, self.server.world.events_json())
+        else:
+            self._error(404, 'not found')
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+
+        if self.path.split('?')[0] != '/api/session':
+            self._error(404, 'not found')
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            cmd = json.loads(self.rfile.read(length))['cmd']
+        except Exception as e:
+            self._error(400, 'invalid request: %s' % e)
+            return
+
+        # like bettercap, a chain stops at the first failing command
+        for command in cmd.split(';'):
+            command = command.strip()
+            if not command:
+                continue
+            try:
+                run(self.server.world, command)
+            except Exception as e:
+                self._error(400, str(e))
+                return
+
+        self._send(200, json.dumps({'success': True, 'msg': ''}).encode())
+
+
+def run(world, command):
+    if command.startswith('!'):
+        # shell commands are not executed
+        logging.debug("skipping shell command: %s", command[1:])
+        return
+
+    args = command.split()
+    name = args[0]
+
+    if name == 'wifi.assoc':
+        world.associate(args[1])
+    elif name == 'wifi.deauth':
+        world.deauth(args[1])
+    elif name == 'wifi.recon.channel':
+        if len(args) < 2 or args[1] == 'clear':
+            world.set_recon_channels([])
+        else:
+            world.set_recon_channels(int(ch) for ch in args[1].split(','))
+    elif name == 'events.clear':
+        world.clear_events()
+    elif len(args) == 2 and args[1] in ('on', 'off'):
+        world.set_module(name, args[1] == 'on')
+    # set, events.ignore, wifi.clear and anything else are accepted and ignored
+
+
+class Server(ThreadingHTTPServer):
+    """
+    Stand-in for the bettercap rest api backed by a synthetic World, so that the agent and its
+    main loop can run on a workstation without a monitor interface. There's no websocket endpoint,
+    the client will fall back to polling /api/events.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, world, address='127.0.0.1', port=8081, username='pwnagotchi', password='pwnagotchi'):
+        super().__init__((address, port), Handler)
+        self.world = world
+        self.username = username
+        self.password = password
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bettercap rest api simulator')
+    parser.add_argument('--address', default='127.0.0.1', help='Address to bind to.')
+    parser.add_argument('--port', type=int, default=8081, help='Port to bind to.')
+    parser.add_argument('--username', default='pwnagotchi', help='API username.')
+    parser.add_argument('--password', default='pwnagotchi', help='API password.')
+    parser.add_argument('--aps', type=int, default=100, help='Number of access points.')
+    parser.add_argument('--stations', type=int, default=300, help='Number of client stations.')
+    parser.add_argument('--churn', type=float, default=0.001,
+                        help='Probability per second of an access point or station being replaced.')
+    parser.add_argument('--handshake-prob', type=float, default=0.2,
+                        help='Probability of a deauth yielding an handshake.')
+    parser.add_argument('--pmkid-prob', type=float, default=0.05,
+                        help='Probability of an association yielding a PMKID.')
+    parser.add_argument('--handshakes', default=None, help='Folder where to create the captured pcap files.')
+    parser.add_argument('--iface', default='mon0', help='Name of the monitor interface.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed.')
+    parser.add_argument('--debug', action='store_true', default=False, help='Enable debug logs.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format='[%(asctime)s] [%(levelname)s] %(message)s')
+
+    world = World(num_aps=args.aps, num_stations=args.stations, churn=args.churn,
+                  handshake_prob=args.handshake_prob, pmkid_prob=args.pmkid_prob, seed=args.seed,
+                  handshakes_path=args.handshakes, iface=args.iface)
+    server = Server(world, args.address, args.port, args.username, args.password)
+
+    logging.info("simulating %d access points and %d stations on http://%s:%d/api", len(world.aps),
+                 len(world.stations), args.address, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import functools
+
+import numpy as np
+import toml
+
+import pwnagotchi
+import pwnagotchi.utils as utils
+import pwnagotchi.mesh.wifi as wifi
+import pwnagotchi.ai.reward as reward
+from pwnagotchi.ai.reward import RewardFunction
+from pwnagotchi.sim.world import DEFAULT_CHANNELS
+
+# seconds of recon on a channel to discover about 63% of the access points on it
+DISCOVERY_SECS = 2.0
+
+
+class Model(object):
+    """
+    Vectorized version of the World: the same access points, stations and channels kept in
+    numpy arrays, with simulated time, so that a whole epoch takes a few microseconds.
+
+    The epoch follows the agent loop: recon on the personality channels, then for each channel
+    with visible access points hop to it, associate and deauth every station of the ones that
+    weren't interacted with more than max_interactions times. Access points and stations that
+    went away are still listed for ap_ttl and sta_ttl seconds and interacting with them is a miss.
+    """
+
+    def __init__(self, num_aps=100, num_stations=300, channels=None, churn=0.001, handshake_prob=0.2,
+                 pmkid_prob=0.05, attack_rate=20, seed=None):
+        self._rand = np.random.default_rng(seed)
+        self.channels = channels or DEFAULT_CHANNELS
+        self.churn = churn
+        self.handshake_prob = handshake_prob
+        self.pmkid_prob = pmkid_prob
+        self.attack_rate = attack_rate
+        self.now = 0.0
+
+        self._channel_list = np.array(sorted(self.channels.keys()), dtype=np.intp)
+        weights = np.array([self.channels[ch] for ch in self._channel_list], dtype=np.float64)
+        self._channel_weights = weights / weights.sum()
+        self._stations_per_ap = num_stations / max(1, num_aps)
+
+        self.ap_channel = np.zeros(num_aps, dtype=np.intp)
+        self.ap_rssi = np.zeros(num_aps, dtype=np.int16)
+        self.ap_clients = np.zeros(num_aps, dtype=np.int32)
+        self.ap_interactions = np.zeros(num_aps, dtype=np.int32)
+        self.ap_handshake = np.zeros(num_aps, dtype=bool)
+        self._replace(np.ones(num_aps, dtype=bool))
+
+    @staticmethod
+    def from_replay(logs, num_aps=100, num_stations=300, **kwargs):
+        """
+        Creates a model whose access points are spread over the channels like in the replay logs.
+        """
+        totals = np.zeros(wifi.NumChannels, dtype=np.float64)
+        for log in logs:
+            if len(log):
+                totals += log.records['aps_histogram'].sum(axis=0)[:wifi.NumChannels]
+
+        channels = {ch + 1: float(w) for ch, w in enumerate(totals) if w > 0}
+        return Model(num_aps, num_stations, channels=channels or None, **kwargs)
+
+    def _replace(self, gone):
+        num = int(gone.sum())
+        if num == 0:
+            return
+        self.ap_channel[gone] = self._rand.choice(self._channel_list, size=num, p=self._channel_weights)
+        self.ap_rssi[gone] = self._rand.integers(-95, -29, size=num)
+        self.ap_clients[gone] = self._rand.poisson(self._stations_per_ap, size=num)
+        self.ap_interactions[gone] = 0
+        self.ap_handshake[gone] = False
+
+    def _stale(self, num, ttl):
+        # how many of num went away during the last ttl seconds
+        return self._rand.binomial(num, 1.0 - np.exp(-self.churn * ttl))
+
+    def epoch(self, params, supported_channels, inactive_for=0):
+        """
+        Simulates one epoch with the given personality parameters and returns the epoch counters
+        and the mask of the access points that were visible during it.
+        """
+        channels = [ch for ch in params['channels'] if ch in supported_channels] or supported_channels
+
+        recon_time = params['recon_time']
+        if inactive_for >= params['max_inactive_scale']:
+            recon_time *= params['recon_inactive_multiplier']
+
+        # recon time is split among the channels being hopped on
+        on_channel = np.isin(self.ap_channel, channels)
+        seen_prob = 1.0 - np.exp(-(recon_time / len(channels)) / DISCOVERY_SECS)
+        visible = on_channel & (self.ap_rssi >= params['min_rssi']) & \
+                  (self._rand.random(len(self.ap_channel)) < seen_prob)
+
+        targets = visible & (self.ap_interactions < params['max_interactions']) & ~self.ap_handshake
+        num_targets = int(targets.sum())
+        clients = self.ap_clients[targets]
+        num_clients = int(clients.sum())
+
+        # listed but not there anymore
+        missed_aps = self._stale(num_targets, params['ap_ttl'])
+        missed_stations = self._stale(num_clients, params['sta_ttl'])
+
+        num_assocs = (num_targets - missed_aps) if params.get('associate', True) else 0
+        num_deauths = (num_clients - missed_stations) if params.get('deauth', True) else 0
+        num_missed = missed_aps + missed_stations
+
+        # an handshake per access point at most, either from a PMKID or from any of its stations
+        pmkid = self._rand.random(num_targets) < (self.pmkid_prob if num_assocs else 0.0)
+        full = self._rand.random(num_targets) < (1.0 - (1.0 - self.handshake_prob) ** clients if num_deauths else 0.0)
+        shakes = pmkid | full
+        self.ap_interactions[targets] += 1
+        self.ap_handshake[np.flatnonzero(targets)[shakes]] = True
+        num_shakes = int(shakes.sum())
+
+        # hop on every channel with targets, waiting longer where there were deauths
+        num_hops = len(np.unique(self.ap_channel[targets]))
+        deauthed = np.unique(self.ap_channel[targets][clients > 0])
+        waited = len(deauthed) * params['hop_recon_time'] + (num_hops - len(deauthed)) * params['min_recon_time']
+
+        duration = recon_time + waited + (num_assocs + num_deauths + num_missed) / self.attack_rate
+        self.now += duration
+
+        # access points coming and going while the epoch was running
+        self._replace(self._rand.random(len(self.ap_channel)) < 1.0 - np.exp(-self.churn * duration))
+
+        return {
+            'duration_secs': duration,
+            'missed_interactions': num_missed,
+            'num_hops': num_hops,
+            'num_deauths': num_deauths,
+            'num_associations': num_assocs,
+            'num_handshakes': num_shakes,
+        }, visible
+
+
+class Simulation(object):
+    """
+    Stands in for both the agent and its epoch, so that the regular gym Environment steps
+    over simulated epochs instead of waiting for real ones.
+    """
+
+    def __init__(self, config, model, supported_channels=None, epochs_per_episode=None):
+        self._model = model
+        self._supported_channels = supported_channels or \
+                                   [ch for ch in sorted(model.channels.keys()) if ch <= wifi.NumChannels]
+        self._epochs_per_episode = epochs_per_episode or config['ai']['epochs_per_episode']
+        self._reward = RewardFunction()
+        self._histograms = np.zeros((3, wifi.NumChannels), dtype=np.float32)
+        self._cursor = self._epochs_per_episode
+
+        self.params = dict(config['personality'])
+        self.epoch = 0
+        self.blind_for = 0
+        self.inactive_for = 0
+        self.active_for = 0
+
+    # agent
+
+    def supported_channels(self):
+        return self._supported_channels
+
+    def is_training(self):
+        return self._cursor < self._epochs_per_episode
+
+    def training_epochs(self):
+        return self._epochs_per_episode
+
+    def on_ai_policy(self, new_params):
+        self.params.update(new_params)
+
+    def on_ai_step(self):
+        pass
+
+    # epoch
+
+    def next(self):
+        data, visible = self._model.epoch(self.params, self._supported_channels, self.inactive_for)
+
+        if not visible.any():
+            self.blind_for += 1
+        else:
+            self.blind_for = 0
+
+        if data['num_deauths'] + data['num_associations'] + data['num_handshakes'] == 0:
+            self.inactive_for += 1
+            self.active_for = 0
+        else:
+            self.active_for += 1
+            self.inactive_for = 0
+
+        channels = self._model.ap_channel[visible] - 1
+        clients = self._model.ap_clients[visible]
+        aps_per_chan, sta_per_chan, _ = self._histograms
+        aps_per_chan[:] = np.bincount(channels, minlength=wifi.NumChannels)[:wifi.NumChannels]
+        sta_per_chan[:] = np.bincount(channels, weights=clients, minlength=wifi.NumChannels)[:wifi.NumChannels]
+        aps_per_chan /= len(channels) + 1e-10
+        sta_per_chan /= clients.sum() + 1e-10
+
+        data.update({
+            'epoch': self.epoch,
+            'aps_histogram': aps_per_chan,
+            'sta_histogram': sta_per_chan,
+            'peers_histogram': self._histograms[2],
+            'slept_for_secs': 0,
+            'blind_for_epochs': self.blind_for,
+            'inactive_for_epochs': self.inactive_for,
+            'active_for_epochs': self.active_for,
+            'num_peers': 0,
+        })
+        data['reward'] = self._reward(self.epoch + 1, data)
+        self.epoch += 1
+        return data
+
+    def wait_for_epoch_data(self, with_observation=True, timeout=None):
+        # the environment is reset at the end of every episode
+        if not self.is_training():
+            self._cursor = 0
+        else:
+            self._cursor += 1
+        return self.next()
+
+
+def make_model(config, world, seed=None, logs=None):
+    """
+    Creates a Model with the world arguments (num_aps, num_stations, churn, ...), spreading the
+    access points over the channels like in the replay logs if any.
+    """
+    kwargs = dict(world, attack_rate=config['main']['attacks']['rate'], seed=seed)
+    if logs:
+        return Model.from_replay(logs, **kwargs)
+    return Model(**kwargs)
+
+
+def make_env(config, world, seed=None, logs=None):
+    import pwnagotchi.ai.gym as wrappers
+
+    sim = Simulation(config, make_model(config, world, seed, logs))
+    return wrappers.Environment(sim, sim)
+
+
+def make_vec_env(config, world, num_envs=1, subprocess=False, seed=None, logs=None):
+    """
+    Returns num_envs simulated environments stepped together, in this process or in one process each.
+    """
+    from stable_baselines.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+    seed = seed if seed is not None else int(time.time())
+    factories = [functools.partial(make_env, config, world, seed + i, logs) for i in range(num_envs)]
+    return SubprocVecEnv(factories) if subprocess else DummyVecEnv(factories)
+
+
+def evaluate(config, world, steps, seed=None, logs=None):
+    """
+    Runs the static personality from the configuration for the given number of epochs.
+    """
+    model = make_model(config, world, seed, logs)
+    sim = Simulation(config, model)
+    rewards = np.empty(steps, dtype=np.float64)
+    shakes = 0
+    started = time.time()
+    for i in range(steps):
+        data = sim.next()
+        rewards[i] = data['reward']
+        shakes += data['num_handshakes']
+    elapsed = time.time() - started
+
+    # misses without any interaction blow the reward up, don't let a few epochs dominate the average
+    outliers = (rewards < reward.range[0]) | (rewards > reward.range[1])
+    return {
+        'epochs': steps,
+        'epochs_per_sec': steps / elapsed if elapsed else 0.0,
+        'avg_reward': float(np.clip(rewards, *reward.range).mean()),
+        'reward_outliers': int(outliers.sum()),
+        'handshakes': shakes,
+        'handshakes_per_hour': shakes / (model.now / 3600.0) if model.now else 0.0,
+    }
+
+
+def train(config, world, steps, eval_steps, num_envs=1, subprocess=False, seed=None, logs=None):
+    """
+    Trains a model with the ai.params of the configuration on the simulation, then runs it
+    for eval_steps epochs on every environment.
+    """
+    from stable_baselines import A2C
+    from stable_baselines.common.policies import MlpLstmPolicy
+
+    env = make_vec_env(config, world, num_envs, subprocess, seed, logs)
+    try:
+        model = A2C(MlpLstmPolicy, env, **config['ai']['params'])
+
+        started = time.time()
+        model.learn(total_timesteps=steps)
+        elapsed = time.time() - started
+
+        rewards = []
+        obs = env.reset()
+        state = None
+        for _ in range(eval_steps):
+            action, state = model.predict(obs, state=state)
+            obs, reward, _, _ = env.step(action)
+            rewards.append(reward)
+
+        return {
+            'steps': steps,
+            'steps_per_sec': steps / elapsed if elapsed else 0.0,
+            'avg_reward': float(np.mean(rewards)) if rewards else 0.0,
+        }
+    finally:
+        env.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate personalities and ai parameters on a simulated world.")
+
+    parser.add_argument('-C', '--config', action='store', dest='config', default=None,
+                        help='TOML configuration file, merged with the defaults.')
+    parser.add_argument('--aps', type=int, default=100, help='Number of access points.')
+    parser.add_argument('--stations', type=int, default=300, help='Number of client stations.')
+    parser.add_argument('--churn', type=float, default=0.001,
+                        help='Probability per second of an access point or station being replaced.')
+    parser.add_argument('--handshake-prob', type=float, default=0.2,
+                        help='Probability of a deauth yielding an handshake.')
+    parser.add_argument('--pmkid-prob', type=float, default=0.05,
+                        help='Probability of an association yielding a PMKID.')
+    parser.add_argument('--replay', nargs='*', default=None,
+                        help='Spread the access points over the channels like in these replay logs.')
+    parser.add_argument('--steps', type=int, default=0,
+                        help='Train the ai for this many steps, evaluate the static personality if 0.')
+    parser.add_argument('--eval-steps', dest='eval_steps', type=int, default=1000,
+                        help='Epochs to evaluate for.')
+    parser.add_argument('--envs', type=int, default=1, help='Number of parallel environments.')
+    parser.add_argument('--subprocess', action='store_true', default=False,
+                        help='Run every environment in its own process.')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed.')
+    parser.add_argument('--debug', dest="debug", action="store_true", default=False,
+                        help="Enable debug logs.")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="[%(asctime)s] [%(levelname)s] %(message)s")
+
+    with open(os.path.join(os.path.dirname(pwnagotchi.__file__), 'defaults.toml')) as fp:
+        config = toml.load(fp)
+
+    if args.config:
+        with open(args.config) as fp:
+            config = utils.merge_config(toml.load(fp), config)
+
+    logs = None
+    if args.replay:
+        from pwnagotchi.ai.offline import load_logs
+        _, logs = load_logs(args.replay)
+        if not logs:
+            logging.error("no replay logs found in %s", ', '.join(args.replay))
+            sys.exit(1)
+
+    world = {
+        'num_aps': args.aps,
+        'num_stations': args.stations,
+        'churn': args.churn,
+        'handshake_prob': args.handshake_prob,
+        'pmkid_prob': args.pmkid_prob
+    }
+
+    if args.steps > 0:
+        result = train(config, world, args.steps, args.eval_steps, args.envs, args.subprocess, args.seed, logs)
+    else:
+        result = evaluate(config, world, args.eval_steps, args.seed, logs)
+
+    for key, value in result.items():
+        print("%s: %s" % (key, value))
+
+
+if __name__ == '__main__':
+    main()
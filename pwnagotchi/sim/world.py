@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+
+from pwnagotchi.mesh.wifi import int_to_mac
+
+# 2.4GHz channels are way more crowded than 5GHz ones, and 1, 6 and 11 are the most used
+DEFAULT_CHANNELS = {
+    1: 20, 2: 2, 3: 2, 4: 2, 5: 2, 6: 20, 7: 2, 8: 2, 9: 2, 10: 2, 11: 20, 12: 1, 13: 1,
+    36: 3, 40: 3, 44: 3, 48: 3, 52: 1, 56: 1, 60: 1, 64: 1, 100: 1, 104: 1, 108: 1, 112: 1,
+    116: 1, 120: 1, 124: 1, 128: 1, 132: 1, 136: 1, 140: 1, 149: 2, 153: 2, 157: 2, 161: 2, 165: 1
+}
+
+ENCRYPTIONS = ('WPA2', 'WPA2', 'WPA2', 'WPA', 'WPA2 WPA3', 'OPEN')
+VENDORS = ('Apple', 'Samsung', 'TP-Link', 'Netgear', 'Huawei', 'Intel', 'Ubiquiti', 'Cisco', '')
+
+
+class World(object):
+    """
+    Synthetic radio environment: num_aps access points with num_stations client stations
+    spread over them, distributed on channels according to the channels weights.
+
+    Every second of simulated time each access point and station is replaced by a new one with
+    churn probability, every deauth of a station on a visible channel yields an handshake with
+    handshake_prob probability and every association yields a PMKID with pmkid_prob probability.
+    """
+
+    def __init__(self, num_aps=100, num_stations=300, channels=None, churn=0.001, handshake_prob=0.2,
+                 pmkid_prob=0.05, seed=None, handshakes_path=None, iface='mon0', max_events=2048):
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed)
+        self._next_mac = self._rand.randint(0x020000000000, 0x02ffff000000)
+        self._started = time.time()
+        self._last_tick = time.monotonic()
+
+        self.channels = channels or DEFAULT_CHANNELS
+        self.churn = churn
+        self.handshake_prob = handshake_prob
+        self.pmkid_prob = pmkid_prob
+        self.handshakes_path = handshakes_path
+        self.iface = iface
+        self.recon_channels = []
+        self.modules = {'wifi.recon': False, 'gps': False, 'events.stream': True, 'api.rest': True}
+        self.events = deque(maxlen=max_events)
+        self._events_seq = 0
+
+        self.aps = {}
+        self.stations = {}
+        for _ in range(num_aps):
+            self._new_ap()
+        macs = list(self.aps.keys())
+        for _ in range(num_stations):
+            self._new_station(self._rand.choice(macs) if macs else None)
+
+    def _mac(self):
+        self._next_mac += 1
+        return int_to_mac(self._next_mac)
+
+    def _new_ap(self):
+        ch = self._rand.choices(list(self.channels.keys()), weights=list(self.channels.values()))[0]
+        mac = self._mac()
+        self.aps[mac] = {
+            'mac': mac,
+            'hostname': 'net-%s' % mac[-5:].replace(':', ''),
+            'vendor': self._rand.choice(VENDORS),
+            'channel': ch,
+            'frequency': 2407 + ch * 5 if ch <= 13 else 5000 + ch * 5,
+            'rssi': self._rand.randint(-95, -30),
+            'encryption': self._rand.choice(ENCRYPTIONS),
+            'cipher': 'CCMP',
+            'authentication': 'PSK',
+            'clients': [],
+            'handshake': False,
+            'first_seen': self._started,
+            'last_seen': self._started
+        }
+        return mac
+
+    def _new_station(self, ap_mac=None):
+        if not self.aps:
+            return None
+        ap_mac = ap_mac or self._rand.choice(list(self.aps.keys()))
+        sta = {
+            'mac': self._mac(),
+            'vendor': self._rand.choice(VENDORS),
+            'rssi': self._rand.randint(-95, -30)
+        }
+        self.aps[ap_mac]['clients'].append(sta)
+        self.stations[sta['mac']] = ap_mac
+        return sta
+
+    def _drop_ap(self, mac):
+        ap = self.aps.pop(mac)
+        for sta in ap['clients']:
+            del self.stations[sta['mac']]
+        return len(ap['clients'])
+
+    def _event(self, tag, data):
+        self._events_seq += 1
+        self.events.append({
+            'tag': tag,
+            # unique even for events generated within the same microsecond
+            'time': '%.6f%03d' % (time.time(), self._events_seq % 1000),
+            'data': data
+        })
+
+    def tick(self):
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._last_tick
+            self._last_tick = now
+
+            prob = min(1.0, self.churn * elapsed)
+            if prob <= 0 or not self.aps:
+                return
+
+            num_gone = sum(1 for _ in range(len(self.aps)) if self._rand.random() < prob)
+            for mac in self._rand.sample(list(self.aps.keys()), num_gone):
+                clients = self._drop_ap(mac)
+                self._new_ap()
+                for _ in range(clients):
+                    self._new_station()
+
+            num_gone = sum(1 for _ in range(len(self.stations)) if self._rand.random() < prob)
+            for mac in self._rand.sample(list(self.stations.keys()), num_gone):
+                ap = self.aps[self.stations.pop(mac)]
+                ap['clients'] = [sta for sta in ap['clients'] if sta['mac'] != mac]
+                self._new_station()
+
+    def set_recon_channels(self, channels):
+        with self._lock:
+            self.recon_channels = list(channels)
+
+    def clear_events(self):
+        with self._lock:
+            self.events.clear()
+
+    def set_module(self, name, running):
+        with self._lock:
+            if running and self.modules.get(name, False):
+                raise Exception('%s already started' % name)
+            elif not running and not self.modules.get(name, False):
+                raise Exception('%s is not running' % name)
+            self.modules[name] = running
+
+    def _visible(self, ap):
+        return not self.recon_channels or ap['channel'] in self.recon_channels
+
+    def session_json(self):
+        self.tick()
+        with self._lock:
+            now = time.time()
+            aps = []
+            if self.modules['wifi.recon']:
+                for ap in self.aps.values():
+                    ap['last_seen'] = now
+                    aps.append(ap)
+
+            return json.dumps({
+                'started_at': self._started,
+                'interfaces': [{'name': self.iface, 'flags': ['UP']}, {'name': 'lo', 'flags': ['UP']}],
+                'modules': [{'name': name, 'running': running} for name, running in self.modules.items()],
+                'gps': {'Latitude': 0, 'Longitude': 0, 'Altitude': 0},
+                'wifi': {'aps': aps}
+            }).encode()
+
+    def events_json(self):
+        with self._lock:
+            return json.dumps(list(self.events)).encode()
+
+    def _capture(self, ap, sta_mac):
+        filename = '%s_%s.pcap' % (ap['hostname'], ap['mac'].replace(':', ''))
+        if self.handshakes_path is not None:
+            filename = os.path.join(self.handshakes_path, filename)
+            with open(filename, 'ab') as fp:
+                fp.write(b'\0')
+
+        ap['handshake'] = True
+        self._event('wifi.client.handshake', {
+            'file': filename,
+            'station': sta_mac,
+            'ap': ap['mac'],
+            'pmkid': sta_mac == ap['mac'],
+            'full': sta_mac != ap['mac']
+        })
+
+    def associate(self, bssid):
+        with self._lock:
+            ap = self.aps.get(bssid.lower())
+            if ap is None or not self._visible(ap):
+                raise ValueError('%s is an unknown BSSID or it is in the association skip list.' % bssid)
+            if self._rand.random() < self.pmkid_prob:
+                self._capture(ap, ap['mac'])
+
+    def deauth(self, mac):
+        with self._lock:
+            mac = mac.lower()
+            ap_mac = self.stations.get(mac)
+            if ap_mac is None:
+                raise ValueError('%s is an unknown BSSID or it is in the deauthentication skip list.' % mac)
+            ap = self.aps[ap_mac]
+            if self._visible(ap) and self._rand.random() < self.handshake_prob:
+                self._capture(ap, mac)
@@ -0,0 +1,163 @@
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+# upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# what is being timed
+PHASE = 'phase'
+BETTERCAP = 'bettercap'
+PLUGIN = 'plugin'
+UI = 'ui'
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        # the last bucket is for anything above BUCKETS[-1]
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, secs):
+        self.counts[bisect_left(BUCKETS, secs)] += 1
+        self.count += 1
+        self.total += secs
+        if secs > self.max:
+            self.max = secs
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n > 0:
+                # a bucket upper bound is an estimate, never report more than what we've seen
+                return min(BUCKETS[i], self.max) if i < len(BUCKETS) else self.max
+        return self.max
+
+    def copy(self):
+        h = Histogram()
+        h.merge(self)
+        return h
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_secs': self.total,
+            'max_secs': self.max
+        }
+
+    def data(self):
+        return {
+            'count': self.count,
+            'total_secs': self.total,
+            'avg_secs': self.total / self.count if self.count else 0.0,
+            'max_secs': self.max,
+            'p50_secs': self.quantile(0.5),
+            'p90_secs': self.quantile(0.9),
+            'p99_secs': self.quantile(0.99)
+        }
+
+
+class Timings(object):
+    """
+    Monotonic timings grouped by kind (agent loop phase, bettercap endpoint, plugin hook, ui) and name.
+
+    Every observation updates the histogram of the current epoch and the cumulative one, at the end
+    of the epoch rollover() moves the current histograms into a window of the last few epochs.
+    """
+
+    def __init__(self, window=10):
+        self._lock = threading.Lock()
+        self._current = {}
+        self._window = deque(maxlen=window)
+        self._totals = {}
+
+    def observe(self, kind, name, secs):
+        key = (kind, name)
+        with self._lock:
+            if key not in self._current:
+                self._current[key] = Histogram()
+            self._current[key].observe(secs)
+            if key not in self._totals:
+                self._totals[key] = Histogram()
+            self._totals[key].observe(secs)
+
+    @contextmanager
+    def timer(self, kind, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.monotonic() - started)
+
+    @staticmethod
+    def _group(histograms, data):
+        grouped = {}
+        for (kind, name), h in sorted(histograms.items()):
+            grouped.setdefault(kind, {})[name] = h.data() if data else h.summary()
+        return grouped
+
+    def rollover(self):
+        """
+        Closes the current epoch and returns how long was spent doing what during it.
+        """
+        with self._lock:
+            current, self._current = self._current, {}
+            self._window.append(current)
+        return Timings._group(current, data=False)
+
+    def rolling(self):
+        """
+        Returns the histograms of the last epochs in the window and of the current one.
+        """
+        merged = {}
+        with self._lock:
+            for epoch in list(self._window) + [self._current]:
+                for key, h in epoch.items():
+                    if key not in merged:
+                        merged[key] = Histogram()
+                    merged[key].merge(h)
+        return Timings._group(merged, data=True)
+
+    def totals(self):
+        with self._lock:
+            return {key: h.copy() for key, h in self._totals.items()}
+
+
+_timings = Timings()
+
+
+def observe(kind, name, secs):
+    _timings.observe(kind, name, secs)
+
+
+def timer(kind, name):
+    return _timings.timer(kind, name)
+
+
+def rollover():
+    return _timings.rollover()
+
+
+def rolling():
+    return _timings.rolling()
+
+
+def totals():
+    return _timings.totals()
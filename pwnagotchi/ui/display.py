@@ -3,6 +3,7 @@ import logging
 import threading
 
 import pwnagotchi.plugins as plugins
+import pwnagotchi.timing as timing
 import pwnagotchi.ui.hw as hw
 from pwnagotchi.ui.view import View
 
@@ -93,7 +94,8 @@ class Display(View):
         while True:
             self._canvas_next_event.wait()
             self._canvas_next_event.clear()
-            self._implementation.render(self._canvas_next)
+            with timing.timer(timing.UI, 'display'):
+                self._implementation.render(self._canvas_next)
 
     def _on_view_rendered(self, img):
         try:
@@ -6,8 +6,8 @@ import random
 from PIL import ImageDraw
 
 import pwnagotchi
-import pwnagotchi.utils as utils
 import pwnagotchi.plugins as plugins
+import pwnagotchi.timing as timing
 from pwnagotchi.voice import Voice
 
 import pwnagotchi.ui.web as web
@@ -153,8 +153,7 @@ class View(object):
         self.set('uptime', last_session.duration)
         self.set('channel', '-')
         self.set('aps', "%d" % last_session.associated)
-        self.set('shakes', '%d (%s)' % (last_session.handshakes, \
-                                        utils.total_unique_handshakes(self._config['bettercap']['handshakes'])))
+        self.set('shakes', '%d (%s)' % (last_session.handshakes, self._agent.handshake_catalog().total))
         self.set_closest_peer(last_session.last_peer, last_session.peers)
         self.update()
 
@@ -365,17 +364,18 @@ class View(object):
             state = self._state
             changes = state.changes(ignore=self._ignore_changes)
             if force or len(changes):
-                self._canvas = Image.new('1', (self._width, self._height), WHITE)
-                drawer = ImageDraw.Draw(self._canvas)
+                with timing.timer(timing.UI, 'render'):
+                    self._canvas = Image.new('1', (self._width, self._height), WHITE)
+                    drawer = ImageDraw.Draw(self._canvas)
 
-                plugins.on('ui_update', self)
+                    plugins.on('ui_update', self)
 
-                for key, lv in state.items():
-                    lv.draw(self._canvas, drawer)
+                    for key, lv in state.items():
+                        lv.draw(self._canvas, drawer)
 
-                web.update_frame(self._canvas)
+                    web.update_frame(self._canvas)
 
-                for cb in self._render_cbs:
-                    cb(self._canvas)
+                    for cb in self._render_cbs:
+                        cb(self._canvas)
 
                 self._state.reset()
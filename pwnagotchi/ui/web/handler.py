@@ -12,6 +12,9 @@ os.environ['WERKZEUG_RUN_MAIN'] = 'true'
 
 import pwnagotchi
 import pwnagotchi.grid as grid
+import pwnagotchi.log as log
+import pwnagotchi.timing as timing
+import pwnagotchi.metrics as metrics
 import pwnagotchi.ui.web as web
 from pwnagotchi import plugins
 
@@ -36,6 +39,11 @@ class Handler:
         self._app.add_url_rule('/shutdown', 'shutdown', self.with_auth(self.shutdown), methods=['POST'])
         self._app.add_url_rule('/reboot', 'reboot', self.with_auth(self.reboot), methods=['POST'])
         self._app.add_url_rule('/restart', 'restart', self.with_auth(self.restart), methods=['POST'])
+        self._app.add_url_rule('/channels', 'channels', self.with_auth(self.channels))
+        self._app.add_url_rule('/timings', 'timings', self.with_auth(self.timings))
+        self._app.add_url_rule('/sessions', 'sessions', self.with_auth(self.sessions))
+        self._app.add_url_rule('/logs', 'logs', self.with_auth(self.logs))
+        self._app.add_url_rule('/metrics', 'metrics', self.with_auth(self.metrics))
 
         # inbox
         self._app.add_url_rule('/inbox', 'inbox', self.with_auth(self.inbox))
@@ -222,6 +230,34 @@ class Handler:
         finally:
             _thread.start_new_thread(pwnagotchi.restart, (mode,))
 
+    # serve the state of the channel scheduler as json
+    def channels(self):
+        scheduler = self._agent.channel_scheduler()
+        return jsonify(scheduler.state() if scheduler is not None else {})
+
+    # serve the timing histograms of the last epochs as json
+    def timings(self):
+        return jsonify(timing.rolling())
+
+    # serve the last sessions and the totals of all of them as json
+    def sessions(self):
+        index = self._agent.session_index()
+        return jsonify({
+            'last': index.last(request.args.get('n', default=10, type=int)),
+            'totals': index.aggregate(request.args.get('since', default=None, type=float))
+        })
+
+    # serve the last log records kept in memory as json
+    def logs(self):
+        level = logging.getLevelName(request.args.get('level', default='DEBUG').upper())
+        records = log.recent(request.args.get('n', default=100, type=int),
+                             level if isinstance(level, int) else logging.NOTSET)
+        return jsonify([{'time': t, 'level': name, 'message': msg} for t, _, name, msg in records])
+
+    # serve the metrics in the prometheus text format
+    def metrics(self):
+        return Response(metrics.exposition(self._agent), mimetype=metrics.CONTENT_TYPE)
+
     # serve the PNG file with the display image
     def ui(self):
         with web.frame_lock:
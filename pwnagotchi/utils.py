@@ -44,6 +44,27 @@ def keys_to_str(data):
 
     return converted_dict
 
+
+def read_config(args):
+    """
+    Reads the defaults merged with the user configuration, without installing, migrating or
+    overwriting any file like load_config does, so that it's safe to call while running.
+    """
+    if os.path.exists(args.config):
+        defaults_file = args.config
+    else:
+        defaults_file = os.path.join(os.path.dirname(pwnagotchi.__file__), 'defaults.toml')
+
+    with open(defaults_file) as fp:
+        config = toml.load(fp)
+
+    if os.path.exists(args.user_config):
+        with open(args.user_config) as fp:
+            config = merge_config(toml.load(fp), config)
+
+    return config
+
+
 def load_config(args):
     default_config_path = os.path.dirname(args.config)
     if not os.path.exists(default_config_path):
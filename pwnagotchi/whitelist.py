@@ -0,0 +1,91 @@
+import re
+import threading
+
+# a full MAC address or a prefix of at least three octets, an OUI
+MAC_PREFIX_PARSER = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2}){2,5}:?$', re.IGNORECASE)
+
+
+class PrefixTrie(object):
+    def __init__(self, prefixes=()):
+        self._root = {}
+        self._end = object()
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix):
+        node = self._root
+        for c in prefix:
+            node = node.setdefault(c, {})
+        node[self._end] = True
+
+    def match(self, value):
+        """
+        Returns True if any of the prefixes is a prefix of value.
+        """
+        node = self._root
+        if self._end in node:
+            return True
+        for c in value:
+            node = node.get(c)
+            if node is None:
+                return False
+            if self._end in node:
+                return True
+        return False
+
+
+class Whitelist(object):
+    """
+    Decides which access points can be interacted with, given the main.whitelist entries and
+    the main.filter regular expression.
+
+    Whitelist entries are compiled into a set of hostnames and a prefix trie of full MAC addresses
+    and OUIs or longer prefixes, results are cached per BSSID until the next reload.
+    """
+
+    def __init__(self, entries=(), filter=None, cache_size=65536):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._cache_size = cache_size
+        self.reload(entries, filter)
+
+    def reload(self, entries, filter=None):
+        names = set()
+        macs = PrefixTrie()
+        for entry in entries:
+            # an entry is matched against the hostname in any case, like before
+            names.add(entry)
+            if MAC_PREFIX_PARSER.match(entry):
+                macs.add(entry.lower())
+
+        with self._lock:
+            self._names = names
+            self._macs = macs
+            self._filter = re.compile(filter) if filter else None
+            self._cache = {}
+
+    def _allowed(self, hostname, mac):
+        if hostname in self._names or self._macs.match(mac):
+            return False
+        return self._filter is None or \
+               self._filter.match(hostname) is not None or \
+               self._filter.match(mac) is not None
+
+    def allowed(self, ap):
+        """
+        Returns True if the access point is not whitelisted and matches the filter, if any.
+        """
+        mac = ap['mac'].lower()
+        hostname = ap['hostname']
+        # hidden networks might reveal their name later on
+        key = (mac, hostname)
+
+        with self._lock:
+            allowed = self._cache.get(key)
+            if allowed is None:
+                allowed = self._allowed(hostname, mac)
+                if len(self._cache) >= self._cache_size:
+                    self._cache = {}
+                self._cache[key] = allowed
+
+        return allowed
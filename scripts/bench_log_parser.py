@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import sys
+import os
+import re
+import gzip
+import time
+import random
+import shutil
+import tempfile
+import argparse
+from datetime import datetime
+
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '../'))
+
+from pwnagotchi.log import SessionParser, last_session_offset
+
+
+def generate(path, size, seed=0):
+    """
+    Writes a synthetic log of about size bytes, with a few sessions and the usual mix of lines.
+    """
+    rand = random.Random(seed)
+    now = time.mktime(datetime(2019, 10, 1).timetuple())
+    written = 0
+    epoch = 0
+
+    with open(path, 'wt') as fp:
+        def line(msg, level='INFO'):
+            nonlocal written
+            ts = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+            s = "[%s,%03d] [%s] %s\n" % (ts, rand.randint(0, 999), level, msg)
+            fp.write(s)
+            written += len(s)
+
+        while written < size:
+            if rand.random() < 0.0005:
+                line("connecting to http://127.0.0.1:8081/api ...")
+                epoch = 0
+
+            mac = "%02x:%02x:%02x:%02x:%02x:%02x" % tuple(rand.randint(0, 255) for _ in range(6))
+            r = rand.random()
+            if r < 0.3:
+                line("deauthing %s (Apple) from net-%d (%s Netgear) on channel %d, -%d dBm ..." % (
+                    mac, rand.randint(0, 500), mac, rand.randint(1, 13), rand.randint(30, 90)))
+            elif r < 0.5:
+                line("sending association frame to net-%d (%s Netgear) on channel %d [%d clients], -%d dBm..." % (
+                    rand.randint(0, 500), mac, rand.randint(1, 13), rand.randint(0, 5), rand.randint(30, 90)))
+            elif r < 0.52:
+                line("!!! captured new handshake on channel %d, -%d dBm: %s (Apple) -> %s [net-%d (Netgear)] !!!" % (
+                    rand.randint(1, 13), rand.randint(30, 90), mac, mac, rand.randint(0, 500)), level='WARNING')
+            elif r < 0.57:
+                line("[ai] --- training epoch %d/50 ---" % rand.randint(1, 50))
+            elif r < 0.62:
+                epoch += 1
+                line("[epoch %d] duration=00:00:%02d slept_for=00:00:05 blind=0 inactive=0 active=1 peers=0 "
+                     "tot_bond=0.00 avg_bond=0.00 hops=%d missed=0 deauths=3 assocs=2 handshakes=0 cpu=10%% "
+                     "mem=30%% temperature=50C reward=%f" % (epoch, rand.randint(0, 59), rand.randint(0, 13),
+                                                            rand.uniform(-0.5, 1.0)))
+            elif r < 0.6205:
+                line("detected unit unit%d@%064x (v1.4.0) on channel %d (-%d dBm) [sid:%s pwnd_tot:%d uptime:%d]" % (
+                    rand.randint(0, 10), rand.getrandbits(256), rand.randint(1, 13), rand.randint(30, 90),
+                    mac, rand.randint(0, 100), rand.randint(0, 1000)))
+            else:
+                line("waiting for %ds on channel %d ..." % (rand.randint(1, 30), rand.randint(1, 13)),
+                     level='DEBUG')
+
+            now += rand.random() * 0.5
+
+
+# the parser as it was before SessionParser, to compare against
+
+LEGACY_START_TOKEN = 'connecting to http'
+LEGACY_EPOCH_PARSER = re.compile(r'^.+\[epoch (\d+)\] (.+)')
+LEGACY_EPOCH_DATA_PARSER = re.compile(r'([a-z_]+)=([^\s]+)')
+LEGACY_PEER_PARSER = re.compile(
+    r'detected unit (.+)@(.+) \(v.+\) on channel \d+ \(([\d\-]+) dBm\) \[sid:(.+) pwnd_tot:(\d+) uptime:(\d+)\]')
+
+
+def legacy_read(path):
+    try:
+        from file_read_backwards import FileReadBackwards
+    except ImportError:
+        FileReadBackwards = None
+
+    lines = []
+    if FileReadBackwards is not None:
+        with FileReadBackwards(path, encoding="utf-8") as fp:
+            for line in fp:
+                line = line.strip()
+                if line != "" and line[0] != '[':
+                    continue
+                lines.append(line)
+                if LEGACY_START_TOKEN in line:
+                    break
+        lines.reverse()
+    else:
+        # close enough, reads the whole file forward
+        with open(path, 'rt') as fp:
+            for line in fp:
+                line = line.strip()
+                if LEGACY_START_TOKEN in line:
+                    lines = []
+                if line != "" and line[0] == '[':
+                    lines.append(line)
+    return lines
+
+
+def legacy_parse(lines):
+    stats = {'deauthed': 0, 'associated': 0, 'handshakes': 0, 'epochs': 0, 'train_epochs': 0, 'peers': 0,
+             'tot_reward': 0.0}
+    started_at = stopped_at = None
+    cache = {}
+
+    for line in lines:
+        parts = line.split(']')
+        if len(parts) < 2:
+            continue
+        try:
+            dt = parts[0].strip('[').split('.')[0].split(',')[0]
+            stopped_at = time.mktime(datetime.strptime(dt, '%Y-%m-%d %H:%M:%S').timetuple())
+            if started_at is None:
+                started_at = stopped_at
+            line = ']'.join(parts[1:])
+
+            if 'deauthing ' in line and line not in cache:
+                stats['deauthed'] += 1
+                cache[line] = 1
+            elif 'sending association frame to ' in line and line not in cache:
+                stats['associated'] += 1
+                cache[line] = 1
+            elif '!!! captured new handshake ' in line and line not in cache:
+                stats['handshakes'] += 1
+                cache[line] = 1
+            elif ' training epoch ' in line:
+                stats['train_epochs'] += 1
+            elif '[epoch ' in line:
+                stats['epochs'] += 1
+                m = LEGACY_EPOCH_PARSER.findall(line)
+                if m:
+                    for key, value in LEGACY_EPOCH_DATA_PARSER.findall(m[0][1]):
+                        if key == 'reward':
+                            stats['tot_reward'] += float(value)
+            elif 'detected unit ' in line:
+                m = LEGACY_PEER_PARSER.findall(line)
+                if m and m[0][1] not in cache:
+                    stats['peers'] += 1
+                    cache[m[0][1]] = 1
+        except Exception:
+            pass
+
+    stats['duration'] = (stopped_at - started_at) if started_at is not None else 0
+    return stats
+
+
+def timed(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the log parser against the legacy one.")
+    parser.add_argument('--size', help="Size in MB of the synthetic log.", type=float, default=10)
+    parser.add_argument('--repeat', help="How many times to run each parser, the best time is reported.",
+                        type=int, default=3)
+    parser.add_argument('--min-speedup', dest='min_speedup', type=float, default=0,
+                        help="Exit with an error if the full log parsing speedup is lower than this.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'pwnagotchi.log')
+        archive = os.path.join(folder, 'pwnagotchi.gz')
+        generate(path, int(args.size * 1024 * 1024), args.seed)
+        with open(path, 'rb') as src, gzip.open(archive, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        print("log: %.1fMB, archive: %.1fMB" % (os.path.getsize(path) / 1048576.0,
+                                                 os.path.getsize(archive) / 1048576.0))
+
+        # the whole file, as when indexing rotated logs
+        def legacy_full():
+            with open(path, 'rt') as fp:
+                return legacy_parse([line.strip() for line in fp])
+
+        def streaming_full():
+            p = SessionParser()
+            with open(path, 'rt') as fp:
+                for line in fp:
+                    p.feed(line)
+            return p
+
+        def streaming_gz():
+            p = SessionParser()
+            p.parse(archive)
+            return p
+
+        # just the last session, as LastSession does
+        def legacy_last():
+            return legacy_parse(legacy_read(path))
+
+        def streaming_last():
+            p = SessionParser()
+            p.parse(path, last_session_offset(path))
+            return p.stats()
+
+        legacy_full_t, _ = timed(legacy_full, args.repeat)
+        streaming_full_t, _ = timed(streaming_full, args.repeat)
+        streaming_gz_t, _ = timed(streaming_gz, args.repeat)
+        legacy_last_t, expected = timed(legacy_last, args.repeat)
+        streaming_last_t, got = timed(streaming_last, args.repeat)
+
+        for key in ('deauthed', 'associated', 'handshakes', 'epochs', 'train_epochs', 'peers', 'duration'):
+            if expected[key] != got[key]:
+                print("MISMATCH on %s: legacy=%s streaming=%s" % (key, expected[key], got[key]))
+                sys.exit(1)
+
+        speedup = legacy_full_t / streaming_full_t
+        print("full log:     legacy %.3fs, streaming %.3fs (%.1fx)" % (legacy_full_t, streaming_full_t, speedup))
+        print("full archive: streaming %.3fs" % streaming_gz_t)
+        print("last session: legacy %.3fs, streaming %.3fs (%.1fx)" % (legacy_last_t, streaming_last_t,
+                                                                       legacy_last_t / streaming_last_t))
+
+        if speedup < args.min_speedup:
+            print("speedup %.1fx is lower than %.1fx" % (speedup, args.min_speedup))
+            sys.exit(1)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
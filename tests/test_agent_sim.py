@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+import toml
+
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '../'))
+
+import pwnagotchi
+import pwnagotchi.agent as agent
+import pwnagotchi.ui.web as web
+from pwnagotchi.agent import Agent
+from pwnagotchi.identity import KeyPair
+from pwnagotchi.ui.display import Display
+from pwnagotchi.sim.world import World
+from pwnagotchi.sim.bettercap import Server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def generate_keys(path):
+    from Crypto.PublicKey import RSA
+
+    key = RSA.generate(2048)
+    with open(os.path.join(path, 'id_rsa'), 'wb') as fp:
+        fp.write(key.export_key('PEM'))
+    with open(os.path.join(path, 'id_rsa.pub'), 'wb') as fp:
+        fp.write(key.publickey().export_key('PEM'))
+
+
+class AgentSimulationTest(unittest.TestCase):
+    """
+    Boots the real agent against the bettercap simulator and runs a few epochs of the main loop.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        handshakes = os.path.join(self.folder, 'handshakes')
+        os.makedirs(handshakes)
+        generate_keys(self.folder)
+
+        with open(os.path.join(os.path.dirname(pwnagotchi.__file__), 'defaults.toml')) as fp:
+            config = toml.load(fp)
+
+        port = free_port()
+        config['main']['log']['path'] = os.path.join(self.folder, 'pwnagotchi.log')
+        config['main']['mon_start_cmd'] = ''
+        config['bettercap']['port'] = port
+        config['bettercap']['handshakes'] = handshakes
+        config['ai']['enabled'] = False
+        config['personality']['advertise'] = False
+        config['personality']['channels'] = [1, 6, 11]
+        config['personality']['recon_time'] = 1
+        config['personality']['hop_recon_time'] = 1
+        config['personality']['min_recon_time'] = 1
+        config['ui']['web']['enabled'] = False
+        config['ui']['display']['enabled'] = False
+
+        agent.RECOVERY_DATA_FILE = os.path.join(self.folder, 'recovery')
+        agent.RECOVERY_JOURNAL_FILE = os.path.join(self.folder, 'journal')
+        web.frame_path = os.path.join(self.folder, 'frame', 'pwnagotchi.png')
+
+        self.world = World(num_aps=30, num_stations=90, handshake_prob=0.5, seed=1, handshakes_path=handshakes,
+                           iface=config['main']['iface'])
+        self.server = Server(self.world, port=port, username=config['bettercap']['username'],
+                             password=config['bettercap']['password']).start()
+
+        # not running on the unit
+        if not os.path.exists('/sys/class/thermal/thermal_zone0/temp'):
+            patcher = mock.patch.object(pwnagotchi, 'temperature', return_value=50)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        display = Display(config=config, state={'name': 'pwnagotchi>'})
+        self.agent = Agent(view=display, config=config, keypair=KeyPair(path=self.folder, view=display))
+
+    def tearDown(self):
+        # the folder is about to be deleted
+        atexit.unregister(self.agent._session_summary.save)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_start_and_run_epochs(self):
+        self.agent.start()
+
+        for _ in range(3):
+            self.agent.recon()
+            for ch, aps in self.agent.get_access_points_by_channel():
+                self.agent.set_channel(ch)
+                self.agent.attack(aps)
+            self.agent.next_epoch()
+
+        # handshake events are picked up by the event poller thread
+        deadline = time.time() + 5
+        while self.agent.num_handshakes() == 0 and time.time() < deadline:
+            time.sleep(0.1)
+
+        self.assertEqual(self.agent.epoch_number(), 4)
+        self.assertGreater(self.agent.num_handshakes(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
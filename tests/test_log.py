@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import logging
+import tempfile
+import unittest
+
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '../'))
+
+from pwnagotchi.log import LogWriter, LogArchiver, RotatingLogHandler
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+class BufferedRotationTest(unittest.TestCase):
+    """
+    The log writer must batch the writes to the rotating log, not just to a plain file.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'pwnagotchi.log')
+
+    def tearDown(self):
+        self.writer.stop()
+        atexit.unregister(self.writer.stop)
+        self.handler.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start(self, max_bytes):
+        self.handler = RotatingLogHandler(self.path, max_bytes, LogArchiver(self.path, keep=10))
+        self.handler.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s"))
+        self.writer = LogWriter([self.handler], flush_interval=30)
+        self.writer.start()
+
+        logger = logging.getLogger('test-%s' % self.id())
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self.writer.handler())
+        return logger
+
+    def test_writes_are_batched(self):
+        logger = self.start(1024 * 1024)
+
+        for i in range(20):
+            logger.info("record %d", i)
+        time.sleep(0.5)
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+        # warnings are written right away, with everything before them
+        logger.warning("warning")
+        self.assertTrue(wait_for(lambda: os.path.getsize(self.path) > 0))
+        with open(self.path) as fp:
+            self.assertEqual(len(fp.readlines()), 21)
+
+    def test_rotates_on_size(self):
+        logger = self.start(2048)
+
+        for i in range(100):
+            logger.info("record with ünïcode %d", i)
+        self.writer.stop()
+
+        # every rotated log compressed
+        self.assertTrue(wait_for(lambda: not [name for name in os.listdir(self.folder)
+                                              if name.endswith('.log') and name != 'pwnagotchi.log']))
+        archives = [name for name in os.listdir(self.folder) if name.endswith('.gz')]
+        self.assertGreater(len(archives), 1)
+        self.assertLess(os.path.getsize(self.path), 2048)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+import numpy as np
+import toml
+
+sys.path.insert(0,
+                os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             '../'))
+
+import pwnagotchi
+import pwnagotchi.mesh.wifi as wifi
+import pwnagotchi.ai.checkpoint as checkpoint
+import pwnagotchi.ai.offline as offline
+from pwnagotchi.ai.replay import ReplayWriter, HISTOGRAMS, COUNTERS
+
+CHANNELS = [1, 6, 11]
+
+
+def has(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def record(path, num_epochs, policy_size, seed=0):
+    rng = np.random.RandomState(seed)
+    writer = ReplayWriter(path, CHANNELS)
+    for epoch in range(num_epochs):
+        state = {name: rng.rand(wifi.NumChannels).astype(np.float32) for name in HISTOGRAMS}
+        state['duration_secs'] = 30.0
+        state['slept_for_secs'] = 5.0
+        for name in COUNTERS:
+            state[name] = int(rng.randint(0, 5))
+        # no misses without interactions, as on the unit
+        state['missed_interactions'] = min(state['missed_interactions'],
+                                           state['num_deauths'] + state['num_associations'])
+        state['reward'] = 0.0
+        writer.append(state, rng.randint(0, 3, size=policy_size), epoch, True)
+    writer._fp.close()
+
+
+class OfflineTest(unittest.TestCase):
+    """
+    Replays a synthetic log through the offline trainer.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        with open(os.path.join(os.path.dirname(pwnagotchi.__file__), 'defaults.toml')) as fp:
+            self.config = toml.load(fp)
+        self.config['ai']['epochs_per_episode'] = 20
+        self.config['ai']['params']['n_steps'] = 8
+        self.config['ai']['params']['verbose'] = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_discount(self):
+        # bootstrapped from the last value, unless the episode is over
+        returns = offline.discount(np.array([1.0, 1.0, 1.0]), np.array([0.0, 0.0, 0.0]), 4.0, 0.5)
+        np.testing.assert_allclose(returns, [2.25, 2.5, 3.0])
+        returns = offline.discount(np.array([1.0, 1.0, 1.0]), np.array([0.0, 1.0, 0.0]), 4.0, 0.5)
+        np.testing.assert_allclose(returns, [1.5, 1.0, 3.0])
+
+    @unittest.skipUnless(has('gym'), "gym is not installed")
+    def test_lane_returns_recorded_actions(self):
+        record(self.folder, 10, 13 + len(CHANNELS))
+        _, logs = offline.load_logs([self.folder])
+        log = logs[0]
+        lane = offline.Lane(CHANNELS, offline.episodes(logs, 5))
+
+        obs = lane.reset()
+        self.assertEqual(obs.shape, lane.observation_space.shape)
+        for i in range(1, 6):
+            obs, reward, done, info = lane.step(lane.action_space.sample())
+            # the action the unit applied before living the i-th epoch, whatever the lane is stepped with
+            np.testing.assert_array_equal(info['action'], log.action(i))
+            self.assertEqual(done, i == 5)
+
+    @unittest.skipUnless(has('stable_baselines'), "stable_baselines is not installed")
+    def test_train(self):
+        record(self.folder, 200, 13 + len(CHANNELS))
+        output = os.path.join(self.folder, 'brain.nn')
+
+        self.assertTrue(offline.train(self.config, [self.folder], output, workers=2))
+        self.assertTrue(checkpoint.validate(output))
+
+        # loads in the single environment model the unit creates
+        from stable_baselines import A2C
+        from stable_baselines.common.policies import MlpLstmPolicy
+        from stable_baselines.common.vec_env import DummyVecEnv
+
+        _, logs = offline.load_logs([self.folder])
+        lane = offline.Lane(CHANNELS, offline.episodes(logs, 20))
+        model = A2C(MlpLstmPolicy, DummyVecEnv([lambda: lane]), **self.config['ai']['params'])
+        model.load_parameters(output)
+
+
+if __name__ == '__main__':
+    unittest.main()